@@ -8,14 +8,16 @@ OneForAll subdomain brute module
 :license: GNU General Public License v3.0, see LICENSE for more details.
 """
 import gc
-import json
 import time
+import tempfile
 
 import exrex
 import fire
 
 import export
 from common import utils
+from common import massdns
+from common import dnsbackend
 from config import settings
 from common.module import Module
 from modules import wildcard
@@ -144,12 +146,8 @@ def check_dict():
         exit(0)
 
 
-def gen_result_infos(items, infos, subdomains, appear_times, wc_ips, wc_ttl):
-    qname = items.get('name')[:-1]  # 去除最右边的`.`点号
-    reason = items.get('status')
-    resolver = items.get('resolver')
-    data = items.get('data')
-    answers = data.get('answers')
+def gen_result_infos(qname, resolver, records, infos, subdomains, appear_times,
+                     wc_ips, wc_ttl):
     info = dict()
     cnames = list()
     ips = list()
@@ -157,29 +155,20 @@ def gen_result_infos(items, infos, subdomains, appear_times, wc_ips, wc_ttl):
     cname_times = list()
     ttls = list()
     is_valid_flags = list()
-    have_a_record = False
-    for answer in answers:
-        if answer.get('type') != 'A':
-            continue
-        have_a_record = True
-        ttl = answer.get('ttl')
+    reason = None
+    for cname, ip, ttl in records:
         ttls.append(ttl)
-        name = answer.get('name')  # 去除最右边的`.`点号
-        cname = name[:-1].lower()  # 去除最右边的`.`点号
         cnames.append(cname)
         cname_num = appear_times.get(cname)
         cname_times.append(cname_num)
-        ip = answer.get('data')
         ips.append(ip)
         ip_num = appear_times.get(ip)
         ip_times.append(ip_num)
         isvalid, reason = wildcard.is_valid_subdomain(ip, ip_num, cname, cname_num, ttl, wc_ttl, wc_ips)
         logger.log('TRACE', f'{ip} effective: {isvalid} reason: {reason}')
         is_valid_flags.append(isvalid)
-    if not have_a_record:
-        logger.log('TRACE', f'All query result of {qname} no A record{answers}')
     # 为了优化内存 只添加有A记录且通过判断的子域到记录中
-    if have_a_record and all(is_valid_flags):
+    if all(is_valid_flags):
         info['resolve'] = 1
         info['reason'] = reason
         info['ttl'] = ttls
@@ -193,91 +182,79 @@ def gen_result_infos(items, infos, subdomains, appear_times, wc_ips, wc_ttl):
     return infos, subdomains
 
 
-def stat_appear_times(result_path):
-    logger.log('INFOR', f'Counting IP cname appear times')
-    times = dict()
-    logger.log('DEBUG', f'Reading {result_path}')
-    with open(result_path) as fd:
-        for line in fd:
-            line = line.strip()
-            try:
-                items = json.loads(line)
-            except Exception as e:
-                logger.log('ERROR', e.args)
-                logger.log('ERROR', f'Error parsing {result_path} '
-                                    f'line {line} Skip this line')
-                continue
-            status = items.get('status')
-            if status != 'NOERROR':
-                continue
-            data = items.get('data')
-            if 'answers' not in data:
-                continue
-            answers = data.get('answers')
-            for answer in answers:
-                if answer.get('type') == 'A':
-                    ip = answer.get('data')
-                    # 取值 如果是首次出现的IP集合 出现次数先赋值0
-                    value_one = times.setdefault(ip, 0)
-                    times[ip] = value_one + 1
-                    name = answer.get('data')
-                    cname = name[:-1].lower()  # 去除最右边的`.`点号
-                    # 取值 如果是首次出现的IP集合 出现次数先赋值0
-                    value_two = times.setdefault(cname, 0)
-                    times[cname] = value_two + 1
-                if answer.get('type') == 'CNAME':
-                    name = answer.get('data')
-                    cname = name[:-1].lower()  # 去除最右边的`.`点号
-                    # 取值 如果是首次出现的IP集合 出现次数先赋值0
-                    value_three = times.setdefault(cname, 0)
-                    times[cname] = value_three + 1
-    return times
-
-
-def deal_output(output_path, appear_times, wildcard_ips, wildcard_ttl):
+def save_output(output_path, lines):
+    """
+    Save the resolved results while passing them on
+
+    :param output_path: result path
+    :param lines: iterable of JSON lines
+    :return: generator of JSON lines
+    """
+    with open(output_path, 'w') as fd:
+        for line in lines:
+            fd.write(line)
+            yield line
+
+
+def spill_records(fd, qname, resolver, records):
+    """
+    Write an answer with A records compactly into the spill file
+    """
+    answer = ' '.join(f'{cname},{ip},{ttl}' for cname, ip, ttl in records)
+    fd.write(f'{qname}\t{resolver}\t{answer}\n')
+
+
+def read_records(fd):
+    """
+    Read back the answers written by spill_records
+
+    :return: generator of (qname, resolver, records)
+    """
+    fd.seek(0)
+    for line in fd:
+        qname, resolver, answer = line.rstrip('\n').split('\t')
+        records = list()
+        for record in answer.split(' '):
+            cname, ip, ttl = record.split(',')
+            records.append((cname, ip, int(ttl)))
+        yield qname, resolver, records
+
+
+def deal_output(lines, output_path, wildcard_ips, wildcard_ttl):
+    """
+    Parse the resolved results while they arrive and judge them
+
+    The IP and cname appear times are counted in the first pass while the
+    answers with A records are spilled to a temporary file, the wildcard
+    judgement reads them back afterwards because it needs the final times.
+
+    :param lines: iterable of JSON lines
+    :param output_path: path to save the results unless they are deleted anyway
+    :param list wildcard_ips: wildcard IPs
+    :param int wildcard_ttl: wildcard TTL
+    :return tuple: infos and valid subdomains
+    """
     logger.log('INFOR', f'Processing result')
+    if not settings.delete_massdns_result:
+        lines = save_output(output_path, lines)
+    appear_times = dict()  # IP和cname出现次数
     infos = dict()  # 用来记录所有域名有关信息
     subdomains = list()  # 用来保存所有通过有效性检查的子域
-    logger.log('DEBUG', f'Processing {output_path}')
-    with open(output_path) as fd:
-        for line in fd:
-            line = line.strip()
-            try:
-                items = json.loads(line)
-            except Exception as e:
-                logger.log('ERROR', e.args)
-                logger.log('ERROR', f'Error parsing {line} Skip this line')
-                continue
-            qname = items.get('name')[:-1]  # 去除最右边的`.`点号
-            status = items.get('status')
-            if status != 'NOERROR':
-                logger.log('TRACE', f'Found {qname}\'s result {status} '
-                                    f'while processing {line}')
+    settings.temp_save_dir.mkdir(parents=True, exist_ok=True)
+    # 为了优化内存 有A记录的解析结果暂存到临时文件而不是保留在内存中
+    with tempfile.TemporaryFile('w+', dir=settings.temp_save_dir) as fd:
+        for qname, resolver, records in massdns.parse(lines, appear_times):
+            if not records:
+                logger.log('TRACE', f'All query result of {qname} no A record')
                 continue
-            data = items.get('data')
-            if 'answers' not in data:
-                logger.log('TRACE', f'Processing {line}, {qname} no response')
-                continue
-            infos, subdomains = gen_result_infos(items, infos, subdomains,
-                                                 appear_times, wildcard_ips,
-                                                 wildcard_ttl)
+            spill_records(fd, qname, resolver, records)
+        for qname, resolver, records in read_records(fd):
+            infos, subdomains = gen_result_infos(qname, resolver, records, infos,
+                                                 subdomains, appear_times,
+                                                 wildcard_ips, wildcard_ttl)
     return infos, subdomains
 
 
-def save_brute_dict(dict_path, dict_set):
-    dict_data = '\n'.join(dict_set)
-    if not utils.save_to_file(dict_path, dict_data):
-        logger.log('FATAL', 'Saving dictionary error')
-        exit(1)
-
-
-def delete_file(dict_path, output_path):
-    if settings.delete_generated_dict:
-        dict_path.unlink()
-    if settings.delete_massdns_result:
-        output_path.unlink()
-
-
 class Brute(Module):
     """
     OneForAll subdomain brute module
@@ -408,11 +385,10 @@ class Brute(Module):
     def main(self, domain):
         start = time.time()
         logger.log('INFOR', f'Blasting {domain} ')
-        massdns_dir = settings.third_party_dir.joinpath('massdns')
         result_dir = settings.result_save_dir
         temp_dir = result_dir.joinpath('temp')
         utils.check_dir(temp_dir)
-        massdns_path = utils.get_massdns_path(massdns_dir)
+        backend = dnsbackend.get_backend()
         timestring = utils.get_timestring()
 
         wildcard_ips = list()  # 泛解析IP列表
@@ -428,24 +404,18 @@ class Brute(Module):
 
         dict_set = self.gen_brute_dict(domain)
 
-        dict_name = f'generated_subdomains_{domain}_{timestring}.txt'
-        dict_path = temp_dir.joinpath(dict_name)
-        save_brute_dict(dict_path, dict_set)
-        del dict_set
-        gc.collect()
-
         output_name = f'resolved_result_{domain}_{timestring}.json'
         output_path = temp_dir.joinpath(output_name)
         log_path = result_dir.joinpath('massdns.log')
         check_dict()
-        logger.log('INFOR', f'Running massdns to brute subdomains')
-        utils.call_massdns(massdns_path, dict_path, ns_path, output_path,
-                           log_path, quiet_mode=self.quite,
-                           concurrent_num=self.concurrent_num)
-        appear_times = stat_appear_times(output_path)
-        self.infos, self.subdomains = deal_output(output_path, appear_times,
+        logger.log('INFOR', f'Running {backend.name} to brute subdomains')
+        # 字典通过管道交给解析后端 解析结果一到达就解析统计 不再读写临时文件
+        lines = backend.iter_lines(dict_set, ns_path, log_path, quiet_mode=self.quite,
+                                   concurrent_num=self.concurrent_num)
+        self.infos, self.subdomains = deal_output(lines, output_path,
                                                   wildcard_ips, wildcard_ttl)
-        delete_file(dict_path, output_path)
+        del dict_set
+        gc.collect()
         end = time.time()
         self.elapse = round(end - start, 1)
         logger.log('ALERT', f'{self.source} module takes {self.elapse} seconds, '
@@ -500,4 +470,5 @@ class Brute(Module):
 
 
 if __name__ == '__main__':
+    settings.target_worker_count = 1  # 单独运行时不与其他进程平分DNS并发查询数
     fire.Fire(Brute)
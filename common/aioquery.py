@@ -0,0 +1,125 @@
+"""
+Asynchronous query base class
+"""
+
+import asyncio
+
+import requests
+
+from common import utils
+from common.query import Query
+from common.client import get_client
+from config.log import logger
+
+
+class AioQuery(Query):
+    """
+    AioQuery base class
+
+    Subclasses implement query() as a coroutine and await the request
+    methods, which go through the shared client of common.client.
+    """
+
+    def __init__(self):
+        Query.__init__(self)
+
+    async def wait_limiter(self):
+        """
+        Wait for the rate limiter of the source without blocking the event
+        loop, and wake up soon after the module is cancelled
+
+        :return bool: whether the module is cancelled
+        """
+        wait = self.limiter.reserve()
+        if wait:
+            logger.log('TRACE', f'{self.source} rate limiter waits {wait:.2f} seconds')
+        while wait > 0 and not self.cancel_token.cancelled:
+            await asyncio.sleep(min(wait, 0.5))
+            wait -= 0.5
+        return self.cancel_token.cancelled
+
+    async def request(self, method, url, check=True, ignore=False,
+                      raise_error=False, **kwargs):
+        """
+        Custom asynchronous request paced by the rate limiter of the source,
+        a request rejected with 429 is sent once more after the server's delay,
+        responses go through the same response cache as Module.send
+
+        :param str  method: request method
+        :param str  url: request url
+        :param bool check: check response
+        :param bool ignore: ignore error
+        :param bool raise_error: raise error or not
+        :param kwargs: other params
+        :return: response object
+        """
+        if self.is_cancelled(url):
+            return None
+        level = 'ERROR'
+        if ignore:
+            level = 'DEBUG'
+        key, resp = self.get_cached(method, url, kwargs)
+        if resp is None:
+            try:
+                for _ in range(2):
+                    if await self.wait_limiter():
+                        logger.log('DEBUG', f'{self.source} module is cancelled, '
+                                            f'skip requesting {url}')
+                        return None
+                    resp = await get_client().request(method, url,
+                                                      cookies=self.cookie,
+                                                      headers=self.header,
+                                                      proxies=self.proxy,
+                                                      timeout=self.timeout,
+                                                      verify=self.verify,
+                                                      **kwargs)
+                    if not self.limiter.update(resp):
+                        break
+            except Exception as e:
+                if raise_error:
+                    if isinstance(e, requests.exceptions.ConnectTimeout):
+                        logger.log(level, e.args[0])
+                        raise e
+                logger.log(level, e.args[0])
+                return None
+            self.save_cached(key, resp, kwargs.get('stream', False))
+        if not check:
+            return resp
+        if utils.check_response(method, resp):
+            return resp
+        return None
+
+    async def head(self, url, params=None, check=True, **kwargs):
+        return await self.request('HEAD', url, params=params, check=check, **kwargs)
+
+    async def get(self, url, params=None, check=True, ignore=False, raise_error=False,
+                  **kwargs):
+        return await self.request('GET', url, params=params, check=check, ignore=ignore,
+                                  raise_error=raise_error, **kwargs)
+
+    async def post(self, url, data=None, check=True, **kwargs):
+        return await self.request('POST', url, data=data, check=check, **kwargs)
+
+    async def delete(self, url, check=True, **kwargs):
+        return await self.request('DELETE', url, check=check, **kwargs)
+
+    async def arun(self):
+        """
+        Asynchronous class entrance
+        """
+        self.begin()
+        await self.query()
+        self.finish()
+        self.save_json()
+        self.gen_result()
+        self.save_db()
+
+    def run(self):
+        """
+        Synchronous class entrance running the coroutine on its own event loop
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.arun())
+        finally:
+            loop.close()
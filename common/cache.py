@@ -0,0 +1,265 @@
+"""
+On-disk TTL cache of the responses of collection sources
+"""
+
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import stream_decode_response_unicode
+
+from config import settings
+from config.log import logger
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ResponseCache(object):
+    """
+    Compressed responses kept in one SQLite file with least recently used eviction
+
+    Entries are keyed by the source and the prepared request, so a rerun of
+    the same target within the TTL of a source reads the response from disk
+    instead of requesting the source again.
+
+    :param path: path of the cache file
+    :param int max_size: max bytes of the compressed responses
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(f'PRAGMA busy_timeout={settings.database_busy_timeout}')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS response ('
+                          'key TEXT PRIMARY KEY, source TEXT, created REAL, '
+                          'accessed REAL, size INTEGER, meta TEXT, content BLOB)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS response_accessed '
+                          'ON response (accessed)')
+        self.conn.commit()
+        self.size = self.conn.execute('SELECT COALESCE(SUM(size), 0) '
+                                      'FROM response').fetchone()[0]
+        self.hits = dict()  # source -> hit count
+        self.misses = dict()  # source -> miss count
+
+    @staticmethod
+    def get_identity(headers, cookies):
+        """
+        Get the request headers and cookies which tell apart the responses
+
+        The fake headers sent with every request are left out so a random
+        user agent does not change the key, while credentials such as
+        Authorization headers, API key headers and cookies are kept.
+
+        :param dict headers: request headers
+        :param cookies: request cookies as a dict or a cookie jar
+        :return list: sorted (name, value) pairs
+        """
+        defaults = {name.lower(): value
+                    for name, value in settings.request_default_headers.items()}
+        identity = list()
+        for name, value in (headers or dict()).items():
+            name = name.lower()
+            if name in ('user-agent', 'accept-encoding') or defaults.get(name) == value:
+                continue
+            identity.append(('header', name, str(value)))
+        if cookies:
+            items = cookies.items() if hasattr(cookies, 'items') else cookies
+            for name, value in items:
+                identity.append(('cookie', str(name), str(value)))
+        return sorted(identity)
+
+    @staticmethod
+    def make_key(source, method, url, kwargs, headers=None, cookies=None):
+        """
+        Make the cache key of a request
+
+        :param str source: source name
+        :param str method: request method
+        :param str url: request url
+        :param dict kwargs: params, data and json of the request
+        :param dict headers: request headers (default None)
+        :param cookies: request cookies (default None)
+        :return str: cache key
+        """
+        request = requests.Request(method, url,
+                                   params=kwargs.get('params'),
+                                   data=kwargs.get('data'),
+                                   json=kwargs.get('json')).prepare()
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        digest = hashlib.sha1(body)
+        digest.update(f'{source} {method} {request.url}'.encode('utf-8'))
+        identity = ResponseCache.get_identity(headers, cookies)
+        digest.update(json.dumps(identity).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_ttl(source):
+        return settings.response_cache_ttls.get(source, settings.response_cache_ttl)
+
+    def count(self, counter, source):
+        counter[source] = counter.get(source, 0) + 1
+
+    def get(self, source, key):
+        """
+        Get the cached response
+
+        :param str source: source name
+        :param str key: cache key
+        :return: response object or None
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT created, meta, content FROM response '
+                                    'WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[0] > self.get_ttl(source):
+                self.count(self.misses, source)
+                return None
+            self.conn.execute('UPDATE response SET accessed = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.count(self.hits, source)
+        meta = json.loads(row[1])
+        resp = requests.Response()
+        resp.status_code = meta.get('status')
+        resp.reason = meta.get('reason')
+        resp.url = meta.get('url')
+        resp.encoding = meta.get('encoding')
+        resp.headers = CaseInsensitiveDict(meta.get('headers'))
+        resp._content = zlib.decompress(row[2])
+        resp._content_consumed = True
+        logger.log('TRACE', f'{source} response of {resp.url} is read from cache')
+        return resp
+
+    def put(self, source, key, resp):
+        """
+        Cache a response and evict the least recently used ones over the size
+
+        :param str source: source name
+        :param str key: cache key
+        :param resp: response object
+        """
+        content = zlib.compress(resp.content, settings.response_cache_compress_level)
+        self.save(source, key, resp, content)
+
+    def record(self, source, key, resp):
+        """
+        Cache a streamed response once its body has been read to the end
+
+        The body is compressed chunk by chunk while the caller reads it, and
+        is given up when it grows beyond the max size.
+
+        :param str source: source name
+        :param str key: cache key
+        :param resp: response object requested with stream=True
+        """
+        iter_content = resp.iter_content
+
+        def iter_recorded(chunk_size=1, decode_unicode=False):
+            chunks = self.iter_record(source, key, resp, iter_content(chunk_size))
+            if decode_unicode:
+                return stream_decode_response_unicode(chunks, resp)
+            return chunks
+
+        resp.iter_content = iter_recorded
+
+    def iter_record(self, source, key, resp, chunks):
+        compressor = zlib.compressobj(settings.response_cache_compress_level)
+        parts = list()
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                part = compressor.compress(chunk)
+                size += len(part)
+                parts.append(part)
+                if size > self.max_size:
+                    parts = None  # 超出缓存大小 不再缓存
+            yield chunk
+        if parts is not None:
+            parts.append(compressor.flush())
+            self.save(source, key, resp, b''.join(parts))
+
+    def save(self, source, key, resp, content):
+        """
+        Save a compressed response body with the response meta
+        """
+        meta = json.dumps({'status': resp.status_code, 'reason': resp.reason,
+                           'url': resp.url, 'encoding': resp.encoding,
+                           'headers': dict(resp.headers)})
+        size = len(content) + len(meta)
+        if size > self.max_size:
+            return
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM response WHERE key = ?',
+                                    (key,)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.conn.execute('INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (key, source, now, now, size, meta, content))
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        """
+        Delete the least recently used responses until 90% of the max size,
+        the caller holds the lock
+        """
+        target = self.max_size * 0.9
+        rows = self.conn.execute('SELECT key, size FROM response ORDER BY accessed')
+        keys = list()
+        for key, size in rows:
+            if self.size <= target:
+                break
+            keys.append((key,))
+            self.size -= size
+        self.conn.executemany('DELETE FROM response WHERE key = ?', keys)
+        logger.log('DEBUG', f'Evicted {len(keys)} cached responses')
+
+    def report(self):
+        """
+        Log the hit rates of the sources in this run
+        """
+        sources = sorted(set(self.hits) | set(self.misses))
+        total_hits = sum(self.hits.values())
+        total = total_hits + sum(self.misses.values())
+        if not total:
+            return
+        for source in sources:
+            hits = self.hits.get(source, 0)
+            count = hits + self.misses.get(source, 0)
+            logger.log('DEBUG', f'{source} response cache hit rate {hits}/{count}')
+        rate = round(total_hits / total * 100, 1)
+        logger.log('INFOR', f'Response cache hit rate {rate}% ({total_hits}/{total}), '
+                            f'cache size {round(self.size / 1024 / 1024, 1)} MB')
+
+
+def get_response_cache():
+    """
+    Get the process-wide ResponseCache
+
+    :return: ResponseCache object or None when the cache is disabled
+    """
+    global _cache
+    if not settings.enable_response_cache:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            settings.result_save_dir.mkdir(parents=True, exist_ok=True)
+            path = settings.result_save_dir.joinpath('response_cache.sqlite3')
+            max_size = settings.response_cache_max_size * 1024 * 1024
+            _cache = ResponseCache(path, max_size)
+    return _cache
@@ -0,0 +1,68 @@
+"""
+Cooperative cancellation tokens of the collection modules
+"""
+
+import threading
+
+_local = threading.local()
+
+
+class CancelToken(object):
+    """
+    Token telling a module that its time budget is used up
+
+    Modules observe the token in their request and sleep loops, and fence()
+    lets a module publish its results only while the token is not cancelled.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """
+        Cancel the token after any result publishing in progress has finished
+        """
+        with self.lock:
+            self.event.set()
+
+    def sleep(self, seconds):
+        """
+        Sleep unless the token gets cancelled
+
+        :param float seconds: seconds to sleep
+        :return bool: whether the token is cancelled
+        """
+        return self.event.wait(seconds)
+
+    def fence(self):
+        """
+        Lock held while publishing results, see cancel()
+        """
+        return self.lock
+
+
+def set_token(token):
+    """
+    Set the token of the current thread
+
+    :param token: CancelToken object
+    """
+    _local.token = token
+
+
+def get_token():
+    """
+    Get the token of the current thread, threads without one get a new token
+    which is never cancelled
+
+    :return: CancelToken object
+    """
+    token = getattr(_local, 'token', None)
+    if token is None:
+        token = CancelToken()
+    return token
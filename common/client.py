@@ -0,0 +1,233 @@
+"""
+HTTP clients shared by the collection modules
+"""
+
+import time
+import asyncio
+import threading
+from functools import partial
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import settings
+from config.log import logger
+
+_client = None
+_client_lock = threading.Lock()
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+
+class SessionPool(object):
+    """
+    Thread-safe registry of keep-alive sessions keyed by (scheme, host, proxy)
+
+    Every session keeps its own connection pool, so the pages of one source
+    reuse the TCP and TLS connections. Sessions never store response cookies
+    so that modules cannot leak cookies into each other, and sessions unused
+    for idle_timeout seconds are closed.
+
+    :param int pool_size: max connections kept per session
+    :param int retries: retry count of connection errors and 502/503/504 responses
+    :param float idle_timeout: seconds after which an unused session is closed
+    """
+
+    def __init__(self, pool_size, retries, idle_timeout):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.idle_timeout = idle_timeout
+        self.sessions = dict()  # (scheme, host, proxy) -> session
+        self.last_used = dict()  # (scheme, host, proxy) -> timestamp
+        self.last_evict = time.time()
+        self.closed_connections = 0  # 已关闭会话新建的连接数
+        self.closed_requests = 0  # 已关闭会话发出的请求数
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(url, proxies=None):
+        parts = urlparse(url)
+        scheme = parts.scheme.lower()
+        proxy = None
+        if proxies:
+            proxy = proxies.get(scheme) or proxies.get('all')
+        return scheme, parts.netloc.lower(), proxy
+
+    def new_session(self):
+        session = requests.Session()
+        session.trust_env = False
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=list()))
+        # Retry-After和429响应交给数据源的限速器处理
+        retry = Retry(total=self.retries, backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504), raise_on_status=False,
+                      respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                              max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, url, proxies=None):
+        """
+        Get the session of the url
+
+        :param str url: request url
+        :param dict proxies: request proxies
+        :return: requests.Session object
+        """
+        key = self.get_key(url, proxies)
+        now = time.time()
+        with self.lock:
+            if now - self.last_evict >= self.idle_timeout:
+                self.evict(now)
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.new_session()
+                self.sessions[key] = session
+            self.last_used[key] = now
+        return session
+
+    def evict(self, now):
+        """
+        Close sessions which are idle for too long, the caller holds the lock
+        """
+        self.last_evict = now
+        for key, last_used in list(self.last_used.items()):
+            if now - last_used < self.idle_timeout:
+                continue
+            session = self.sessions.pop(key)
+            self.last_used.pop(key)
+            connections, requests_count = count_connections(session)
+            self.closed_connections += connections
+            self.closed_requests += requests_count
+            session.close()
+            logger.log('TRACE', f'Closed idle session of {key}')
+
+    def get_stats(self):
+        """
+        Count the new and reused connections of all sessions
+
+        :return dict: numbers of new and reused connections
+        """
+        with self.lock:
+            connections = self.closed_connections
+            requests_count = self.closed_requests
+            for session in self.sessions.values():
+                new, count = count_connections(session)
+                connections += new
+                requests_count += count
+        return {'new': connections, 'reused': max(0, requests_count - connections)}
+
+
+def count_connections(session):
+    """
+    Count the connections and requests of the connection pools of a session
+
+    :param session: requests.Session object
+    :return tuple: numbers of connections and requests
+    """
+    connections = 0
+    requests_count = 0
+    for adapter in set(session.adapters.values()):
+        managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+        for manager in managers:
+            for key in manager.pools.keys():
+                try:
+                    pool = manager.pools[key]
+                except KeyError:
+                    continue
+                connections += pool.num_connections
+                requests_count += pool.num_requests
+    return connections, requests_count
+
+
+def get_session_pool():
+    """
+    Get the process-wide SessionPool
+
+    :return: SessionPool object
+    """
+    global _session_pool
+    if _session_pool is not None:
+        return _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool(settings.session_pool_size,
+                                        settings.session_retry_count,
+                                        settings.session_idle_timeout)
+    return _session_pool
+
+
+def get_session(url, proxies=None):
+    """
+    Get the pooled keep-alive session of the url
+
+    :param str url: request url
+    :param dict proxies: request proxies
+    :return: requests.Session object
+    """
+    return get_session_pool().get(url, proxies)
+
+
+def get_connection_stats():
+    """
+    Get the numbers of new and reused connections of the pooled sessions
+
+    :return dict: numbers of new and reused connections
+    """
+    return get_session_pool().get_stats()
+
+
+class AsyncClient(object):
+    """
+    Pooled sessions awaited from coroutines
+
+    The blocking requests run on a bounded thread pool, so coroutines of all
+    modules share the keep-alive connections of the pooled sessions instead
+    of each request opening a new one.
+
+    :param int pool_size: number of worker threads
+    """
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self.executor = ThreadPoolExecutor(max_workers=pool_size,
+                                           thread_name_prefix='AsyncClient')
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request without blocking the event loop
+
+        :param str method: request method
+        :param str url: request url
+        :param kwargs: other params of requests.Session.request
+        :return: response object
+        """
+        loop = asyncio.get_event_loop()
+        session = get_session(url, kwargs.get('proxies'))
+        func = partial(session.request, method, url, **kwargs)
+        return await loop.run_in_executor(self.executor, func)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def get_client():
+    """
+    Get the process-wide AsyncClient
+
+    :return: AsyncClient object
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            pool_size = settings.async_client_pool_size
+            logger.log('DEBUG', f'Creating async client with pool size {pool_size}')
+            _client = AsyncClient(pool_size)
+    return _client
@@ -2,15 +2,55 @@
 SQLite database initialization and operation
 """
 
+import atexit
+import threading
+from queue import Queue, Empty
+
+from sqlalchemy import event
+
 from common import records
 
 from common.records import Connection
+from common.result import to_dicts
 from config.log import logger
 from config import settings
 
+_databases = dict()  # 数据库路径 -> records.Database 进程内复用同一个引擎
+_databases_lock = threading.Lock()
+
+
+def set_sqlite_pragma(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    # 多进程并行处理目标时等待其他进程的写事务而不是直接报错
+    cursor.execute(f'PRAGMA busy_timeout={settings.database_busy_timeout}')
+    cursor.close()
+
+
+def get_database(db_url):
+    """
+    Get the long-lived records.Database of the url
+
+    :param str db_url: database url
+    :return: records.Database object
+    """
+    db = _databases.get(db_url)
+    if db is not None:
+        return db
+    with _databases_lock:
+        db = _databases.get(db_url)
+        if db is None:
+            db = records.Database(db_url)  # 不存在数据库时会新建一个数据库
+            event.listen(db._engine, 'connect', set_sqlite_pragma)
+            _databases[db_url] = db
+    return db
+
 
 class Database(object):
     def __init__(self, db_path=None):
+        if db_path is None:
+            writer.wait()  # 读写默认数据库前确保已提交的写入任务完成
         self.conn = self.get_conn(db_path)
 
     @staticmethod
@@ -29,7 +69,7 @@ class Database(object):
             db_path = f'{protocol}{settings.result_save_dir}/result.sqlite3'
         else:
             db_path = f'{protocol}{db_path}'
-        db = records.Database(db_path)  # 不存在数据库时会新建一个数据库
+        db = get_database(db_path)
         logger.log('TRACE', f'Use the database: {db_path}')
         return db.get_connection()
 
@@ -55,6 +95,7 @@ class Database(object):
         table_name = table_name.replace('.', '_')
         if self.exist_table(table_name):
             logger.log('TRACE', f'{table_name} table already exists')
+            self.create_index(table_name)
             return
         logger.log('TRACE', f'Creating {table_name} table')
         self.query(f'create table "{table_name}" ('
@@ -90,6 +131,19 @@ class Database(object):
                    f'source text,'
                    f'elapse float,'
                    f'find int)')
+        self.create_index(table_name)
+
+    def create_index(self, table_name):
+        """
+        Create indexes on the url and subdomain columns of the table
+
+        :param str table_name: table name
+        """
+        table_name = table_name.replace('.', '_')
+        logger.log('TRACE', f'Creating indexes of {table_name} table')
+        for column in ('url', 'subdomain'):
+            self.query(f'create index if not exists "{table_name}_{column}_index" '
+                       f'on "{table_name}" ({column})')
 
     def insert_table(self, table_name, result):
         table_name = table_name.replace('.', '_')
@@ -115,22 +169,32 @@ class Database(object):
         """
         logger.log('TRACE', f'Saving the subdomain results of {table_name} '
                             f'found by module {module_name} into database')
+        try:
+            self.insert_rows(table_name, results)
+        except Exception as e:
+            logger.log('ERROR', e)
+
+    def insert_rows(self, table_name, results):
+        """
+        Insert the results into the table, errors are raised to the caller
+
+        :param str table_name: table name
+        :param list results: results list
+        """
         table_name = table_name.replace('.', '_')
-        if results:
-            try:
-                self.conn.bulk_query(
-                    f'insert into "{table_name}" '
-                    f'(id, alive, resolve, request, url, subdomain, port, level, '
-                    f'cname, ip, public, cdn, status, reason, title, banner, header, '
-                    f'history, response, ip_times, cname_times, ttl, cidr, asn, org, '
-                    f'addr, isp, resolver, module, source, elapse, find) '
-                    f'values (:id, :alive, :resolve, :request, :url, '
-                    f':subdomain, :port, :level, :cname, :ip, :public, :cdn,'
-                    f':status, :reason, :title, :banner, :header, :history, :response, '
-                    f':ip_times, :cname_times, :ttl, :cidr, :asn, :org, :addr, :isp, '
-                    f':resolver, :module, :source, :elapse, :find)', results)
-            except Exception as e:
-                logger.log('ERROR', e)
+        if not results:
+            return
+        self.conn.bulk_query(
+            f'insert into "{table_name}" '
+            f'(id, alive, resolve, request, url, subdomain, port, level, '
+            f'cname, ip, public, cdn, status, reason, title, banner, header, '
+            f'history, response, ip_times, cname_times, ttl, cidr, asn, org, '
+            f'addr, isp, resolver, module, source, elapse, find) '
+            f'values (:id, :alive, :resolve, :request, :url, '
+            f':subdomain, :port, :level, :cname, :ip, :public, :cdn,'
+            f':status, :reason, :title, :banner, :header, :history, :response, '
+            f':ip_times, :cname_times, :ttl, :cidr, :asn, :org, :addr, :isp, '
+            f':resolver, :module, :source, :elapse, :find)', to_dicts(results))
 
     def exist_table(self, table_name):
         """
@@ -262,6 +326,18 @@ class Database(object):
         logger.log('TRACE', f'Get response data from {url}')
         return self.query(sql).scalar()
 
+    def iter_resp_data(self, table_name):
+        """
+        Iterate over the url, history and response of the table in one pass
+
+        :param str table_name: table name
+        :return: generator of (url, history, response) tuples
+        """
+        table_name = table_name.replace('.', '_')
+        sql = f'select url, history, response from "{table_name}"'
+        logger.log('TRACE', f'Iterate response data from {table_name} table')
+        return self.conn.iter_query(sql)
+
     def get_data_by_fields(self, table_name, fields):
         table_name = table_name.replace('.', '_')
         field_str = ', '.join(fields)
@@ -275,8 +351,159 @@ class Database(object):
         sql = f'update "{table_name}" set {field_str} where url = "{url}"'
         return self.query(sql)
 
+    def bulk_update(self, table_name, key, rows):
+        """
+        Update rows in bulk with a parameterized statement in one transaction
+
+        :param str table_name: table name
+        :param str key: indexed column used to locate rows
+        :param list rows: dicts holding the key and the fields to be updated
+        """
+        try:
+            with self.conn.transaction():
+                self.update_rows(table_name, key, rows)
+        except Exception as e:
+            logger.log('ERROR', e.args)
+
+    def update_rows(self, table_name, key, rows):
+        """
+        Update rows in bulk in the current transaction, errors are raised to
+        the caller
+
+        :param str table_name: table name
+        :param str key: indexed column used to locate rows
+        :param list rows: dicts holding the key and the fields to be updated
+        """
+        table_name = table_name.replace('.', '_')
+        if not rows:
+            return
+        fields = [field for field in rows[0].keys() if field != key]
+        field_str = ', '.join(map(lambda field: f'{field} = :{field}', fields))
+        sql = f'update "{table_name}" set {field_str} where {key} = :{key}'
+        logger.log('TRACE', f'Updating {len(rows)} rows of {table_name} table by {key}')
+        self.conn.bulk_query(sql, rows)
+
     def close(self):
         """
         Close the database connection
         """
         self.conn.close()
+
+
+class Writer(object):
+    """
+    Single writer thread of the default database
+
+    Modules submit row batches to a queue, a dedicated thread drains the
+    queue over one long-lived connection and commits many batches in one
+    transaction.
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batch_size = settings.database_writer_batch_size
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='DatabaseWriter',
+                                           daemon=True)
+            self.thread.start()
+            atexit.register(self.wait)
+
+    def submit(self, operation, table_name, rows, *args):
+        if not rows:
+            return
+        self.start()
+        self.queue.put((operation, table_name, rows, args))
+
+    def insert(self, table_name, rows, module_name=None):
+        """
+        Submit rows to be inserted into the table
+
+        :param str table_name: table name
+        :param list rows: rows to be inserted
+        :param str module_name: module name
+        """
+        self.submit('insert', table_name, rows, module_name)
+
+    def update(self, table_name, key, rows):
+        """
+        Submit rows to be updated by the key column
+
+        :param str table_name: table name
+        :param str key: indexed column used to locate rows
+        :param list rows: rows to be updated
+        """
+        self.submit('update', table_name, rows, key)
+
+    def wait(self):
+        """
+        Block until all submitted tasks are committed
+
+        Raises RuntimeError when the writer thread died with tasks left.
+        """
+        if self.thread is None or threading.current_thread() is self.thread:
+            return
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                if not self.thread.is_alive():
+                    raise RuntimeError(f'Database writer thread died with '
+                                       f'{self.queue.unfinished_tasks} write tasks left')
+                self.queue.all_tasks_done.wait(1)
+
+    def get_tasks(self):
+        tasks = [self.queue.get()]
+        while len(tasks) < self.batch_size:
+            try:
+                tasks.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return tasks
+
+    @staticmethod
+    def execute(db, task):
+        operation, table_name, rows, args = task
+        if operation == 'insert':
+            db.create_table(table_name)
+            db.insert_rows(table_name, rows)
+        elif operation == 'update':
+            db.update_rows(table_name, args[0], rows)
+
+    def commit(self, db, tasks):
+        """
+        Commit the tasks in one transaction, after a failure retry them one
+        by one so only the failing tasks are lost
+        """
+        try:
+            with db.conn.transaction():
+                for task in tasks:
+                    self.execute(db, task)
+            return
+        except Exception as e:
+            if len(tasks) == 1:
+                logger.log('ERROR', e.args)
+                logger.log('ERROR', 'Failed to commit a write task, its rows are lost')
+                return
+            logger.log('DEBUG', f'Failed to commit {len(tasks)} write tasks at once, '
+                                f'retrying them one by one: {e.args}')
+        for task in tasks:
+            self.commit(db, [task])
+
+    def run(self):
+        db = Database()
+        while True:
+            tasks = self.get_tasks()
+            try:
+                self.commit(db, tasks)
+            finally:
+                for _ in tasks:
+                    self.queue.task_done()
+
+
+writer = Writer()
@@ -0,0 +1,195 @@
+"""
+Pluggable DNS resolution backends of the resolve and brute stages
+"""
+
+import os
+import abc
+import json
+import threading
+from queue import Queue
+from collections import deque
+from itertools import chain
+
+from common import utils
+from common.dnscache import get_dns_cache
+from common.dnsengine import DNSEngine, read_nameservers
+from common.nspool import get_resolver_pool, to_address
+from config import settings
+from config.log import logger
+
+
+def get_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Backend(abc.ABC):
+    """
+    Resolution backend base class
+
+    A backend resolves an iterable of names and yields the answers as
+    massdns JSON lines while it is still resolving, so consumers can process
+    the answers as they arrive. Names with a fresh answer in the DNS cache
+    are answered from the cache and only the others are sent out.
+    """
+    name = None
+
+    def iter_lines(self, names, ns_path, log_path, query_type='A',
+                   concurrent_num=10000, quiet_mode=False):
+        """
+        Resolve the names
+
+        :param names: iterable of names to be resolved
+        :param ns_path: nameservers file
+        :param log_path: error log file
+        :param str query_type: query type
+        :param int concurrent_num: max concurrent queries
+        :param bool quiet_mode: hide the progress
+        :return: generator of JSON lines
+        """
+        cache = get_dns_cache() if query_type == 'A' else None
+        if str(ns_path) == str(settings.authoritative_dns_path):
+            cache = None  # 泛解析域名使用权威名称服务器查询 不使用公共名称服务器的缓存应答
+        cached = deque()  # 缓存中的应答 由发送查询名称的线程逐块写入
+        hits = 0
+        if cache is not None:
+            names = cache.iter_stale(names, cached)
+            first = next(names, None)
+            if first is None:
+                logger.log('INFOR', f'Got all {len(cached)} answers from the DNS cache')
+                yield from cached
+                return
+            names = chain([first], names)
+        pool = get_resolver_pool()
+        offset = get_size(log_path)
+        try:
+            for line in self.query_lines(names, ns_path, log_path, query_type,
+                                         concurrent_num, quiet_mode, cache is not None):
+                if cache is not None:
+                    cache.put(line)
+                if pool is not None:
+                    pool.record(line)
+                yield line
+                while cached:
+                    hits += 1
+                    yield cached.popleft()
+            while cached:
+                hits += 1
+                yield cached.popleft()
+        finally:
+            if cache is not None:
+                cache.flush()
+                logger.log('INFOR', f'Got {hits} answers from the DNS cache')
+            if pool is not None:
+                pool.read_log(log_path, offset)
+                pool.save()
+
+    @abc.abstractmethod
+    def query_lines(self, names, ns_path, log_path, query_type, concurrent_num,
+                    quiet_mode, negative):
+        """
+        Send the queries of the names
+
+        :param bool negative: also yield the NXDOMAIN answers
+        :return: generator of JSON lines
+        """
+
+
+class MassdnsBackend(Backend):
+    """
+    Backend running the bundled massdns through pipes
+
+    :param massdns_path: massdns path
+    """
+    name = 'massdns'
+
+    def __init__(self, massdns_path):
+        self.massdns_path = massdns_path
+
+    def query_lines(self, names, ns_path, log_path, query_type, concurrent_num,
+                    quiet_mode, negative):
+        return utils.iter_massdns(self.massdns_path, names, ns_path, log_path,
+                                  query_type=query_type,
+                                  concurrent_num=concurrent_num,
+                                  quiet_mode=quiet_mode, negative=negative)
+
+
+class AsyncioBackend(Backend):
+    """
+    Backend running the pure Python asyncio engine in a thread
+    """
+    name = 'asyncio'
+
+    def query_lines(self, names, ns_path, log_path, query_type, concurrent_num,
+                    quiet_mode, negative):
+        logger.log('DEBUG', 'Start running asyncio DNS engine')
+        nameservers = read_nameservers(ns_path)
+        # 多进程并行处理目标时各进程平分并发查询数
+        concurrent_num = max(1, concurrent_num // settings.target_worker_count)
+        engine = DNSEngine(nameservers, concurrent=concurrent_num,
+                           sockets=settings.brute_socket_num,
+                           timeout=settings.dns_engine_timeout,
+                           retries=settings.brute_resolve_num)
+        lines = Queue(maxsize=concurrent_num)
+        statuses = {'NOERROR', 'NXDOMAIN'} if negative else {'NOERROR'}
+
+        def put(item):
+            if item.get('status') in statuses and not engine.stopped:
+                lines.put(json.dumps(item, separators=(',', ':')) + '\n')
+
+        def run():
+            try:
+                engine.run(names, put, query_type)
+            except Exception as e:
+                logger.log('ERROR', e.args)
+            finally:
+                lines.put(None)
+
+        thread = threading.Thread(target=run, name='DNSEngine', daemon=True)
+        thread.start()
+        line = str()
+        try:
+            while True:
+                line = lines.get()
+                if line is None:
+                    break
+                yield line
+        finally:
+            # 使用者提前结束时停止引擎 并取走队列中的结果以免引擎线程阻塞
+            engine.stop()
+            while line is not None:
+                line = lines.get()
+        thread.join()
+        pool = get_resolver_pool()
+        if pool is not None:
+            for nameserver, count in engine.timeouts.items():
+                pool.add(to_address(nameserver), 'timeout', count)
+            for nameserver, count in engine.errors.items():
+                pool.add(to_address(nameserver), 'error', count)
+        if engine.stats['failed']:
+            with open(log_path, 'a') as log:
+                log.write(f'{utils.get_timestring()} asyncio engine failed to resolve '
+                          f'{engine.stats["failed"]} names\n')
+        logger.log('DEBUG', 'Finished asyncio DNS engine')
+
+
+def get_backend():
+    """
+    Get the configured resolution backend
+
+    :return: Backend object
+    """
+    name = settings.resolve_backend
+    massdns_dir = settings.third_party_dir.joinpath('massdns')
+    if name == 'massdns':
+        return MassdnsBackend(utils.get_massdns_path(massdns_dir))
+    if name == 'asyncio':
+        return AsyncioBackend()
+    massdns_path = utils.find_massdns_path(massdns_dir)
+    if massdns_path is None:
+        logger.log('ALERT', 'There is no massdns for this platform or architecture, '
+                            'using the asyncio DNS engine instead')
+        return AsyncioBackend()
+    return MassdnsBackend(massdns_path)
@@ -0,0 +1,235 @@
+"""
+TTL aware cache of the DNS answers shared by the resolution stages
+"""
+
+import time
+import sqlite3
+import threading
+from itertools import islice
+
+from common import massdns
+from config import settings
+from config.log import logger
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_expire(line, now):
+    """
+    Get the name and the expire time of a massdns JSON line
+
+    Positive answers expire with their smallest TTL capped by
+    dns_cache_max_ttl, NXDOMAIN and empty answers expire after
+    dns_cache_negative_ttl, other statuses are not cached. The line is kept
+    whenever the response has answers, so the CNAME chain of a NXDOMAIN
+    answer is still available.
+
+    :param str line: JSON line
+    :param float now: current timestamp
+    :return tuple: (name, expire time, whether to keep the line) or None
+    """
+    items = massdns.loads(line)
+    name = items['name'][:-1].lower()
+    status = items.get('status')
+    if status not in ('NOERROR', 'NXDOMAIN'):
+        return None
+    answers = (items.get('data') or dict()).get('answers')
+    negative_expire = now + settings.dns_cache_negative_ttl
+    if status == 'NXDOMAIN':
+        return name, negative_expire, bool(answers)
+    if not answers:
+        return name, negative_expire, False
+    ttl = min(min(answer.get('ttl', 0) for answer in answers),
+              settings.dns_cache_max_ttl)
+    if ttl <= 0:
+        return None
+    return name, now + ttl, True
+
+
+def get_cached_cname(line, name):
+    """
+    Get the CNAME of a name from its cached answer
+
+    :param str line: JSON line of the A record answer
+    :param str name: name
+    :return: CNAME with the trailing dot or None
+    """
+    owner = name.lower().rstrip('.') + '.'
+    answers = (massdns.loads(line).get('data') or dict()).get('answers') or list()
+    for answer in answers:
+        if answer.get('type') == 'CNAME' and answer['name'].lower() == owner:
+            return answer['data']
+    return None
+
+
+class DNSCache(object):
+    """
+    Answers of names kept until their TTL expires
+
+    Answers are kept as the massdns JSON lines so consumers cannot tell them
+    from fresh answers, those without any record only as an expire time.
+    The oldest entries are dropped beyond max_size, and with a path the
+    entries are also kept in a SQLite file reused by later runs.
+
+    :param int max_size: max entries kept in memory
+    :param path: path of the SQLite file (default None only in memory)
+    """
+
+    def __init__(self, max_size, path=None):
+        self.max_size = max_size
+        self.entries = dict()  # name -> (expire time, JSON line or None)
+        self.pending = list()  # 待写入文件的条目
+        self.lock = threading.Lock()
+        self.conn = None
+        if path is not None:
+            self.conn = sqlite3.connect(str(path), check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(f'PRAGMA busy_timeout={settings.database_busy_timeout}')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS answer ('
+                              'name TEXT PRIMARY KEY, expire REAL, line TEXT)')
+            self.conn.execute('DELETE FROM answer WHERE expire < ?', (time.time(),))
+            self.conn.commit()
+
+    def store(self, name, expire, line):
+        """
+        Keep an entry as the newest and drop the oldest beyond max_size, the
+        caller holds the lock
+        """
+        self.entries.pop(name, None)
+        self.entries[name] = (expire, line)
+        if len(self.entries) > self.max_size:
+            self.entries.pop(next(iter(self.entries)))
+
+    def load(self, names, now):
+        """
+        Load the unexpired entries of the names from the file, the caller
+        holds the lock
+
+        :return dict: loaded entries
+        """
+        names = list(names)
+        loaded = dict()
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT name, expire, line FROM answer '
+                                     f'WHERE expire > ? AND name IN ({marks})',
+                                     [now] + chunk)
+            for name, expire, line in rows:
+                loaded[name] = (expire, line)
+                self.store(name, expire, line)
+        return loaded
+
+    def iter_stale(self, names, lines):
+        """
+        Look up the names chunk by chunk and yield the names to be resolved
+
+        :param names: iterable of names
+        :param lines: list or deque the cached JSON lines are appended to
+        :return: generator of names to be resolved
+        """
+        names = iter(names)
+        while True:
+            chunk = [name.strip() for name in islice(names, 500)]
+            if not chunk:
+                return
+            now = time.time()
+            stale = list()
+            with self.lock:
+                loaded = dict()
+                if self.conn is not None:
+                    loaded = self.load({name.lower() for name in chunk
+                                        if name and name.lower() not in self.entries}, now)
+                for name in chunk:
+                    if not name:
+                        continue
+                    entry = loaded.get(name.lower()) or self.entries.get(name.lower())
+                    if entry is None or entry[0] <= now:
+                        stale.append(name)
+                    elif entry[1] is not None:
+                        lines.append(entry[1])
+            yield from stale
+
+    def lookup(self, names):
+        """
+        Split the names into the cached answers and the names to be resolved
+
+        :param names: iterable of names
+        :return tuple: (cached JSON lines, names to be resolved)
+        """
+        lines = list()
+        stale = list(self.iter_stale(names, lines))
+        return lines, stale
+
+    def get(self, name):
+        """
+        Get the cached answer of a name
+
+        :param str name: name
+        :return tuple: (whether the name is cached, JSON line or None without records)
+        """
+        name = name.lower()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(name)
+            if self.conn is not None and entry is None:
+                entry = self.load([name], now).get(name)
+        if entry is None or entry[0] <= now:
+            return False, None
+        return True, entry[1]
+
+    def put(self, line):
+        """
+        Cache a massdns JSON line
+
+        :param str line: JSON line
+        """
+        try:
+            result = get_expire(line, time.time())
+        except Exception as e:
+            logger.log('DEBUG', f'Not caching invalid answer {line}: {e}')
+            return
+        if result is None:
+            return
+        name, expire, keep = result
+        line = line if keep else None
+        with self.lock:
+            self.store(name, expire, line)
+            if self.conn is not None:
+                self.pending.append((name, expire, line))
+
+    def flush(self):
+        """
+        Write the new entries into the file
+        """
+        if self.conn is None:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, list()
+            if not pending:
+                return
+            self.conn.executemany('INSERT OR REPLACE INTO answer VALUES (?, ?, ?)', pending)
+            self.conn.commit()
+        logger.log('DEBUG', f'Saved {len(pending)} DNS answers into the DNS cache')
+
+
+def get_dns_cache():
+    """
+    Get the process-wide DNSCache
+
+    :return: DNSCache object or None when the cache is disabled
+    """
+    global _cache
+    if not settings.enable_dns_cache:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            path = None
+            if settings.dns_cache_persist:
+                settings.result_save_dir.mkdir(parents=True, exist_ok=True)
+                path = settings.result_save_dir.joinpath('dns_cache.sqlite3')
+            _cache = DNSCache(settings.dns_cache_max_size, path)
+    return _cache
@@ -0,0 +1,399 @@
+"""
+Pure Python asynchronous DNS resolution engine
+"""
+
+import time
+import random
+import socket
+import struct
+import asyncio
+
+import dns.rdata
+import dns.rcode
+import dns.rdatatype
+
+from config.log import logger
+
+# 换名称服务器重查的响应码
+RETRY_RCODES = {dns.rcode.SERVFAIL, dns.rcode.REFUSED}
+RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 5: 'REFUSED'}
+TYPES = {1: 'A', 2: 'NS', 5: 'CNAME', 12: 'PTR', 28: 'AAAA'}
+NAME_TYPES = {2, 5, 12}  # 记录数据是域名的类型
+
+
+def parse_nameserver(line):
+    """
+    Parse a line of the nameservers file
+
+    :param str line: `ip` or `ip:port`
+    :return tuple: (ip, port) or None
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    host, _, port = line.partition(':')
+    try:
+        socket.inet_aton(host)
+        return host, int(port or 53)
+    except (OSError, ValueError):
+        logger.log('DEBUG', f'Ignored nameserver {line}')
+        return None
+
+
+def read_nameservers(path):
+    """
+    Read the IPv4 nameservers of a nameservers file
+
+    :param path: nameservers file path
+    :return list: (ip, port) tuples
+    """
+    nameservers = list()
+    with open(path) as fd:
+        for line in fd:
+            nameserver = parse_nameserver(line)
+            if nameserver:
+                nameservers.append(nameserver)
+    return nameservers
+
+
+def make_query(qid, name, rdtype):
+    """
+    Encode a recursive query without going through dns.message
+
+    :param int qid: query id
+    :param bytes name: IDNA encoded query name
+    :param int rdtype: query type
+    :return bytes: wire data
+    """
+    labels = b''.join(bytes((len(label),)) + label
+                      for label in name.split(b'.') if label)
+    return struct.pack('!HHHHHH', qid, 0x0100, 1, 0, 0, 0) + labels + \
+        struct.pack('!BHH', 0, rdtype, 1)
+
+
+def read_name(data, offset):
+    """
+    Read a possibly compressed domain name
+
+    :param bytes data: wire data
+    :param int offset: offset of the name
+    :return tuple: (absolute name, offset after the name)
+    """
+    labels = list()
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length >= 0xC0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 127:
+                raise ValueError('Name compression loop')
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if not length:
+            break
+        labels.append(data[offset:offset + length].decode('latin-1'))
+        offset += length
+    return '.'.join(labels) + '.', offset if end is None else end
+
+
+def parse_response(data):
+    """
+    Parse the question and answer section of a response
+
+    :param bytes data: wire data
+    :return tuple: (rcode, question name, answers)
+    """
+    flags, qdcount, ancount = struct.unpack_from('!HHH', data, 2)
+    offset = 12
+    qname = None
+    for _ in range(qdcount):
+        qname, offset = read_name(data, offset)
+        offset += 4
+    answers = list()
+    for _ in range(ancount):
+        name, offset = read_name(data, offset)
+        rtype, rclass, ttl, length = struct.unpack_from('!HHIH', data, offset)
+        offset += 10
+        if rtype == 1 and length == 4:
+            value = socket.inet_ntoa(data[offset:offset + 4])
+        elif rtype in NAME_TYPES:
+            value = read_name(data, offset)[0]
+        elif rtype == 28 and length == 16:
+            value = socket.inet_ntop(socket.AF_INET6, data[offset:offset + 16])
+        else:
+            value = dns.rdata.from_wire(rclass, rtype, data, offset, length).to_text()
+        answers.append({'ttl': ttl, 'type': dns.rdatatype.to_text(rtype) if rtype not in TYPES
+                        else TYPES[rtype], 'class': 'IN', 'name': name, 'data': value})
+        offset += length
+    return flags & 0xF, qname, answers
+
+
+def make_item(name, qtype, rcode, answers, nameserver):
+    """
+    Make the JSON record written by massdns
+
+    :param str name: query name
+    :param str qtype: query type
+    :param int rcode: response code
+    :param list answers: answers of the response
+    :param tuple nameserver: (ip, port) of the resolver
+    :return dict: massdns style record
+    """
+    data = dict()
+    if answers:
+        data['answers'] = answers
+    return {'name': name + '.', 'type': qtype, 'class': 'IN',
+            'status': RCODES.get(rcode) or dns.rcode.to_text(rcode), 'data': data,
+            'resolver': f'{nameserver[0]}:{nameserver[1]}'}
+
+
+class EngineProtocol(asyncio.DatagramProtocol):
+    """
+    UDP socket of the engine matching responses to the pending queries
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = dict()  # query id -> (future, name, nameserver)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        qid = struct.unpack_from('!H', data)[0]
+        pending = self.pending.get(qid)
+        if pending is None:
+            return
+        future, name, nameserver = pending  # name为IDNA编码后的查询名称
+        if addr[:2] != nameserver:  # 不是向该名称服务器发出的查询的响应
+            return
+        try:
+            rcode, qname, answers = parse_response(data)
+        except Exception as e:
+            logger.log('TRACE', f'Invalid response of {name} from {addr}: {e}')
+            return
+        if qname is None or qname[:-1].lower() != name.lower():
+            return
+        del self.pending[qid]
+        if not future.done():
+            future.set_result((rcode, answers))
+
+    def error_received(self, exc):
+        logger.log('TRACE', f'DNS engine socket error: {exc}')
+
+    def new_qid(self):
+        while True:
+            qid = random.getrandbits(16)
+            if qid not in self.pending:
+                return qid
+
+
+def expire(future):
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
+
+
+class DNSEngine(object):
+    """
+    Stub resolver driving thousands of in-flight queries over a few sockets
+
+    Every query goes to a random nameserver and is retried on another one
+    after a timeout, SERVFAIL or REFUSED, like massdns does with its
+    resolve count. Results are massdns style records so the massdns output
+    processing works unchanged.
+
+    :param list nameservers: (ip, port) tuples
+    :param int concurrent: max in-flight queries
+    :param int sockets: number of UDP sockets
+    :param float timeout: seconds to wait for one response
+    :param int retries: max tries of one name
+    """
+
+    def __init__(self, nameservers, concurrent=10000, sockets=1, timeout=2.0,
+                 retries=15):
+        if not nameservers:
+            raise ValueError('No usable nameserver')
+        self.nameservers = nameservers
+        self.concurrent = max(1, concurrent)
+        self.socket_num = max(1, sockets)
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.protocols = list()
+        self.stats = {'sent': 0, 'timeout': 0, 'retry': 0, 'failed': 0}
+        self.timeouts = dict()  # 各名称服务器的超时次数
+        self.errors = dict()  # 各名称服务器返回SERVFAIL和REFUSED的次数
+        self.stopped = False  # 停止读取新的子域并放弃重查
+
+    async def open(self):
+        loop = asyncio.get_event_loop()
+        for _ in range(self.socket_num):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            sock.setblocking(False)
+            sock.bind(('0.0.0.0', 0))
+            _, protocol = await loop.create_datagram_endpoint(
+                EngineProtocol, sock=sock)
+            self.protocols.append(protocol)
+
+    def close(self):
+        for protocol in self.protocols:
+            if protocol.transport is not None:
+                protocol.transport.close()
+        self.protocols = list()
+
+    async def send(self, name, rdtype, nameserver):
+        """
+        Send one query and wait for its response
+
+        :return tuple: (rcode, answers) or None on timeout
+        """
+        wire_name = name.encode('idna')
+        loop = asyncio.get_event_loop()
+        protocol = random.choice(self.protocols)
+        qid = protocol.new_qid()
+        future = loop.create_future()
+        # 响应中的名称按latin-1解码 所以用同样解码的IDNA编码名称比较
+        protocol.pending[qid] = (future, wire_name.decode('latin-1').rstrip('.'), nameserver)
+        timer = loop.call_later(self.timeout, expire, future)
+        try:
+            protocol.transport.sendto(make_query(qid, wire_name, rdtype), nameserver)
+            self.stats['sent'] += 1
+            return await future
+        except asyncio.TimeoutError:
+            self.stats['timeout'] += 1
+            self.timeouts[nameserver] = self.timeouts.get(nameserver, 0) + 1
+            return None
+        finally:
+            timer.cancel()
+            protocol.pending.pop(qid, None)
+
+    async def query(self, name, qtype='A'):
+        """
+        Resolve a name trying nameservers until one answers
+
+        :param str name: query name
+        :param str qtype: query type
+        :return dict: massdns style record or None when all tries failed
+        """
+        rdtype = dns.rdatatype.from_text(qtype)
+        for tries in range(self.retries):
+            if self.stopped:
+                return None
+            if tries:
+                self.stats['retry'] += 1
+            nameserver = random.choice(self.nameservers)
+            try:
+                response = await self.send(name, rdtype, nameserver)
+            except UnicodeError as e:  # 空标签或超长标签等无法编码的子域
+                self.stats['failed'] += 1
+                logger.log('DEBUG', f'Invalid name {name}: {e}')
+                return None
+            if response is None:
+                continue
+            if response[0] in RETRY_RCODES:
+                self.errors[nameserver] = self.errors.get(nameserver, 0) + 1
+                continue
+            return make_item(name, qtype, response[0], response[1], nameserver)
+        self.stats['failed'] += 1
+        logger.log('TRACE', f'Resolving {name} failed after {self.retries} tries')
+        return None
+
+    async def resolve(self, names, callback, qtype='A'):
+        """
+        Resolve the names with at most concurrent queries in flight
+
+        :param names: iterable of names
+        :param callback: called with every record
+        :param str qtype: query type
+        """
+        await self.open()
+        semaphore = asyncio.Semaphore(self.concurrent)
+        tasks = set()
+
+        def done(task):
+            tasks.discard(task)
+            semaphore.release()
+            if task.cancelled():
+                return
+            item = task.result()
+            if item is not None:
+                callback(item)
+
+        try:
+            for name in names:
+                if self.stopped:
+                    break
+                name = name.strip()
+                if not name:
+                    continue
+                await semaphore.acquire()
+                task = asyncio.ensure_future(self.query(name, qtype))
+                tasks.add(task)
+                task.add_done_callback(done)
+            if tasks:
+                await asyncio.wait(list(tasks))
+        finally:
+            self.close()
+
+    def stop(self):
+        """
+        Stop the engine, the queries in flight still wait for their responses
+        """
+        self.stopped = True
+
+    def run(self, names, callback, qtype='A'):
+        """
+        Resolve the names on a new event loop
+
+        :param names: iterable of names
+        :param callback: called with every record
+        :param str qtype: query type
+        """
+        start = time.time()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.resolve(names, callback, qtype))
+        finally:
+            loop.close()
+        elapse = round(time.time() - start, 1)
+        logger.log('DEBUG', f'DNS engine finished in {elapse} seconds: {self.stats}')
+
+
+if __name__ == '__main__':
+    import multiprocessing
+
+    def serve(port):
+        """
+        Local stub server answering every A query with 10.0.0.1
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+        sock.bind(('127.0.0.1', 0))
+        port.value = sock.getsockname()[1]
+        answer = struct.pack('!HHHIH4B', 0xC00C, 1, 1, 600, 4, 10, 0, 0, 1)
+        while True:
+            data, addr = sock.recvfrom(512)
+            response = data[:2] + struct.pack('!HHHHH', 0x8180, 1, 1, 0, 0) + data[12:]
+            sock.sendto(response + answer, addr)
+
+    port = multiprocessing.Value('i', 0)
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    server.start()
+    while not port.value:
+        time.sleep(0.1)
+    count = 50000
+    names = (f'name{i}.example.com' for i in range(count))
+    items = list()
+    engine = DNSEngine([('127.0.0.1', port.value)], concurrent=2000, timeout=2.0, retries=3)
+    start = time.time()
+    engine.run(names, items.append)
+    elapse = time.time() - start
+    print(f'Resolved {len(items)}/{count} names in {elapse:.2f}s '
+          f'({count / elapse:.0f} qps) {engine.stats}')
+    server.terminate()
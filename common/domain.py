@@ -1,7 +1,58 @@
 import re
+import threading
+
 from common import tldextract
 from config import settings
 
+domain_regexp = re.compile(r'\b((?=[a-z0-9-]{1,63}\.)(xn--)?[a-z0-9]+(-[a-z0-9]+)*\.)+[a-z]{2,63}\b', re.I)
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor():
+    """
+    Get the process-wide public suffix extractor
+
+    The public suffix list is loaded only once per process and recent
+    extractions are kept in a bounded LRU.
+
+    :return: tldextract.TLDExtract object
+    """
+    global _extractor
+    if _extractor is not None:
+        return _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            data_storage_dir = settings.data_storage_dir
+            extract_cache_file = data_storage_dir.joinpath('public_suffix_list.dat')
+            cache_size = settings.domain_extract_cache_size
+            extractor = tldextract.TLDExtract(extract_cache_file, cache_size)
+            extractor.tlds  # load the public suffix list before publishing
+            _extractor = extractor
+    return _extractor
+
+
+def extract_many(strings):
+    """
+    Extract a batch of strings with the process-wide extractor
+
+    >>> extract_many(['www.example.com', 'a.b.example.co.uk', 'none'])
+    [ExtractResult(subdomain='www', domain='example', suffix='com'), ...]
+
+    :param strings: iterable of strings
+    :return: list of extracted domain results (None if nothing matched)
+    """
+    extractor = get_extractor()
+    results = list()
+    for string in strings:
+        result = Domain(string).match()
+        if result:
+            results.append(extractor(result))
+        else:
+            results.append(None)
+    return results
+
 
 class Domain(object):
     """
@@ -11,7 +62,7 @@ class Domain(object):
     """
     def __init__(self, string):
         self.string = str(string)
-        self.regexp = r'\b((?=[a-z0-9-]{1,63}\.)(xn--)?[a-z0-9]+(-[a-z0-9]+)*\.)+[a-z]{2,63}\b'
+        self.regexp = domain_regexp
         self.domain = None
 
     def match(self):
@@ -20,7 +71,7 @@ class Domain(object):
 
         :return : result
         """
-        result = re.search(self.regexp, self.string, re.I)
+        result = self.regexp.search(self.string)
         if result:
             return result.group()
         return None
@@ -36,12 +87,9 @@ class Domain(object):
 
         :return: extracted domain results
         """
-        data_storage_dir = settings.data_storage_dir
-        extract_cache_file = data_storage_dir.joinpath('public_suffix_list.dat')
-        ext = tldextract.TLDExtract(extract_cache_file)
         result = self.match()
         if result:
-            return ext(result)
+            return get_extractor()(result)
         return None
 
     def registered(self):
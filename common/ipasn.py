@@ -1,8 +1,15 @@
 import zipfile
+import threading
+from array import array
+from bisect import bisect_right
 
 from common.utils import ip_to_int
 from config.setting import data_storage_dir
 from common.database import Database
+from config.log import logger
+
+_asn_ranges = None
+_asn_ranges_lock = threading.Lock()
 
 
 def get_db_path():
@@ -15,26 +22,92 @@ def get_db_path():
     return db_path
 
 
+class AsnRanges(object):
+    """
+    ASN ranges held in sorted contiguous arrays for binary search
+
+    The ranges in the ip2location asn table do not overlap, so the range
+    with the greatest start not above an IP is the only candidate.
+    """
+
+    def __init__(self, rows):
+        self.starts = array('L')
+        self.ends = array('L')
+        self.cidrs = list()
+        self.asns = list()
+        self.orgs = list()
+        for ip_from, ip_to, cidr, asn, org in rows:
+            self.starts.append(ip_from)
+            self.ends.append(ip_to)
+            self.cidrs.append(cidr)
+            self.asns.append(asn)
+            self.orgs.append(org)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def search(self, ip):
+        """
+        Search the index of the range containing the IP
+
+        :param int ip: IP as integer
+        :return int: range index or -1 if not found
+        """
+        index = bisect_right(self.starts, ip) - 1
+        if index < 0 or self.ends[index] < ip:
+            return -1
+        return index
+
+
+def load_asn_ranges(db):
+    """
+    Load the ASN ranges once per process
+
+    :param db: Database of ip2location.db
+    :return: AsnRanges object
+    """
+    global _asn_ranges
+    if _asn_ranges is not None:
+        return _asn_ranges
+    with _asn_ranges_lock:
+        if _asn_ranges is None:
+            logger.log('DEBUG', 'Loading ASN ranges into memory')
+            sql = 'SELECT ip_from, ip_to, cidr, asn, "as" FROM asn ORDER BY ip_from;'
+            _asn_ranges = AsnRanges(db.conn.iter_query(sql))
+            logger.log('DEBUG', f'Loaded {len(_asn_ranges)} ASN ranges')
+    return _asn_ranges
+
+
 class IPAsnInfo(Database):
     def __init__(self):
         path = get_db_path()
         Database.__init__(self, path)
+        self.ranges = load_asn_ranges(self)
 
     def find(self, ip):
-        info = {'cidr': '', 'asn': '', 'org': ''}
-        if isinstance(ip, (int, str)):
-            ip = ip_to_int(ip)
-        else:
-            return info
-        sql = f'SELECT * FROM asn WHERE ip_from <= {ip} AND ip_to >= {ip} LIMIT 1;'
-        result = self.query(sql)
-        if not hasattr(result, 'dataset'):
-            return info
-        asn = result.as_dict()
-        info['cidr'] = asn[0]['cidr']
-        info['asn'] = f"AS{asn[0]['asn']}"
-        info['org'] = asn[0]['as']
-        return info
+        return self.find_many([ip])[0]
+
+    def find_many(self, ips):
+        """
+        Find ASN information of IPs
+
+        :param ips: iterable of IPs (str or int)
+        :return list: ASN information dict of each IP in order
+        """
+        ranges = self.ranges
+        infos = list()
+        for ip in ips:
+            info = {'cidr': '', 'asn': '', 'org': ''}
+            infos.append(info)
+            if not isinstance(ip, (int, str)):
+                continue
+            index = ranges.search(ip_to_int(ip))
+            if index < 0:
+                continue
+            info['cidr'] = ranges.cidrs[index]
+            info['asn'] = f'AS{ranges.asns[index]}'
+            info['org'] = ranges.orgs[index]
+        return infos
 
 
 if __name__ == "__main__":
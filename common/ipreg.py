@@ -4,28 +4,51 @@
 " Author: koma<komazhang@foxmail.com>
 " Date : 2015-11-06
 """
-import io
-import sys
+import mmap
 import socket
 import struct
+import threading
 
 from config import settings
+from config.log import logger
+
+_mappings = dict()
+_mappings_lock = threading.Lock()
+
+
+def get_mapping(db_file):
+    """
+    Get the read-only memory mapping of the db file
+
+    The mapping is created once per process and its pages live in the OS
+    page cache, so they are shared with every process mapping the file.
+
+    :param db_file: db file path
+    :return: mmap object
+    """
+    key = str(db_file)
+    mapping = _mappings.get(key)
+    if mapping is not None:
+        return mapping
+    with _mappings_lock:
+        mapping = _mappings.get(key)
+        if mapping is None:
+            with open(key, 'rb') as fd:
+                mapping = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            _mappings[key] = mapping
+    return mapping
 
 
 class IpRegInfo(object):
     __INDEX_BLOCK_LENGTH = 12
     __TOTAL_HEADER_LENGTH = 8192
 
-    __f = None
-    __headerSip = []
-    __headerPtr = []
-    __headerLen = 0
-    __indexSPtr = 0
-    __indexLPtr = 0
-    __indexCount = 0
-    __dbBinStr = ''
-
     def __init__(self, db_file):
+        self.__buf = None
+        self.__indexSPtr = 0
+        self.__indexLPtr = 0
+        self.__indexCount = 0
+        self.__regions = dict()  # data ptr -> region info
         self.init_database(db_file)
 
     def memory_search(self, ip):
@@ -33,31 +56,27 @@ class IpRegInfo(object):
         " memory search method
         " param: ip
         """
-        if not ip.isdigit():
-            ip = self.ip2long(ip)
-
-        if self.__dbBinStr == '':
-            self.__dbBinStr = self.__f.read()  # read all the contents in file
-            self.__indexSPtr = self.get_long(self.__dbBinStr, 0)
-            self.__indexLPtr = self.get_long(self.__dbBinStr, 4)
-            self.__indexCount = int((self.__indexLPtr - self.__indexSPtr) /
-                                    self.__INDEX_BLOCK_LENGTH) + 1
+        if not isinstance(ip, int):
+            if not ip.isdigit():
+                ip = self.ip2long(ip)
+            else:
+                ip = int(ip)
 
-        l, h, data_ptr = (0, self.__indexCount, 0)
+        buf = self.__buf
+        unpack_from = struct.unpack_from
+        l, h, data_ptr = (0, self.__indexCount - 1, 0)
         while l <= h:
-            m = int((l + h) >> 1)
+            m = (l + h) >> 1
             p = self.__indexSPtr + m * self.__INDEX_BLOCK_LENGTH
-            sip = self.get_long(self.__dbBinStr, p)
+            sip, eip, ptr = unpack_from('<III', buf, p)
 
             if ip < sip:
                 h = m - 1
+            elif ip > eip:
+                l = m + 1
             else:
-                eip = self.get_long(self.__dbBinStr, p + 4)
-                if ip > eip:
-                    l = m + 1
-                else:
-                    data_ptr = self.get_long(self.__dbBinStr, p + 8)
-                    break
+                data_ptr = ptr
+                break
 
         if data_ptr == 0:
             raise Exception("Data pointer not found")
@@ -70,24 +89,30 @@ class IpRegInfo(object):
         " param: dbFile
         """
         try:
-            self.__f = io.open(db_file, "rb")
-        except IOError as e:
-            print("[Error]: %s" % e)
-            sys.exit()
+            self.__buf = get_mapping(db_file)
+        except (IOError, ValueError) as e:
+            logger.log('FATAL', f'Unable to load {db_file}: {e}')
+            exit(1)
+        self.__indexSPtr = self.get_long(self.__buf, 0)
+        self.__indexLPtr = self.get_long(self.__buf, 4)
+        self.__indexCount = int((self.__indexLPtr - self.__indexSPtr) /
+                                self.__INDEX_BLOCK_LENGTH) + 1
 
     def return_data(self, data_ptr):
         """
         " get ip data from db file by data start ptr
         " param: data ptr
         """
+        info = self.__regions.get(data_ptr)
+        if info is not None:
+            return info
         data_len = (data_ptr >> 24) & 0xFF
-        data_ptr = data_ptr & 0x00FFFFFF
-
-        self.__f.seek(data_ptr)
-        data = self.__f.read(data_len)
+        offset = data_ptr & 0x00FFFFFF
 
+        data = self.__buf[offset:offset + data_len]
         info = {"city_id": self.get_long(data, 0),
                 "region": data[4:].decode('utf-8')}
+        self.__regions[data_ptr] = info
         return info
 
     @staticmethod
@@ -111,16 +136,14 @@ class IpRegInfo(object):
 
     @staticmethod
     def get_long(b, offset):
-        if len(b[offset:offset + 4]) == 4:
-            return struct.unpack('I', b[offset:offset + 4])[0]
+        if len(b) - offset >= 4:
+            return struct.unpack_from('<I', b, offset)[0]
         return 0
 
     def close(self):
-        if self.__f is not None:
-            self.__f.close()
-        self.__dbBinStr = None
-        self.__headerPtr = None
-        self.__headerSip = None
+        # The mapping is shared by the process and stays open
+        self.__buf = None
+        self.__regions = None
 
 
 class IpRegData(IpRegInfo):
@@ -128,6 +151,15 @@ class IpRegData(IpRegInfo):
         path = settings.data_storage_dir.joinpath('ip2region.db')
         IpRegInfo.__init__(self, path)
 
+    def query_many(self, ips):
+        """
+        Query the address and isp of IPs
+
+        :param ips: iterable of IPs
+        :return list: address information dict of each IP in order
+        """
+        return [self.query(ip) for ip in ips]
+
     def query(self, ip):
         result = self.memory_search(ip)
         addr_list = result.get('region').split('|')
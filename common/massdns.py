@@ -0,0 +1,71 @@
+"""
+Single pass parser of the massdns JSON lines shared by resolve and brute
+"""
+
+import json
+
+from config.log import logger
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+    except ImportError:
+        loads = json.loads
+
+
+def parse_line(line):
+    """
+    Parse one massdns JSON line
+
+    Only the fields used by resolve and brute are kept: the A records of
+    the answers become (cname, ip, ttl) tuples where cname is the owner
+    name of the record.
+
+    :param line: JSON line as str or bytes
+    :return tuple: (qname, status, resolver, records), records is None
+                   when the response has no answers
+    """
+    items = loads(line)
+    qname = items['name'][:-1]  # 去除最右边的`.`点号
+    status = items.get('status')
+    resolver = items.get('resolver')
+    answers = (items.get('data') or dict()).get('answers')
+    if answers is None:
+        return qname, status, resolver, None
+    records = [(answer['name'][:-1].lower(), answer['data'], answer['ttl'])
+               for answer in answers if answer.get('type') == 'A']
+    return qname, status, resolver, records
+
+
+def parse(lines, times=None):
+    """
+    Parse massdns JSON lines in one pass
+
+    :param lines: iterable of JSON lines
+    :param dict times: IP and cname appear times updated in the same pass,
+                       a cname is counted once per qname (default None)
+    :return: generator of (qname, resolver, records) of the NOERROR responses
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            qname, status, resolver, records = parse_line(line)
+        except Exception as e:
+            logger.log('ERROR', e.args)
+            logger.log('ERROR', f'Error parsing line {line} Skip this line')
+            continue
+        if status != 'NOERROR':
+            logger.log('TRACE', f'Resolving {qname}: {status}')
+            continue
+        if times is not None and records:
+            for _, ip, _ in records:
+                times[ip] = times.get(ip, 0) + 1
+            # 每个CNAME在一个子域的应答中只计一次 不按A记录数重复计数
+            for cname in {cname for cname, _, _ in records}:
+                times[cname] = times.get(cname, 0) + 1
+        yield qname, resolver, records
@@ -0,0 +1,297 @@
+"""
+Multi-pattern substring matchers: an Aho-Corasick automaton for keywords
+and precompiled per-domain subdomain patterns
+"""
+
+import re
+from collections import deque
+from functools import lru_cache
+
+
+class Matcher(object):
+    """
+    Aho-Corasick automaton built once from a list of keywords
+
+    >>> matcher = Matcher(['cdn', 'cache', 'alicdn.com'])
+    >>> sorted(matcher.find_all('img.alicdn.com'))
+    ['alicdn.com', 'cdn']
+    >>> matcher.search('www.example.com')
+    False
+
+    :param patterns: keywords to be matched
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list()
+        self.goto = [dict()]  # state -> {char: next state}
+        self.fail = [0]  # state -> failure state
+        self.output = [tuple()]  # state -> matched keywords
+        for pattern in patterns:
+            self.add(pattern)
+        self.build()
+
+    def add(self, pattern):
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(tuple())
+            state = next_state
+        if pattern not in self.output[state]:
+            self.output[state] += (pattern,)
+            self.patterns.append(pattern)
+
+    def build(self):
+        """
+        Compute failure links and merge outputs in breadth-first order
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def iter_matches(self, text):
+        """
+        Yield every keyword occurrence in the text with one linear pass
+
+        :param str text: text to be scanned
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield from output[state]
+
+    def find_all(self, text):
+        """
+        Find all keywords contained in the text
+
+        :param str text: text to be scanned
+        :return set: matched keywords
+        """
+        if not text:
+            return set()
+        return set(self.iter_matches(text))
+
+    def search(self, text):
+        """
+        Whether the text contains any keyword
+
+        :param str text: text to be scanned
+        :return bool: result
+        """
+        if not text:
+            return False
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+
+NAME_CHARS = 'a-z0-9.\\-'
+SCHEME_WIDTH = len('"https://')  # 非模糊匹配中子域前可能出现的非子域字符数
+
+
+class SubdomainMatcher(object):
+    """
+    Precompiled subdomain patterns of one main domain
+
+    A fuzzy match consists of name characters only, so instead of running the
+    regular expression over the whole body it runs only over the runs of name
+    characters around the occurrences of the main domain, which are found by
+    a fast literal search. Strings and bytes are both supported.
+
+    >>> matcher = SubdomainMatcher('example.com')
+    >>> sorted(matcher.find('<a href="https://WWW.example.com/">api.example.com'))
+    ['api.example.com', 'www.example.com']
+    >>> matcher.find(b'"http://a.example.com', distinct=False, fuzzy=False)
+    ['a.example.com']
+
+    :param str domain: main domain
+    """
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.patterns = {str: self.compile(domain),
+                         bytes: self.compile(domain.encode('utf-8'))}
+
+    @staticmethod
+    def compile(domain):
+        """
+        Compile the patterns of the domain as str or bytes
+
+        :param domain: main domain as str or bytes
+        :return dict: compiled patterns
+        """
+        if isinstance(domain, bytes):
+            def convert(expression):
+                return expression.encode('utf-8')
+            escaped = re.escape(domain)
+            extra = re.escape(bytes(set(domain) - set(b'abcdefghijklmnopqrstuvwxyz0123456789.-')))
+        else:
+            def convert(expression):
+                return expression
+            escaped = re.escape(domain)
+            extra = re.escape(''.join(set(domain) - set('abcdefghijklmnopqrstuvwxyz0123456789.-')))
+        label = r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.){0,}'
+        name_chars = convert(f'[{NAME_CHARS}') + extra + convert(']*')
+        return {
+            'literal': re.compile(escaped, re.I),
+            'run': re.compile(name_chars, re.I),
+            'fuzzy': re.compile(convert(label) + escaped, re.I),
+            'strict': re.compile(convert(r'(?:\>|\"|\'|\=|\,)(?:http\:\/\/|https\:\/\/)?(')
+                                 + convert(label) + escaped + convert(')'), re.I),
+            'boundary': re.compile(convert(f'[^{NAME_CHARS}') + extra + convert(']'), re.I),
+        }
+
+    def iter_fuzzy(self, patterns, data, pos, endpos):
+        run = patterns['run']
+        fuzzy = patterns['fuzzy']
+        done = pos  # 已经扫描过的位置
+        for occurrence in patterns['literal'].finditer(data, pos, endpos):
+            start = occurrence.start()
+            if start < done:
+                continue
+            # 向左找到子域字符连续片段的开头
+            while True:
+                low = max(done, start - 256)
+                length = run.match(data[low:start][::-1]).end()
+                start -= length
+                if start > low or low == done:
+                    break
+            end = run.match(data, occurrence.end(), endpos).end()
+            yield from fuzzy.finditer(data, start, end)
+            done = end
+
+    def iter_matches(self, data, fuzzy=True, pos=0, endpos=None):
+        """
+        Yield the match objects of subdomains with one pass over the data
+
+        :param data: str or bytes
+        :param bool fuzzy: fuzzy match subdomain or not
+        :param int pos: start position
+        :param int endpos: end position
+        :return: generator of (start, end, subdomain)
+        """
+        if endpos is None:
+            endpos = len(data)
+        patterns = self.patterns[bytes if isinstance(data, (bytes, bytearray)) else str]
+        if fuzzy:
+            for match in self.iter_fuzzy(patterns, data, pos, endpos):
+                yield match.start(), match.end(), match.group()
+        else:
+            for match in patterns['strict'].finditer(data, pos, endpos):
+                yield match.start(), match.end(), match.group(1)
+
+    def finditer(self, data, fuzzy=True):
+        """
+        Yield every subdomain in the data in lower case
+
+        :param data: str or bytes
+        :param bool fuzzy: fuzzy match subdomain or not
+        """
+        for _, _, name in self.iter_matches(data, fuzzy):
+            yield to_name(name)
+
+    def find(self, data, distinct=True, fuzzy=True):
+        """
+        Find the subdomains in the data
+
+        :param data: str or bytes
+        :param bool distinct: deduplicate results or not
+        :param bool fuzzy: fuzzy match subdomain or not
+        :return set/list: result set or list
+        """
+        names = self.finditer(data, fuzzy)
+        if distinct:
+            return set(names)
+        return list(names)
+
+    def iter_chunks(self, chunks, fuzzy=True):
+        """
+        Yield every subdomain in a stream of str or bytes chunks
+
+        Only the tail after the last character which cannot belong to a
+        subdomain is carried over to the next chunk, so a subdomain split
+        between two chunks is still found exactly once.
+
+        :param chunks: iterable of str or bytes
+        :param bool fuzzy: fuzzy match subdomain or not
+        """
+        buffer = None
+        for chunk in chunks:
+            buffer = chunk if buffer is None else buffer + chunk
+            patterns = self.patterns[bytes if isinstance(buffer, (bytes, bytearray)) else str]
+            # 最后一个不能出现在子域中的字符之前的子域都已完整
+            last = patterns['boundary'].search(buffer[::-1])
+            if last is None:
+                continue
+            boundary = len(buffer) - 1 - last.start()
+            resume = 0
+            for start, end, name in self.iter_matches(buffer, fuzzy, 0, boundary):
+                resume = end
+                yield to_name(name)
+            buffer = buffer[max(resume, boundary - SCHEME_WIDTH, 0):]
+        if buffer:
+            for _, _, name in self.iter_matches(buffer, fuzzy):
+                yield to_name(name)
+
+
+def to_name(name):
+    if isinstance(name, (bytes, bytearray)):
+        name = name.decode('utf-8', 'ignore')
+    return name.lower()
+
+
+@lru_cache(maxsize=256)
+def get_subdomain_matcher(domain):
+    """
+    Get the cached SubdomainMatcher of a main domain
+
+    :param str domain: main domain
+    :return: SubdomainMatcher object
+    """
+    return SubdomainMatcher(domain)
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    def match_per_call(domain, html):
+        regexp = r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.){0,}' \
+                 + domain.replace('.', r'\.')
+        return set(map(lambda s: s.lower(), re.findall(regexp, html, re.I)))
+
+    random.seed(0)
+    words = ['<div class="item">', 'lorem', 'ipsum', 'https://cdn.example.org/a.js',
+             '"https://www.example.com/"', 'api-v2.dev.example.com', '{"id": 12345}',
+             'data-value=1.2.3', 'abcdefghijklmnopqrstuvwxyz0123456789']
+    body = ' '.join(random.choice(words) for _ in range(300000))
+    matcher = get_subdomain_matcher('example.com')
+    assert matcher.find(body) == match_per_call('example.com', body)
+    size = round(len(body) / 1024 / 1024, 1)
+    old = min(timeit.repeat(lambda: match_per_call('example.com', body), number=1, repeat=3))
+    new = min(timeit.repeat(lambda: matcher.find(body), number=1, repeat=3))
+    data = body.encode('utf-8')
+    raw = min(timeit.repeat(lambda: matcher.find(data), number=1, repeat=3))
+    chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+    stream = min(timeit.repeat(lambda: set(matcher.iter_chunks(chunks)), number=1, repeat=3))
+    print(f'{size} MB body: per-call regexp {old:.3f}s, matcher {new:.3f}s '
+          f'({old / new:.1f}x), bytes {raw:.3f}s, 64 KB chunks {stream:.3f}s')
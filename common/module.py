@@ -3,16 +3,44 @@ Module base class
 """
 
 import json
-import threading
 import time
 
 import requests
 from config.log import logger
 from config import settings
 from common import utils
-from common.database import Database
+from common.database import writer
+from common.result import Result
+from common.client import get_session
+from common.cancel import get_token
+from common.ratelimit import get_limiter
+from common.cache import get_response_cache
 
-lock = threading.Lock()
+subscribers = dict()  # 主域 -> 订阅模块结果的回调列表
+
+
+def subscribe(domain, callback):
+    """
+    Subscribe the results saved by the modules collecting the domain
+
+    :param str domain: main domain
+    :param callback: callable receiving the result rows of one module
+    """
+    subscribers.setdefault(domain, list()).append(callback)
+
+
+def unsubscribe(domain, callback):
+    """
+    Cancel a subscription made by subscribe()
+
+    :param str domain: main domain
+    :param callback: subscribed callable
+    """
+    callbacks = subscribers.get(domain, list())
+    if callback in callbacks:
+        callbacks.remove(callback)
+    if not callbacks:
+        subscribers.pop(domain, None)
 
 
 class Module(object):
@@ -32,6 +60,7 @@ class Module(object):
         self.start = time.time()  # 模块开始执行时间
         self.end = None  # 模块结束执行时间
         self.elapse = None  # 模块执行耗时
+        self.cancel_token = get_token()  # 模块超出时间预算后被取消的令牌
 
     def have_api(self, *apis):
         """
@@ -65,6 +94,102 @@ class Module(object):
         logger.log('DEBUG', f'{self.source} module found subdomains of {self.domain}\n'
                             f'{self.subdomains}')
 
+    @property
+    def limiter(self):
+        """
+        Rate limiter shared by all modules of the same source
+        """
+        return get_limiter(self.source, self.delay)
+
+    def sleep(self, seconds=None):
+        """
+        Wait for the rate limiter of the source between requests, or sleep the
+        given seconds, and wake up at once when the module is cancelled
+
+        :param float seconds: seconds to sleep (default wait for the rate limiter)
+        :return bool: whether the module is cancelled
+        """
+        if seconds is None:
+            return not self.limiter.acquire(self.cancel_token)
+        return self.cancel_token.sleep(seconds)
+
+    def get_cached(self, method, url, kwargs):
+        """
+        Look up the response cache for a request
+
+        :param str method: request method
+        :param str url: request url
+        :param dict kwargs: other params of the request
+        :return tuple: (cache key or None when not cacheable, cached response or None)
+        """
+        cache = get_response_cache()
+        if cache is None or method not in ('GET', 'POST'):
+            return None, None
+        key = cache.make_key(self.source, method, url, kwargs, self.header, self.cookie)
+        return key, cache.get(self.source, key)
+
+    def save_cached(self, key, resp, stream=False):
+        """
+        Save a successful response into the response cache, a streamed one
+        is saved once its body has been read to the end
+
+        :param str key: cache key or None
+        :param resp: response object
+        :param bool stream: whether the response is streamed
+        """
+        if key is None or resp is None or resp.status_code != 200:
+            return
+        cache = get_response_cache()
+        if stream:
+            cache.record(self.source, key, resp)
+        else:
+            cache.put(self.source, key, resp)
+
+    def send(self, method, url, **kwargs):
+        """
+        Send a request through the pooled session of the url
+
+        The response updates the rate limiter of the source, and a request
+        rejected with 429 is sent once more after the server's delay. When the
+        response cache is enabled, GET and POST responses are read from and
+        saved into it.
+
+        :param str method: request method
+        :param str url: request url
+        :param kwargs: other params
+        :return: response object
+        """
+        key, resp = self.get_cached(method, url, kwargs)
+        if resp is not None:
+            return resp
+        session = get_session(url, self.proxy)
+        for _ in range(2):
+            resp = session.request(method, url,
+                                   cookies=self.cookie,
+                                   headers=self.header,
+                                   proxies=self.proxy,
+                                   timeout=self.timeout,
+                                   verify=self.verify,
+                                   **kwargs)
+            if not self.limiter.update(resp):
+                break
+            if self.sleep():
+                break
+        self.save_cached(key, resp, kwargs.get('stream', False))
+        return resp
+
+    def is_cancelled(self, url):
+        """
+        Check whether the module is cancelled before sending a request
+
+        :param str url: request url
+        :return bool: whether the module is cancelled
+        """
+        if not self.cancel_token.cancelled:
+            return False
+        logger.log('DEBUG', f'{self.source} module is cancelled, skip requesting {url}')
+        return True
+
     def head(self, url, params=None, check=True, **kwargs):
         """
         Custom head request
@@ -75,17 +200,11 @@ class Module(object):
         :param kwargs: other params
         :return: response object
         """
-        session = requests.Session()
-        session.trust_env = False
+        if self.is_cancelled(url):
+            return None
+        kwargs.setdefault('allow_redirects', False)
         try:
-            resp = session.head(url,
-                                params=params,
-                                cookies=self.cookie,
-                                headers=self.header,
-                                proxies=self.proxy,
-                                timeout=self.timeout,
-                                verify=self.verify,
-                                **kwargs)
+            resp = self.send('HEAD', url, params=params, **kwargs)
         except Exception as e:
             logger.log('ERROR', e.args[0])
             return None
@@ -107,20 +226,13 @@ class Module(object):
         :param kwargs: other params
         :return: response object
         """
-        session = requests.Session()
-        session.trust_env = False
+        if self.is_cancelled(url):
+            return None
         level = 'ERROR'
         if ignore:
             level = 'DEBUG'
         try:
-            resp = session.get(url,
-                               params=params,
-                               cookies=self.cookie,
-                               headers=self.header,
-                               proxies=self.proxy,
-                               timeout=self.timeout,
-                               verify=self.verify,
-                               **kwargs)
+            resp = self.send('GET', url, params=params, **kwargs)
         except Exception as e:
             if raise_error:
                 if isinstance(e, requests.exceptions.ConnectTimeout):
@@ -144,17 +256,10 @@ class Module(object):
         :param kwargs: other params
         :return: response object
         """
-        session = requests.Session()
-        session.trust_env = False
+        if self.is_cancelled(url):
+            return None
         try:
-            resp = session.post(url,
-                                data=data,
-                                cookies=self.cookie,
-                                headers=self.header,
-                                proxies=self.proxy,
-                                timeout=self.timeout,
-                                verify=self.verify,
-                                **kwargs)
+            resp = self.send('POST', url, data=data, **kwargs)
         except Exception as e:
             logger.log('ERROR', e.args[0])
             return None
@@ -173,16 +278,10 @@ class Module(object):
         :param kwargs: other params
         :return: response object
         """
-        session = requests.Session()
-        session.trust_env = False
+        if self.is_cancelled(url):
+            return None
         try:
-            resp = session.delete(url,
-                                  cookies=self.cookie,
-                                  headers=self.header,
-                                  proxies=self.proxy,
-                                  timeout=self.timeout,
-                                  verify=self.verify,
-                                  **kwargs)
+            resp = self.send('DELETE', url, **kwargs)
         except Exception as e:
             logger.log('ERROR', e.args[0])
             return None
@@ -271,38 +370,9 @@ class Module(object):
         logger.log('DEBUG', f'Generating final results')
         if not len(self.subdomains):  # 该模块一个子域都没有发现的情况
             logger.log('DEBUG', f'{self.source} module result is empty')
-            result = {'id': None,
-                      'alive': None,
-                      'request': None,
-                      'resolve': None,
-                      'url': None,
-                      'subdomain': None,
-                      'port': None,
-                      'level': None,
-                      'cname': None,
-                      'ip': None,
-                      'public': None,
-                      'cdn': None,
-                      'status': None,
-                      'reason': None,
-                      'title': None,
-                      'banner': None,
-                      'header': None,
-                      'history': None,
-                      'response': None,
-                      'ip_times': None,
-                      'cname_times': None,
-                      'ttl': None,
-                      'cidr': None,
-                      'asn': None,
-                      'org': None,
-                      'addr': None,
-                      'isp': None,
-                      'resolver': None,
-                      'module': self.module,
-                      'source': self.source,
-                      'elapse': self.elapse,
-                      'find': None}
+            result = Result(module=self.module,
+                            source=self.source,
+                            elapse=self.elapse)
             self.results.append(result)
         else:
             for subdomain in self.subdomains:
@@ -322,38 +392,31 @@ class Module(object):
                     ip_times = ','.join([str(num) for num in ip_times])
                     cname_times = ','.join([str(num) for num in cname_times])
                     ttl = ','.join([str(num) for num in ttl])
-                result = {'id': None,
-                          'alive': info.get('alive'),
-                          'request': info.get('request'),
-                          'resolve': info.get('resolve'),
-                          'url': url,
-                          'subdomain': subdomain,
-                          'port': 80,
-                          'level': level,
-                          'cname': cname,
-                          'ip': ip,
-                          'public': info.get('public'),
-                          'cdn': info.get('cdn'),
-                          'status': None,
-                          'reason': info.get('reason'),
-                          'title': None,
-                          'banner': None,
-                          'header': None,
-                          'history': None,
-                          'response': None,
-                          'ip_times': ip_times,
-                          'cname_times': cname_times,
-                          'ttl': ttl,
-                          'cidr': info.get('cidr'),
-                          'asn': info.get('asn'),
-                          'org': info.get('org'),
-                          'addr': info.get('addr'),
-                          'isp': info.get('isp'),
-                          'resolver': info.get('resolver'),
-                          'module': self.module,
-                          'source': self.source,
-                          'elapse': self.elapse,
-                          'find': len(self.subdomains)}
+                result = Result(alive=info.get('alive'),
+                                request=info.get('request'),
+                                resolve=info.get('resolve'),
+                                url=url,
+                                subdomain=subdomain,
+                                port=80,
+                                level=level,
+                                cname=cname,
+                                ip=ip,
+                                public=info.get('public'),
+                                cdn=info.get('cdn'),
+                                reason=info.get('reason'),
+                                ip_times=ip_times,
+                                cname_times=cname_times,
+                                ttl=ttl,
+                                cidr=info.get('cidr'),
+                                asn=info.get('asn'),
+                                org=info.get('org'),
+                                addr=info.get('addr'),
+                                isp=info.get('isp'),
+                                resolver=info.get('resolver'),
+                                module=self.module,
+                                source=self.source,
+                                elapse=self.elapse,
+                                find=len(self.subdomains))
 
 
                 # {'id': None, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://ai3.saucer-man.com', 'subdomain': 'ai3.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.1, 'find': 6}
@@ -366,9 +429,12 @@ class Module(object):
         """
 
         logger.log('DEBUG', f'Saving results to database')
-        lock.acquire()
-        db = Database()
-        db.create_table(self.domain)
-        db.save_db(self.domain, self.results, self.source)
-        db.close()
-        lock.release()
+        # 被取消的模块不再写入结果 避免迟到的结果与后续解析阶段竞争
+        with self.cancel_token.fence():
+            if self.cancel_token.cancelled:
+                logger.log('ALERT', f'{self.source} module exceeded its time budget, '
+                                    f'dropped {len(self.results)} late results')
+                return
+            writer.insert(self.domain, self.results, self.source)
+            for callback in list(subscribers.get(self.domain, list())):
+                callback(self.results)
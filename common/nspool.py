@@ -0,0 +1,287 @@
+"""
+Health scoring of the resolvers and the ranked nameservers file of each run
+"""
+
+import os
+import re
+import json
+import atexit
+import secrets
+import asyncio
+import threading
+import statistics
+
+from common import massdns
+from common.dnsengine import DNSEngine, RETRY_RCODES, read_nameservers
+from config import settings
+from config.log import logger
+
+KEYS = ('answered', 'timeout', 'error', 'hijack')
+ADDRESS_RE = re.compile(r'(\d{1,3}(?:\.\d{1,3}){3}):(\d{1,5})')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def to_address(nameserver):
+    return f'{nameserver[0]}:{nameserver[1]}'
+
+
+def remove_file(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def get_resolver(line):
+    """
+    Get the resolver and the status of a massdns JSON line without decoding it
+
+    :param str line: JSON line
+    :return tuple: (`ip:port` of the resolver, status) or (None, None)
+    """
+    start = line.rfind('"resolver":"')
+    if start < 0:
+        return None, None
+    start += 12
+    address = line[start:line.find('"', start)]
+    start = line.find('"status":"')
+    if start < 0:
+        return address, None
+    start += 10
+    return address, line[start:line.find('"', start)]
+
+
+class ResolverPool(object):
+    """
+    Health of the resolvers collected from benchmarks and resolution runs
+
+    The counts of every resolver and of the addresses returned for
+    nonexistent names are kept in a JSON file and halved when loaded, so the
+    behaviour of earlier runs fades out. A resolver is dropped when its rate
+    of answers with such addresses is above resolver_max_hijack_rate or its
+    success rate is below resolver_min_success_rate, the others are ranked
+    by their success rate and then by their median response time.
+
+    :param path: stats file path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = dict()  # ip:port -> counts and median response milliseconds
+        self.hijack_ips = dict()  # 劫持不存在子域时返回的IP -> 出现次数
+        self.checked = set()  # 本进程已测试的名称服务器文件
+        self.lock = threading.Lock()
+        self.check_lock = threading.Lock()
+        self.load()
+
+    def get_stat(self, address):
+        stat = self.stats.get(address)
+        if stat is None:
+            stat = dict.fromkeys(KEYS, 0)
+            stat['rtt'] = None
+            self.stats[address] = stat
+        return stat
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            logger.log('DEBUG', f'Ignored resolver stats {self.path}: {e}')
+            return
+        hijack_ips = data.get('hijack_ips')
+        if isinstance(hijack_ips, dict):
+            self.hijack_ips = {ip: count // 2 for ip, count in hijack_ips.items()
+                               if count // 2}
+        for address, counts in data.get('resolvers', dict()).items():
+            stat = self.get_stat(address)
+            for key in KEYS:
+                stat[key] = counts.get(key, 0) // 2
+            stat['rtt'] = counts.get('rtt')
+
+    def save(self):
+        with self.lock:
+            text = json.dumps({'hijack_ips': self.hijack_ips,
+                               'resolvers': self.stats}, indent=4)
+        temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            temp_path.write_text(text)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.log('ERROR', f'Error saving resolver stats {self.path}: {e}')
+
+    def add(self, address, key, count=1):
+        with self.lock:
+            self.get_stat(address)[key] += count
+
+    async def check(self, engine, nameserver, name, exist):
+        """
+        Query a name through a resolver and judge the response
+
+        :param engine: opened DNSEngine
+        :param tuple nameserver: (ip, port)
+        :param str name: query name
+        :param bool exist: whether the name exists
+        :return tuple: (nameserver, count key, response milliseconds)
+        """
+        start = asyncio.get_event_loop().time()
+        response = await engine.send(name, 1, nameserver)
+        rtt = (asyncio.get_event_loop().time() - start) * 1000
+        if response is None:
+            return nameserver, 'timeout', None
+        rcode, answers = response
+        if rcode in RETRY_RCODES:
+            return nameserver, 'error', rtt
+        ips = {answer['data'] for answer in answers if answer['type'] == 'A'}
+        if exist:
+            return nameserver, 'answered' if ips else 'error', rtt
+        if ips:
+            logger.log('ALERT', f'Resolver {to_address(nameserver)} answered '
+                                f'nonexistent {name} with {ips}')
+            with self.lock:
+                for ip in ips:
+                    self.hijack_ips[ip] = self.hijack_ips.get(ip, 0) + 1
+            return nameserver, 'hijack', rtt
+        return nameserver, 'answered', rtt
+
+    async def check_all(self, nameservers):
+        engine = DNSEngine(nameservers, timeout=settings.resolver_check_timeout, retries=1)
+        await engine.open()
+        tasks = list()
+        try:
+            for nameserver in nameservers:
+                for name in settings.resolver_check_names:
+                    tasks.append(self.check(engine, nameserver, name, True))
+                for _ in range(settings.resolver_check_nx_count):
+                    name = f'{secrets.token_hex(6)}.{settings.resolver_check_nx_domain}'
+                    tasks.append(self.check(engine, nameserver, name, False))
+            return await asyncio.gather(*tasks)
+        finally:
+            engine.close()
+
+    def benchmark(self, nameservers):
+        """
+        Query known names and random nonexistent names through every resolver
+
+        :param list nameservers: (ip, port) tuples
+        """
+        logger.log('INFOR', f'Checking {len(nameservers)} resolvers')
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(self.check_all(nameservers))
+        finally:
+            loop.close()
+        rtts = dict()
+        with self.lock:
+            for nameserver, key, rtt in results:
+                address = to_address(nameserver)
+                self.get_stat(address)[key] += 1
+                if rtt is not None:
+                    rtts.setdefault(address, list()).append(rtt)
+            for address, values in rtts.items():
+                self.stats[address]['rtt'] = round(statistics.median(values), 1)
+
+    def record(self, line):
+        """
+        Count an answer of a resolution run against its resolver
+
+        :param str line: massdns JSON line
+        """
+        address, status = get_resolver(line)
+        if address is None:
+            return
+        key = 'error' if status in ('SERVFAIL', 'REFUSED') else 'answered'
+        if self.hijack_ips and status == 'NOERROR':
+            records = massdns.parse_line(line)[3] or list()
+            if any(ip in self.hijack_ips for _, ip, _ in records):
+                key = 'hijack'
+        self.add(address, key)
+
+    def read_log(self, log_path, offset=0):
+        """
+        Count the errors of the resolvers written to the massdns error log
+
+        :param log_path: error log file
+        :param int offset: start offset of this run in the log
+        """
+        try:
+            with open(log_path, errors='ignore') as log:
+                log.seek(offset)
+                for line in log:
+                    for ip, port in set(ADDRESS_RE.findall(line)):
+                        self.add(f'{ip}:{port}', 'error')
+        except OSError as e:
+            logger.log('DEBUG', f'Error reading {log_path}: {e}')
+
+    def rank(self, nameservers):
+        """
+        Rank the resolvers and drop the unhealthy ones
+
+        :param list nameservers: (ip, port) tuples
+        :return list: healthy (ip, port) tuples, the best first
+        """
+        ranked = list()
+        with self.lock:
+            for nameserver in nameservers:
+                stat = self.stats.get(to_address(nameserver)) or dict()
+                total = sum(stat.get(key, 0) for key in KEYS)
+                rate = stat.get('answered', 0) / total if total else 1.0
+                hijack_rate = stat.get('hijack', 0) / total if total else 0.0
+                if hijack_rate > settings.resolver_max_hijack_rate or \
+                        rate < settings.resolver_min_success_rate:
+                    logger.log('DEBUG', f'Dropped resolver {to_address(nameserver)}: {stat}')
+                    continue
+                rtt = stat.get('rtt')
+                ranked.append((-round(rate, 2), float('inf') if rtt is None else rtt,
+                               nameserver))
+        ranked.sort(key=lambda item: item[:2])
+        return [nameserver for _, _, nameserver in ranked]
+
+    def get_path(self, path):
+        """
+        Get the ranked and pruned nameservers file of this run
+
+        :param path: candidate nameservers file
+        :return: nameservers file path
+        """
+        nameservers = read_nameservers(path)
+        if not nameservers:
+            return path
+        with self.check_lock:
+            if str(path) not in self.checked:
+                self.checked.add(str(path))
+                self.benchmark(nameservers)
+                self.save()
+        healthy = self.rank(nameservers)
+        if not healthy:
+            logger.log('ALERT', 'No healthy resolver, using all resolvers of '
+                                f'{path}')
+            return path
+        logger.log('INFOR', f'Using {len(healthy)} of {len(nameservers)} resolvers')
+        settings.temp_save_dir.mkdir(parents=True, exist_ok=True)
+        ranked_path = settings.temp_save_dir.joinpath(f'resolvers_{os.getpid()}.txt')
+        if not ranked_path.exists():
+            atexit.register(remove_file, ranked_path)
+        ranked_path.write_text('\n'.join(map(to_address, healthy)) + '\n')
+        return ranked_path
+
+
+def get_resolver_pool():
+    """
+    Get the process-wide ResolverPool
+
+    :return: ResolverPool object or None when the resolver check is disabled
+    """
+    global _pool
+    if not settings.enable_resolver_check:
+        return None
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            settings.result_save_dir.mkdir(parents=True, exist_ok=True)
+            _pool = ResolverPool(settings.result_save_dir.joinpath('resolver_stats.json'))
+    return _pool
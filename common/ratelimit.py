@@ -0,0 +1,158 @@
+"""
+Per-source rate limiters of the collection modules
+"""
+
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+from config import settings
+from config.log import logger
+
+_limiters = dict()
+_limiters_lock = threading.Lock()
+
+
+def parse_retry_after(value, now):
+    """
+    Parse the Retry-After header
+
+    :param str value: seconds or HTTP date
+    :param float now: current timestamp
+    :return: seconds to wait or None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except Exception:
+        return None
+
+
+def parse_reset(value, now):
+    """
+    Parse the X-RateLimit-Reset header which is either a timestamp or seconds
+
+    :param str value: header value
+    :param float now: current timestamp
+    :return: seconds to wait or None
+    """
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset > 1e9:  # Unix时间戳
+        reset -= now
+    return max(0.0, reset)
+
+
+class TokenBucket(object):
+    """
+    Token bucket shared by all requests to one source
+
+    Requests reserve their slot under the lock and sleep outside it, so
+    threads of many targets querying the same source are paced together.
+    The rate halves on 429 responses and recovers slowly on normal ones,
+    and Retry-After or exhausted X-RateLimit-* headers block the bucket
+    until the server allows requests again.
+
+    :param str source: source name
+    :param float rate: requests per second
+    :param int burst: requests allowed at once
+    """
+
+    def __init__(self, source, rate, burst):
+        self.source = source
+        self.base_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.next_time = 0.0  # 下一个请求最早可以发出的时间
+        self.blocked_until = 0.0  # 服务端要求暂停请求到此时间
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Reserve a slot for one request
+
+        :return float: seconds to wait before sending the request
+        """
+        with self.lock:
+            now = time.time()
+            interval = 1 / self.rate
+            start = max(self.next_time, now - (self.burst - 1) * interval,
+                        self.blocked_until)
+            self.next_time = start + interval
+            return max(0.0, start - now)
+
+    def acquire(self, token=None):
+        """
+        Wait until a request may be sent
+
+        :param token: CancelToken aborting the wait
+        :return bool: False if the wait was cancelled
+        """
+        wait = self.reserve()
+        if not wait:
+            return True
+        logger.log('TRACE', f'{self.source} rate limiter waits {wait:.2f} seconds')
+        if token is None:
+            time.sleep(wait)
+            return True
+        return not token.sleep(wait)
+
+    def update(self, resp):
+        """
+        Adapt to the rate limit information of a response
+
+        :param resp: response object
+        :return bool: whether the request was rejected and should be retried
+        """
+        now = time.time()
+        headers = resp.headers
+        retry_after = parse_retry_after(headers.get('Retry-After'), now)
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = parse_reset(headers.get('X-RateLimit-Reset'), now)
+        with self.lock:
+            if resp.status_code == 429:
+                self.rate = max(self.min_rate, self.rate / 2)
+                if retry_after is None:
+                    retry_after = reset if reset is not None else 1 / self.rate
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                logger.log('ALERT', f'{self.source} is rate limited, '
+                                    f'waiting {retry_after:.1f} seconds')
+                return True
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            elif remaining is not None and remaining.strip() == '0' and reset is not None:
+                self.blocked_until = max(self.blocked_until, now + reset)
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 16)
+        return False
+
+
+def get_limiter(source, delay):
+    """
+    Get the process-wide rate limiter of a source
+
+    :param str source: source name
+    :param float delay: default seconds between two requests of the source
+    :return: TokenBucket object
+    """
+    limiter = _limiters.get(source)
+    if limiter is not None:
+        return limiter
+    with _limiters_lock:
+        limiter = _limiters.get(source)
+        if limiter is None:
+            rate = settings.source_rate_limits.get(source)
+            if not rate:
+                rate = 1 / delay if delay else settings.source_default_rate
+            # 多进程并行处理目标时各进程平分数据源的请求速率
+            rate /= settings.target_worker_count
+            limiter = TokenBucket(source, rate, settings.rate_limit_burst)
+            _limiters[source] = limiter
+    return limiter
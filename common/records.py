@@ -351,6 +351,24 @@ class Connection(object):
 
         self._conn.execute(text(query), *multiparams)
 
+    def transaction(self):
+        """Begin a transaction which commits when used as a context
+        manager exits normally and rolls back otherwise."""
+
+        return self._conn.begin()
+
+    def iter_query(self, query, **params):
+        """Executes the given SQL query and yields raw row tuples from the
+        cursor one by one, without caching them in a RecordCollection.
+        """
+
+        cursor = self._conn.execute(text(query), **params)
+        try:
+            for row in cursor:
+                yield tuple(row)
+        finally:
+            cursor.close()
+
 
 def _reduce_datetimes(row):
     """Receives a row, converts datetimes to strings."""
@@ -8,7 +8,8 @@ from bs4 import BeautifulSoup
 
 from common import utils
 from config.log import logger
-from common.database import Database
+from common.database import writer
+from common.result import to_result
 from config import settings
 
 
@@ -18,6 +19,8 @@ def req_thread_count():
         count = max(16, count)
     else:
         count = utils.get_request_count()
+    # 多进程并行处理目标时各进程平分请求线程数
+    count = max(1, count // settings.target_worker_count)
     logger.log('DEBUG', f'Number of request threads {count}')
     return count
 
@@ -53,7 +56,7 @@ def gen_req_url(domain, port):
 
 
 def gen_req_data(data, ports):
-    logger.log('INFOR', 'Generating request urls')
+    logger.log('DEBUG', 'Generating request urls')
     req_data = list()
     req_urls = set()
     for info in data:
@@ -61,13 +64,12 @@ def gen_req_data(data, ports):
         # 解析不成功的子域不进行http请求探测
         if resolve != 1:
             continue
+        info = to_result(info)
         subdomain = info.get('subdomain')
         for port in ports:
-            tmp_info = info.copy()
-            tmp_info['port'] = port
+            # 各端口的结果共享同一份子域数据
             url = gen_req_url(subdomain, port)
-            tmp_info['url'] = url
-            req_data.append(tmp_info)
+            req_data.append(info.derive(port, url))
             req_urls.add(url)
     return req_data, req_urls
 
@@ -196,24 +198,31 @@ def gen_new_info(info, resp):
     return info
 
 
-def save(name, total, req_data, resp_queue):
-    db = Database()
-    db.create_table(name)
+def save(name, total, req_data, resp_queue, store=None):
+    batch_size = settings.database_writer_batch_size
+    rows = list()
     i = 0
-    while True:
-        if not resp_queue.empty():
-            i += 1
-            index, resp = resp_queue.get()
-            old_info = req_data[index]
-            new_info = gen_new_info(old_info, resp)
-            db.insert_table(name, new_info)
-            resp_queue.task_done()
-        if i >= total:  # 得存入完所有请求结果才能结束
-            break
-    db.close()
+    while i < total:  # 得存入完所有请求结果才能结束
+        index, resp = resp_queue.get()
+        i += 1
+        old_info = req_data[index]
+        new_info = gen_new_info(old_info, resp)
+        rows.append(new_info)
+        resp_queue.task_done()
+        if len(rows) >= batch_size:
+            save_rows(name, rows, store)
+            rows = list()
+    save_rows(name, rows, store)
+
+
+def save_rows(name, rows, store=None):
+    if store is not None:
+        store.insert(rows)
+    else:
+        writer.insert(name, rows, 'request')
 
 
-def bulk_request(domain, req_data, ret=False):
+def bulk_request(domain, req_data, ret=False, store=None):
     logger.log('INFOR', 'Requesting urls in bulk')
     resp_queue = Queue()
     urls_queue = Queue()
@@ -240,19 +249,21 @@ def bulk_request(domain, req_data, ret=False):
         urls_queue.join()
         return resp_queue
     save_thread = Thread(target=save, name=f'SaveThread',
-                         args=(domain, task_count, req_data, resp_queue), daemon=True)
+                         args=(domain, task_count, req_data, resp_queue, store),
+                         daemon=True)
     save_thread.start()
     urls_queue.join()
     save_thread.join()
 
 
-def run_request(domain, data, port):
+def run_request(domain, data, port, store=None):
     """
     HTTP request entrance
 
     :param  str domain: domain to be requested
     :param  list data: subdomains data to be requested
     :param  any port: range of ports to be requested
+    :param  store: in-memory result store (default None save into database)
     :return list: result
     """
     logger.log('INFOR', f'Start requesting subdomains of {domain}')
@@ -264,6 +275,9 @@ def run_request(domain, data, port):
     req_data, req_urls = gen_req_data(data, ports)
     # req_data: [{'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'http://saucer-man.com', 'subdomain': 'saucer-man.com', 'port': 80, 'level': 0, 'cname': 'saucer-man.com.w.kunlungr.com', 'ip': '58.218.215.165', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '60', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '149.112.112.112:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'https://saucer-man.com', 'subdomain': 'saucer-man.com', 'port': 443, 'level': 0, 'cname': 'saucer-man.com.w.kunlungr.com', 'ip': '58.218.215.165', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '60', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '149.112.112.112:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'http://ai2.saucer-man.com', 'subdomain': 'ai2.saucer-man.com', 'port': 80, 'level': 1, 'cname': 'ai2.saucer-man.com', 'ip': '42.192.189.2', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '64.6.65.6:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'https://ai2.saucer-man.com', 'subdomain': 'ai2.saucer-man.com', 'port': 443, 'level': 1, 'cname': 'ai2.saucer-man.com', 'ip': '42.192.189.2', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '64.6.65.6:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'http://ai.saucer-man.com', 'subdomain': 'ai.saucer-man.com', 'port': 80, 'level': 1, 'cname': 'ai.saucer-man.com', 'ip': '8.219.203.196', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '1.0.0.19:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'https://ai.saucer-man.com', 'subdomain': 'ai.saucer-man.com', 'port': 443, 'level': 1, 'cname': 'ai.saucer-man.com', 'ip': '8.219.203.196', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '1.0.0.19:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'http://www.saucer-man.com', 'subdomain': 'www.saucer-man.com', 'port': 80, 'level': 1, 'cname': 'www.saucer-man.com', 'ip': '106.52.169.251', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '4.2.2.3:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'https://www.saucer-man.com', 'subdomain': 'www.saucer-man.com', 'port': 443, 'level': 1, 'cname': 'www.saucer-man.com', 'ip': '106.52.169.251', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '4.2.2.3:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'http://ai3.saucer-man.com', 'subdomain': 'ai3.saucer-man.com', 'port': 80, 'level': 1, 'cname': 'ai3.saucer-man.com', 'ip': '42.192.189.2', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '64.6.64.6:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}, {'id': None, 'alive': None, 'request': None, 'resolve': 1, 'url': 'https://ai3.saucer-man.com', 'subdomain': 'ai3.saucer-man.com', 'port': 443, 'level': 1, 'cname': 'ai3.saucer-man.com', 'ip': '42.192.189.2', 'public': None, 'cdn': None, 'status': None, 'reason': 'OK', 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': '600', 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': '64.6.64.6:53', 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 1.2, 'find': 6}]
     # req_urls: {'http://ai.saucer-man.com', 'http://ai3.saucer-man.com', 'http://saucer-man.com', 'https://saucer-man.com', 'https://ai3.saucer-man.com', 'http://www.saucer-man.com', 'https://www.saucer-man.com', 'https://ai.saucer-man.com', 'http://ai2.saucer-man.com', 'https://ai2.saucer-man.com'}
-    bulk_request(domain, req_data)  # 对生成的url进行requests访问，然后将结果保存在sql中
-    count = utils.count_alive(domain) #
+    bulk_request(domain, req_data, store=store)  # 对生成的url进行requests访问，然后将结果保存在sql中
+    if store is not None:
+        count = store.count_alive()
+    else:
+        count = utils.count_alive(domain)
     logger.log('INFOR', f'Found that {domain} has {count} alive subdomains')
@@ -0,0 +1,172 @@
+"""
+Compact result records of the subdomain pipeline
+"""
+
+# 结果表的全部字段 顺序与数据库表一致
+FIELDS = ('id', 'alive', 'request', 'resolve', 'url', 'subdomain', 'port',
+          'level', 'cname', 'ip', 'public', 'cdn', 'status', 'reason', 'title',
+          'banner', 'header', 'history', 'response', 'ip_times', 'cname_times',
+          'ttl', 'cidr', 'asn', 'org', 'addr', 'isp', 'resolver', 'module',
+          'source', 'elapse', 'find')
+# 每个端口各自的字段 其余字段由同一子域的各端口结果共享
+PORT_FIELDS = ('id', 'alive', 'request', 'url', 'port', 'cdn', 'status',
+               'reason', 'title', 'banner', 'header', 'history', 'response')
+SUBDOMAIN_FIELDS = tuple(field for field in FIELDS if field not in PORT_FIELDS)
+_port_fields = frozenset(PORT_FIELDS)
+_subdomain_fields = frozenset(SUBDOMAIN_FIELDS)
+
+
+class SubdomainData(object):
+    """
+    Fields shared by the results of all ports of one subdomain
+    """
+    __slots__ = SUBDOMAIN_FIELDS
+
+    def __init__(self):
+        for field in SUBDOMAIN_FIELDS:
+            setattr(self, field, None)
+
+    def copy(self):
+        data = SubdomainData.__new__(SubdomainData)
+        for field in SUBDOMAIN_FIELDS:
+            setattr(data, field, getattr(self, field))
+        return data
+
+
+class Result(object):
+    """
+    Result row of one url which behaves like the dict of the row
+
+    The per-port fields live in the slots of the row and the per-subdomain
+    fields in a SubdomainData object shared by the rows generated from the
+    same subdomain, so the request stage does not copy the whole row for
+    every port. Rows are converted to dicts only when written out.
+
+    >>> row = Result(subdomain='www.example.com', ip='1.1.1.1')
+    >>> https = row.derive(443, 'https://www.example.com')
+    >>> row['ip'] = '2.2.2.2'
+    >>> https['ip'], https['port'], row['port']
+    ('2.2.2.2', 443, None)
+
+    :param fields: initial fields of the row
+    """
+    __slots__ = PORT_FIELDS + ('data',)
+
+    def __init__(self, **fields):
+        for field in PORT_FIELDS:
+            setattr(self, field, None)
+        self.data = SubdomainData()
+        self.update(fields)
+
+    @classmethod
+    def from_dict(cls, info):
+        """
+        Make a row from a dict
+
+        :param dict info: row dict
+        :return: Result object
+        """
+        return cls(**info)
+
+    def derive(self, port, url):
+        """
+        Make the row of another port sharing the subdomain data of this row
+
+        :param int port: port
+        :param str url: url of the port
+        :return: Result object
+        """
+        row = Result.__new__(Result)
+        for field in PORT_FIELDS:
+            setattr(row, field, getattr(self, field))
+        row.data = self.data
+        row.port = port
+        row.url = url
+        return row
+
+    def copy(self):
+        row = self.derive(self.port, self.url)
+        row.data = self.data.copy()
+        return row
+
+    def __getitem__(self, key):
+        if key in _port_fields:
+            return getattr(self, key)
+        if key in _subdomain_fields:
+            return getattr(self.data, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _port_fields:
+            setattr(self, key, value)
+        elif key in _subdomain_fields:
+            setattr(self.data, key, value)
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _port_fields:
+            return getattr(self, key)
+        if key in _subdomain_fields:
+            return getattr(self.data, key)
+        return default
+
+    def update(self, other=(), **fields):
+        if hasattr(other, 'keys'):
+            for key in other.keys():
+                self[key] = other[key]
+        else:
+            for key, value in other:
+                self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+
+    def __contains__(self, key):
+        return key in _port_fields or key in _subdomain_fields
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def keys(self):
+        return FIELDS
+
+    def values(self):
+        return [self[field] for field in FIELDS]
+
+    def items(self):
+        return [(field, self[field]) for field in FIELDS]
+
+    def to_dict(self):
+        return {field: self[field] for field in FIELDS}
+
+    def __repr__(self):
+        return f'Result({self.to_dict()!r})'
+
+
+def to_result(row):
+    """
+    Get the Result of a row which is either a Result or a dict
+
+    :param row: Result object or dict
+    :return: Result object
+    """
+    if isinstance(row, Result):
+        return row
+    return Result.from_dict(row)
+
+
+def to_results(rows):
+    return [to_result(row) for row in rows]
+
+
+def to_dicts(rows):
+    """
+    Convert rows to dicts for writing them out
+
+    :param list rows: Result objects or dicts
+    :return list: dicts
+    """
+    return [row.to_dict() if isinstance(row, Result) else row for row in rows]
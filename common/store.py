@@ -0,0 +1,87 @@
+"""
+In-memory result store shared by the pipeline stages of one domain
+"""
+
+import threading
+
+from common import utils
+from config.log import logger
+
+
+class ResultStore(object):
+    """
+    Hold the result rows of one domain in memory
+
+    The resolve, request, finder, altdns and enrich stages read and annotate
+    the rows here, and the rows are written into the database only once
+    by save().
+
+    :param str name: table name
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = list()
+        self.urls = dict()  # url -> rows
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def insert(self, rows):
+        """
+        Add rows into the store
+
+        :param list rows: result rows
+        """
+        with self.lock:
+            for row in rows:
+                self.rows.append(row)
+                self.urls.setdefault(row.get('url'), list()).append(row)
+
+    def iter_resp_data(self):
+        """
+        Iterate over the url, history and response of all rows
+
+        :return: generator of (url, history, response) tuples
+        """
+        for row in self.rows[:]:
+            yield row.get('url'), row.get('history'), row.get('response')
+
+    def get_data_by_fields(self, fields):
+        """
+        Get specified fields of all rows
+
+        :param list fields: field names
+        :return list: dicts holding the fields
+        """
+        return [{field: row.get(field) for field in fields} for row in self.rows]
+
+    def bulk_update(self, key, rows):
+        """
+        Update rows located by the key field
+
+        :param str key: field used to locate rows
+        :param list rows: dicts holding the key and the fields to be updated
+        """
+        if key == 'url':
+            index = self.urls
+        else:
+            index = dict()
+            for row in self.rows:
+                index.setdefault(row.get(key), list()).append(row)
+        with self.lock:
+            for info in rows:
+                fields = {field: value for field, value in info.items() if field != key}
+                for row in index.get(info.get(key), list()):
+                    row.update(fields)
+
+    def count_alive(self):
+        return utils.calc_alive(self.rows)
+
+    def save(self):
+        """
+        Write all rows into the database table of the store
+        """
+        logger.log('INFOR', f'Saving {len(self.rows)} pipeline results of {self.name}')
+        utils.save_to_db(self.name, self.rows, 'pipeline')
@@ -52,7 +52,7 @@ import re
 import json
 import collections
 from urllib.parse import scheme_chars
-from functools import wraps
+from functools import wraps, lru_cache
 
 import idna
 
@@ -118,14 +118,20 @@ class ExtractResult(collections.namedtuple('ExtractResult', 'subdomain domain su
 class TLDExtract(object):
     """A callable for extracting, subdomain, domain, and suffix components from a URL."""
 
-    def __init__(self, cache_file=None):
+    def __init__(self, cache_file=None, cache_size=None):
         """
         Constructs a callable for extracting subdomain, domain, and suffix
         components from a URL.
+
+        :param cache_file: path of the public suffix list json file
+        :param cache_size: size of the LRU of recent extractions (None disables it)
         """
 
         self.cache_file = os.path.expanduser(cache_file or '')
         self._extractor = None
+        self._extract = self._extract_url
+        if cache_size:
+            self._extract = lru_cache(maxsize=cache_size)(self._extract_url)
 
     def __call__(self, url):
         """
@@ -138,6 +144,26 @@ class TLDExtract(object):
         >>> ext('http://forums.bbc.co.uk/')
         ExtractResult(subdomain='forums', domain='bbc', suffix='co.uk')
         """
+        return self._extract(url)
+
+    def extract_many(self, urls):
+        """
+        Extract a batch of URLs with the same extractor
+
+        >>> ext = TLDExtract()
+        >>> [r.registered_domain for r in ext.extract_many(['www.cnn.com', 'bbc.co.uk'])]
+        ['cnn.com', 'bbc.co.uk']
+        """
+        extract = self._extract
+        return [extract(url) for url in urls]
+
+    def cache_info(self):
+        """Returns the LRU statistics of recent extractions or None."""
+        if hasattr(self._extract, 'cache_info'):
+            return self._extract.cache_info()
+        return None
+
+    def _extract_url(self, url):
         netloc = SCHEME_RE.sub("", url) \
             .partition("/")[0] \
             .partition("?")[0] \
@@ -201,32 +227,65 @@ def extract(url):
     return TLD_EXTRACTOR(url)
 
 
+class _SuffixTrieNode(object):
+    """A node of the label-reversed public suffix trie."""
+
+    __slots__ = ('children', 'terminal', 'exception')
+
+    def __init__(self):
+        self.children = dict()
+        self.terminal = False
+        self.exception = False
+
+
 class _PublicSuffixListTLDExtractor(object):
     """Wrapper around this project's main algo for PSL
     lookups.
+
+    The suffix rules are stored in a trie keyed by labels from right to
+    left, so a lookup walks at most as many nodes as the name has labels.
     """
     def __init__(self, tlds):
         self.tlds = frozenset(tlds)
+        self.root = _SuffixTrieNode()
+        for tld in self.tlds:
+            self._add_rule(tld)
+
+    def _add_rule(self, rule):
+        exception = rule.startswith('!')
+        if exception:
+            rule = rule[1:]
+        node = self.root
+        for label in reversed(rule.split('.')):
+            child = node.children.get(label)
+            if child is None:
+                child = _SuffixTrieNode()
+                node.children[label] = child
+            node = child
+        if exception:
+            node.exception = True
+        else:
+            node.terminal = True
 
     def suffix_index(self, lower_spl):
         """Returns the index of the first suffix label.
         Returns len(spl) if no suffix is found
         """
         length = len(lower_spl)
-        for i in range(length):
-            maybe_tld = '.'.join(lower_spl[i:])
-            exception_tld = '!' + maybe_tld
-            if exception_tld in self.tlds:
-                return i + 1
-
-            if maybe_tld in self.tlds:
-                return i
-
-            wildcard_tld = '*.' + '.'.join(lower_spl[i + 1:])
-            if wildcard_tld in self.tlds:
-                return i
-
-        return length
+        index = length
+        node = self.root
+        for i in range(length - 1, -1, -1):
+            child = node.children.get(lower_spl[i])
+            if child is not None and child.exception:
+                index = i + 1
+            elif child is not None and child.terminal:
+                index = i
+            elif '*' in node.children:
+                index = i
+            if child is None:
+                break
+            node = child
+        return index
 
 
 def _decode_punycode(label):
@@ -3,10 +3,12 @@ import re
 import sys
 import time
 import json
+import codecs
 import socket
 import random
 import string
 import platform
+import threading
 import subprocess
 from urllib.parse import scheme_chars
 from ipaddress import IPv4Address, ip_address
@@ -20,7 +22,10 @@ from dns.resolver import Resolver
 
 from common.database import Database
 from common.domain import Domain
+from common.matcher import get_subdomain_matcher
+from common.nspool import get_resolver_pool
 from common.records import Record, RecordCollection
+from common.result import to_results
 from config import settings
 from config.log import logger
 
@@ -224,6 +229,51 @@ def load_json(path):
         return json.load(fp)
 
 
+def iter_json_array(chunks):
+    """
+    Incrementally parse the items of a JSON array from text chunks
+
+    Only the unparsed tail of the text is buffered, so memory is bounded by
+    the largest item instead of the whole array.
+
+    :param chunks: iterable of text chunks
+    :return: generator of array items
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        end = len(buffer)
+        while True:
+            while pos < end and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= end:
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('JSON text is not an array')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, item_end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                break  # 元素不完整 等待后续数据
+            if not isinstance(item, (dict, list)):
+                # 数字等标量只有在后面出现分隔符时才确定完整
+                if item_end == end or buffer[item_end] not in ' \t\r\n,]':
+                    break
+            yield item
+            pos = item_end
+        buffer = buffer[pos:]
+    if buffer.strip():
+        raise ValueError('JSON array is truncated')
+
+
 def save_to_db(name, data, module):
     """
     Save request results to database
@@ -585,31 +635,90 @@ def get_main_domain(domain):
     return Domain(domain).registered()
 
 
-def call_massdns(massdns_path, dict_path, ns_path, output_path, log_path,
-                 query_type='A', process_num=1, concurrent_num=10000,
-                 quiet_mode=False):
+def feed_names(stdin, names):
+    """
+    Write the names into the stdin of massdns and close it
+
+    :param stdin: stdin pipe
+    :param names: iterable of names
+    """
+    try:
+        batch = list()
+        for name in names:
+            batch.append(name)
+            if len(batch) >= 10000:
+                stdin.write('\n'.join(batch) + '\n')
+                batch = list()
+        if batch:
+            stdin.write('\n'.join(batch) + '\n')
+    except (BrokenPipeError, OSError) as e:
+        logger.log('DEBUG', f'massdns stopped reading names: {e}')
+    finally:
+        try:
+            stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def iter_massdns(massdns_path, names, ns_path, log_path, query_type='A',
+                 process_num=1, concurrent_num=10000, quiet_mode=False,
+                 negative=False):
+    """
+    Run massdns with the names fed through stdin and yield its output lines
+
+    :param massdns_path: massdns path
+    :param names: iterable of names to be resolved
+    :param ns_path: nameservers file
+    :param log_path: error log file
+    :param str query_type: query type
+    :param int process_num: massdns process number
+    :param int concurrent_num: max concurrent queries
+    :param bool quiet_mode: hide the progress
+    :param bool negative: also output the failed responses such as NXDOMAIN
+    :return: generator of JSON lines
+    """
     logger.log('DEBUG', 'Start running massdns')
-    quiet = ''
-    if quiet_mode:
-        quiet = '--quiet'
     status_format = settings.brute_status_format
     socket_num = settings.brute_socket_num
     resolve_num = settings.brute_resolve_num
-    cmd = f'{massdns_path} {quiet} --status-format {status_format} ' \
-          f'--processes {process_num} --socket-count {socket_num} ' \
-          f'--hashmap-size {concurrent_num} --resolvers {ns_path} ' \
-          f'--resolve-count {resolve_num} --type {query_type} ' \
-          f'--flush --output J --outfile {output_path} ' \
-          f'--root --error-log {log_path} {dict_path} --filter OK ' \
-          f'--sndbuf 0 --rcvbuf 0'
+    # 多进程并行处理目标时各进程平分并发查询数
+    concurrent_num = max(1, concurrent_num // settings.target_worker_count)
+    args = [str(massdns_path), '--status-format', status_format,
+            '--processes', str(process_num), '--socket-count', str(socket_num),
+            '--hashmap-size', str(concurrent_num), '--resolvers', str(ns_path),
+            '--resolve-count', str(resolve_num), '--type', query_type,
+            '--flush', '--output', 'J', '--root', '--error-log', str(log_path),
+            '--sndbuf', '0', '--rcvbuf', '0']
+    if not negative:
+        args.extend(['--filter', 'OK'])
+    if quiet_mode:
+        args.insert(1, '--quiet')
+    logger.log('DEBUG', f'Run command {" ".join(args)}')
+    # 子域通过管道输入 解析结果从管道读取 不再写入临时文件
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               universal_newlines=True, bufsize=1)
+    feeder = threading.Thread(target=feed_names, name='MassdnsFeeder',
+                              args=(process.stdin, names), daemon=True)
+    feeder.start()
+    try:
+        for line in process.stdout:
+            yield line
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.stdout.close()
+        process.wait()
+        feeder.join()
+        logger.log('DEBUG', f'Finished massdns')
 
-    # C:\Users\yanq\Documents\OneForAll\thirdparty\massdns\windows\x64\massdns.exe --quiet --status-format ansi --processes 1 --socket-count 1 --hashmap-size 10000 --resolvers C:\Users\yanq\Documents\OneForAll\data\nameservers.txt --resolve-count 15 --type A --flush --output J --outfile C:\Users\yanq\Documents\OneForAll\results\temp\resolved_result_saucer-man.com_20240111_171843.json --root --error-log C:\Users\yanq\Documents\OneForAll\results\massdns.log C:\Users\yanq\Documents\OneForAll\results\temp\collected_subdomains_saucer-man.com_20240111_171843.txt --filter OK --sndbuf 0 --rcvbuf 0
-    logger.log('DEBUG', f'Run command {cmd}')
-    subprocess.run(args=cmd, shell=True)
-    logger.log('DEBUG', f'Finished massdns')
 
+def find_massdns_path(massdns_dir):
+    """
+    Find the massdns of this platform
 
-def get_massdns_path(massdns_dir):
+    :param massdns_dir: massdns directory
+    :return: massdns path or None when there is no massdns for this platform
+    """
     path = settings.brute_massdns_path
     if path:
         return path
@@ -623,8 +732,15 @@ def get_massdns_path(massdns_dir):
         else:
             massdns_dir = massdns_dir.joinpath('windows', 'x86')
     path = massdns_dir.joinpath(name)
-    path.chmod(S_IXUSR)
     if not path.exists():
+        return None
+    path.chmod(S_IXUSR)
+    return path
+
+
+def get_massdns_path(massdns_dir):
+    path = find_massdns_path(massdns_dir)
+    if path is None:
         logger.log('FATAL', 'There is no massdns for this platform or architecture')
         logger.log('INFOR', 'Please try to compile massdns yourself '
                             'and specify the path in the configuration')
@@ -656,36 +772,16 @@ def match_subdomains(domain, html, distinct=True, fuzzy=True):
     Use regexp to match subdomains
 
     :param  str domain: main domain
-    :param  str html: response html text
+    :param  str html: response html text or bytes body
     :param  bool distinct: deduplicate results or not (default True)
     :param  bool fuzzy: fuzzy match subdomain or not (default True)
     :return set/list: result set or list
     """
     logger.log('TRACE', f'Use regexp to match subdomains in the response body')
-    if fuzzy:
-        regexp = r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.){0,}' \
-                 + domain.replace('.', r'\.')
-        result = re.findall(regexp, html, re.I)
-        if not result:
-            return set()
-        deal = map(lambda s: s.lower(), result)
-        if distinct:
-            return set(deal)
-        else:
-            return list(deal)
-    else:
-        regexp = r'(?:\>|\"|\'|\=|\,)(?:http\:\/\/|https\:\/\/)?' \
-                 r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.){0,}' \
-                 + domain.replace('.', r'\.')
-        result = re.findall(regexp, html, re.I)
+    result = get_subdomain_matcher(domain).find(html, distinct, fuzzy)
     if not result:
         return set()
-    regexp = r'(?:http://|https://)'
-    deal = map(lambda s: re.sub(regexp, '', s[1:].lower()), result)
-    if distinct:
-        return set(deal)
-    else:
-        return list(deal)
+    return result
 
 
 def check_random_subdomain(subdomains):
@@ -730,6 +826,20 @@ def decode_resp_text(resp):
     return content
 
 
+def iter_resp_text(resp, chunk_size=65536):
+    """
+    Decode a streamed response body chunk by chunk
+
+    :param resp: response object requested with stream=True
+    :param int chunk_size: bytes read at a time
+    :return: generator of text chunks
+    """
+    decoder = codecs.getincrementaldecoder(resp.encoding or 'utf-8')(errors='replace')
+    for chunk in resp.iter_content(chunk_size=chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
 def sort_by_subdomain(data):
     return sorted(data, key=lambda item: item.get('subdomain'))
 
@@ -760,25 +870,31 @@ def get_data(domain):
     db = Database()
     data = db.get_data(domain).as_dict()
     db.close()
-    return data
+    return to_results(data)
 
 
 def clear_data(domain):
     db = Database()
     db.drop_table(domain)
-    db.query("VACUUM")
     db.close()
 
 
+def get_pool_path(path):
+    pool = get_resolver_pool()
+    if pool is None:
+        return path
+    return pool.get_path(path)
+
+
 def get_ns_path(in_china=None, enable_wildcard=None, ns_ip_list=None):
     data_dir = settings.data_storage_dir
     path = data_dir.joinpath('nameservers.txt')
     if in_china:
         path = data_dir.joinpath('nameservers_cn.txt')
     if not enable_wildcard:
-        return path
+        return get_pool_path(path)
     if not ns_ip_list:
-        return path
+        return get_pool_path(path)
     path = settings.authoritative_dns_path
     ns_data = '\n'.join(ns_ip_list)
     save_to_file(path, ns_data)
@@ -26,6 +26,15 @@ enable_http_request = True  # 使用HTTP请求子域(默认True)
 enable_finder_module = True  # 开启finder模块,开启会从响应体和JS中再次发现子域(默认True)
 enable_altdns_module = True  # 开启altdns模块,开启会利用置换技术重组子域再次发现新子域(默认True)
 enable_enrich_module = True  # 开启enrich模块，开启会富化出信息，如ip的cdn，cidr，asn，org，addr和isp等信息
+# 开启内存流水线后解析、请求、finder、altdns和enrich阶段在内存中共享结果，只在最后写入一次数据库
+# 可以减少大目标的磁盘读写，但是所有响应体都会保留在内存中(默认False)
+enable_memory_pipeline = False
+# 开启流式流水线后收集模块每保存一次结果就立即解析和请求，并从响应中发现新子域，各阶段与收集同时进行
+# 结果保存在内存中，存在泛解析时自动关闭(默认False)
+enable_stream_pipeline = False
+stream_resolve_batch_size = 1000  # 流式流水线单次调用massdns解析的最大子域数(默认1000)
+stream_resolve_interval = 3.0  # 流式流水线凑齐一批待解析子域的最长等待时间(默认3秒)
+stream_queue_size = 10000  # 流式流水线待请求队列的最大长度(默认10000)
 enable_banner_identify = True  # 开启WEB指纹识别模块(默认True)
 enable_takeover_check = False  # 开启子域接管风险检查(默认False)
 # 参数可选值有 'small', 'medium', 'large'
@@ -43,7 +52,36 @@ enable_all_module = True  # 启用所有收集模块(默认True)
 enable_partial_module = []  # 启用部分收集模块 必须禁用enable_all_module才能生效
 # 只使用ask和baidu搜索引擎收集子域的示例
 # enable_partial_module = ['modules.search.ask', 'modules.search.baidu']
-module_thread_timeout = 90.0  # 每个收集模块线程超时时间(默认90秒)
+module_thread_timeout = 90.0  # 每个收集模块默认的时间预算，超时后模块被取消(默认90秒)
+# 单独设置某些收集模块的时间预算(秒)，键为模块文件名，例如 {'crtsh': 120.0}
+module_time_budgets = dict()
+collect_deadline = 180.0  # 收集阶段的总截止时间，到达后取消所有未完成的模块(默认180秒)
+# 开启后实现了异步入口的收集模块在同一个事件循环中运行并共享一个HTTP客户端的连接池(默认True)
+enable_async_collect = True
+async_client_pool_size = 64  # 异步收集模块共享HTTP客户端的请求线程数(默认64)
+# 收集模块按(协议, 主机, 代理)复用保持连接的会话
+session_pool_size = 16  # 每个会话的最大连接数(默认16)
+session_retry_count = 1  # 连接错误和502/503/504响应的重试次数(默认1)
+session_idle_timeout = 300.0  # 会话空闲多少秒后关闭(默认300秒)
+# 收集模块按数据源限速，键为模块source名，值为每秒请求数，例如 {'GitHubAPISearch': 0.5}
+# 未设置的数据源按模块的请求时延限速，遇到429响应和Retry-After、X-RateLimit-*响应头时自动放慢
+source_rate_limits = dict()
+source_default_rate = 10.0  # 请求时延为0的数据源每秒请求数(默认10)
+rate_limit_burst = 1  # 每个数据源允许连续发出的请求数(默认1)
+# 开启后收集模块的GET和POST响应压缩缓存在results/response_cache.sqlite3中，短时间内重复收集同一目标时直接读取缓存(默认False)
+enable_response_cache = False
+response_cache_ttl = 21600  # 响应缓存默认有效秒数(默认6小时)
+# 单独设置某些数据源的响应缓存有效秒数，键为模块source名，例如 {'CrtshQuery': 86400}
+response_cache_ttls = dict()
+response_cache_max_size = 1024  # 响应缓存最大占用空间MB，超出后删除最久未使用的响应(默认1024)
+response_cache_compress_level = 6  # 响应缓存zlib压缩级别(默认6)
+database_writer_batch_size = 1000  # 数据库写入线程单个事务最多合并的写入任务数(默认1000)
+database_busy_timeout = 30000  # 数据库被其他进程锁定时的最长等待毫秒数(默认30000)
+# 同时处理的目标主域数量(默认1)，大于1时使用多进程并行处理多个目标
+# 此时请求线程数和DNS并发查询数作为全局上限由各进程平分
+target_worker_count = 1
+domain_extract_cache_size = 65536  # 公共后缀提取结果的LRU缓存大小(默认65536，None则不缓存)
+enrich_ip_cache_size = 65536  # IP富化结果的LRU缓存大小(默认65536)
 
 # 爆破模块设置
 enable_wildcard_check = True  # 开启泛解析检测(默认True)
@@ -53,6 +91,26 @@ brute_status_format = 'ansi'  # 爆破时状态输出格式（默认asni，可
 brute_concurrent_num = 2000  # 并发查询数量(默认2000，最大推荐10000)
 brute_socket_num = 1  # 爆破时每个进程下的socket数量
 brute_resolve_num = 15  # 解析失败时尝试换名称服务器重查次数
+# DNS解析后端 massdns使用内置的massdns asyncio使用纯Python异步解析引擎
+# auto(默认)优先使用massdns 当前平台或架构没有massdns时使用asyncio
+resolve_backend = 'auto'
+dns_engine_timeout = 2.0  # asyncio解析引擎单次查询超时时间(默认2秒)
+# 开启DNS应答缓存 解析、爆破、altdns、finder和接管检查共用 缓存未过期的子域不再发送查询(默认True)
+enable_dns_cache = True
+# 开启后DNS应答缓存同时保存在results/dns_cache.sqlite3中，重复运行时复用(默认False)
+dns_cache_persist = False
+dns_cache_max_size = 1000000  # 内存中最多缓存的子域数量(默认1000000)
+dns_cache_max_ttl = 86400  # 肯定应答的最长缓存秒数 不超过应答TTL(默认1天)
+dns_cache_negative_ttl = 300  # NXDOMAIN和无应答等否定应答的缓存秒数(默认300秒)
+# 解析前测试名称服务器 剔除超时、出错和劫持不存在子域的名称服务器 并结合以往运行中各名称服务器的
+# 应答情况按成功率和响应时间排序 生成本次运行使用的名称服务器文件(默认True)
+enable_resolver_check = True
+resolver_check_names = ['www.baidu.com', 'www.qq.com', 'www.example.com']  # 测试时查询的已知存在的子域
+resolver_check_nx_domain = 'example.com'  # 在该未开启泛解析的主域下生成随机子域检查名称服务器是否劫持
+resolver_check_nx_count = 2  # 每个名称服务器查询的随机子域数量(默认2)
+resolver_check_timeout = 2.0  # 测试名称服务器时的查询超时时间(默认2秒)
+resolver_min_success_rate = 0.8  # 成功率低于该值的名称服务器将被剔除(默认0.8)
+resolver_max_hijack_rate = 0.2  # 应答中劫持IP的比例高于该值的名称服务器将被剔除(默认0.2)
 # 爆破所使用的字典路径(默认None则使用data/subdomains.txt，自定义字典请使用绝对路径)
 brute_wordlist_path = None
 use_china_nameservers = True  # 使用中国域名服务器 如果你所在网络不在中国则建议设置False
@@ -63,7 +121,6 @@ brute_recursive_depth = 2  # 递归爆破深度(默认2层)
 # 爆破下一层子域所使用的字典路径(默认None则使用data/subnames_next.txt，自定义字典请使用绝对路径)
 recursive_nextlist_path = None
 enable_check_dict = False  # 是否开启字典配置检查提示(默认False)
-delete_generated_dict = True  # 是否删除爆破时临时生成的字典(默认True)
 delete_massdns_result = True  # 是否删除爆破时massdns输出的解析结果 (默认True)
 only_save_valid = True  # 是否在处理爆破结果时只存入解析成功的子域
 check_time = 10  # 检查字典配置停留时间(默认10秒)
@@ -45,7 +45,6 @@ brute_recursive_depth = 2  # 递归爆破深度(默认2层)
 # 爆破下一层子域所使用的字典路径(默认None则使用data/subnames_next.txt，自定义字典请使用绝对路径)
 recursive_nextlist_path = None
 enable_check_dict = False  # 是否开启字典配置检查提示(默认False)
-delete_generated_dict = True  # 是否删除爆破时临时生成的字典(默认True)
 #  是否删除爆破时massdns输出的解析结果 (默认True)
 #  massdns输出的结果中包含更详细解析结果
 #  注意: 当爆破的字典较大或使用递归爆破或目标域名存在泛解析时生成的文件可能会很大
@@ -11,6 +11,7 @@ from modules import wildcard
 from common import utils
 from common import resolve
 from common import request
+from common import domain as domain_util
 from common.domain import Domain
 from common.module import Module
 from config.log import logger
@@ -27,11 +28,32 @@ def split_domain(domain):
     # test.example.co.uk -> [test, example.co.uk]
 
     ext = Domain(domain).extract()
+    return split_extract_result(ext)
+
+
+def split_extract_result(ext):
     subname = ext.subdomain
     parts = ext.subdomain.split('.') + [ext.registered_domain]
     return subname, parts
 
 
+def split_domains(domains):
+    """
+    Split a batch of domains with one pass over the public suffix extractor
+
+    :param domains: domains to be split
+    :return dict: domain -> (subname, parts)
+    """
+    domains = list(domains)
+    results = domain_util.extract_many(domains)
+    splits = dict()
+    for domain, ext in zip(domains, results):
+        if ext is None:
+            continue
+        splits[domain] = split_extract_result(ext)
+    return splits
+
+
 class Altdns(Module):
     def __init__(self, domain):
         Module.__init__(self)
@@ -41,6 +63,7 @@ class Altdns(Module):
         self.domain = domain
         self.words = set()
         self.now_subdomains = set()
+        self.now_splits = dict()  # 已有子域的拆分结果
         self.new_subdomains = set()
         self.wordlen = 6  # Min length of custom words extracted from domains
         self.num_count = 3
@@ -58,8 +81,7 @@ class Altdns(Module):
         Extend the dictionary based on target's domain naming conventions
         """
 
-        for subdomain in self.now_subdomains:
-            _, parts = split_domain(subdomain)
+        for _, parts in self.now_splits.values():
             tokens = set(itertools.chain(*[word.lower().split('-') for word in parts]))
             tokens = tokens.union({word.lower() for word in parts})
             for token in tokens:
@@ -183,8 +205,7 @@ class Altdns(Module):
         logger.log('DEBUG', f'The replace_word generated {count} subdomains')
 
     def gen_new_subdomains(self):
-        for subdomain in self.now_subdomains:
-            subname, parts = split_domain(subdomain)
+        for subname, parts in self.now_splits.values():
             subnames = subname.split('.')
             if settings.altdns_increase_num:
                 self.increase_num(subname)
@@ -199,9 +220,10 @@ class Altdns(Module):
         count = len(self.new_subdomains)
         logger.log('DEBUG', f'The altdns module generated {count} subdomains')
 
-    def run(self, data, port):
+    def run(self, data, port, store=None):
         logger.log('INFOR', f'Start altdns module')
         self.now_subdomains = utils.get_subdomains(data)
+        self.now_splits = split_domains(self.now_subdomains)
         self.get_words()
         self.extract_words()
         self.gen_new_subdomains()
@@ -213,4 +235,4 @@ class Altdns(Module):
         self.gen_result()
         resolved_data = resolve.run_resolve(self.domain, self.results)
         valid_data = wildcard.deal_wildcard(resolved_data)  # 强制开启泛解析处理
-        request.run_request(self.domain, valid_data, port)
+        request.run_request(self.domain, valid_data, port, store)
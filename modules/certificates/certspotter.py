@@ -1,15 +1,15 @@
-from common.query import Query
+from common.aioquery import AioQuery
 
 
-class CertSpotter(Query):
+class CertSpotter(AioQuery):
     def __init__(self, domain):
-        Query.__init__(self)
+        AioQuery.__init__(self)
         self.domain = domain
         self.module = 'Certificate'
         self.source = 'CertSpotterQuery'
         self.addr = 'https://api.certspotter.com/v1/issuances'
 
-    def query(self):
+    async def query(self):
         """
         向接口查询子域并做子域匹配
         """
@@ -18,20 +18,9 @@ class CertSpotter(Query):
         params = {'domain': self.domain,
                   'include_subdomains': 'true',
                   'expand': 'dns_names'}
-        resp = self.get(self.addr, params)
+        resp = await self.get(self.addr, params)
         self.subdomains = self.collect_subdomains(resp)
 
-    def run(self):
-        """
-        类执行入口
-        """
-        self.begin()
-        self.query()
-        self.finish()
-        self.save_json()
-        self.gen_result()
-        self.save_db()
-
 
 def run(domain):
     """
@@ -44,5 +33,15 @@ def run(domain):
     query.run()
 
 
+async def arun(domain):
+    """
+    类统一异步调用入口
+
+    :param str domain: 域名
+    """
+    query = CertSpotter(domain)
+    await query.arun()
+
+
 if __name__ == '__main__':
     run('example.com')
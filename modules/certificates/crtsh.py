@@ -1,6 +1,24 @@
+import re
+from functools import lru_cache
+
+from common import utils
 from common.query import Query
-import json
-import os
+from config import settings
+from config.log import logger
+
+NAME_RE = re.compile(r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.)+[a-z0-9\-]+')
+
+
+@lru_cache(maxsize=1)
+def load_wordlist():
+    """
+    Load the words used to expand wildcard names once per process
+
+    :return tuple: words
+    """
+    path = settings.data_storage_dir.joinpath('altdns_wordlist.txt')
+    with open(path, encoding='utf-8') as file:
+        return tuple(word for word in map(str.strip, file) if word)
 
 
 class Crtsh(Query):
@@ -11,6 +29,40 @@ class Crtsh(Query):
         self.source = 'CrtshQuery'
         self.addr = 'https://crt.sh/'
 
+    def get_names(self, resp):
+        """
+        从流式响应中逐条解析证书并得到去重后的名称
+        """
+        names = set()
+        try:
+            for item in utils.iter_json_array(utils.iter_resp_text(resp)):
+                if not isinstance(item, dict):
+                    continue
+                for field in ('name_value', 'common_name'):
+                    value = item.get(field)
+                    if value:
+                        names.update(value.lower().split('\n'))
+        except Exception as e:
+            logger.log('ERROR', f'Failed to parse the response of {self.source}: {e.args}')
+        finally:
+            resp.close()
+        return names
+
+    def expand_wildcard(self, name, words):
+        """
+        * > altdns
+
+        只展开属于主域的通配名称 并丢弃不合法的展开结果
+        """
+        if not name.endswith('.' + self.domain):
+            return list()
+        expanded = list()
+        for word in words:
+            subdomain = name.replace('*', word.lower())
+            if NAME_RE.fullmatch(subdomain):
+                expanded.append(subdomain)
+        return expanded
+
     def query(self):
         """
         向接口查询子域并做子域匹配
@@ -19,44 +71,19 @@ class Crtsh(Query):
         self.proxy = self.get_proxy(self.source)
         self.timeout = 120
         params = {'q': f'%.{self.domain}', 'output': 'json'}
-        resp = self.get(self.addr, params)
-        if not resp:
+        resp = self.get(self.addr, params, check=False, stream=True)
+        if resp is None:
             return
-        text = resp.text.replace(r'\n', ' ')
-        """
-        * > altdns
-        """
-        subDomains = set()
-        try:
-            jsonData = json.loads(text)
-        except Exception as e:
-            pass
-        for i in range(len(jsonData)):
-            try:
-                name_value = str(jsonData[i]['name_value'])
-            except Exception as e:
-                pass
-            if '*' in name_value:
-                try:
-                    if 'certificates' in os.path.dirname(os.path.abspath(__file__)):
-                        dictFile = open("../../data/altdns_wordlist.txt", "r", encoding='utf8')
-                    else:
-                        dictFile = open("./data/altdns_wordlist.txt", "r", encoding='utf8')
-                    for line in dictFile.readlines():
-                        altdns = line.strip()
-                        result = name_value.replace('*', altdns)
-                        if self.domain in result:
-                            subDomains.add(result)
-                except Exception as e:
-                    pass
-        if len(subDomains) > 0:
-            for x in subDomains:
-                text = text + ',' + x + ','
-        """
-        * > altdns end
-        """
-        subdomains = self.match_subdomains(text)
-        self.subdomains.update(subdomains)
+        if resp.status_code != 200:  # 正常响应时不读取整个响应体
+            utils.check_response('GET', resp)
+            resp.close()
+            return
+        names = self.get_names(resp)
+        self.subdomains.update(self.match_subdomains('\n'.join(names)))
+        words = load_wordlist()
+        for name in names:
+            if '*' in name:
+                self.subdomains.update(self.expand_wildcard(name, words))
 
     def run(self):
         """
@@ -1,6 +1,11 @@
+import time
+import asyncio
 import threading
 import importlib
 
+from common.cancel import CancelToken, set_token
+from common.cache import get_response_cache
+from common.client import get_connection_stats
 from config.log import logger
 from config import settings
 
@@ -10,6 +15,8 @@ class Collect(object):
         self.domain = domain
         self.modules = []
         self.collect_funcs = []
+        self.async_funcs = []
+        self.deadline = None  # 收集阶段的总截止时间
 
     def get_mod(self):
         """
@@ -34,9 +41,52 @@ class Collect(object):
         for module in self.modules:
             name = module.split('.')[-1]
             import_object = importlib.import_module(module)
+            # 实现了异步入口的模块放到同一个事件循环中运行
+            async_func = getattr(import_object, 'arun', None)
+            if settings.enable_async_collect and async_func is not None:
+                self.async_funcs.append([async_func, name])
+                continue
             func = getattr(import_object, 'run')
             self.collect_funcs.append([func, name])
 
+    async def run_async_func(self, func, name):
+        try:
+            await asyncio.wait_for(func(self.domain), self.get_budget(name))
+        except asyncio.TimeoutError:
+            logger.log('ALERT', f'{name} module coroutine timed out')
+        except Exception as e:
+            logger.log('ERROR', f'{name} module coroutine error: {e.args}')
+
+    async def gather_async_funcs(self):
+        tasks = [self.run_async_func(func, name) for func, name in self.async_funcs]
+        await asyncio.gather(*tasks)
+
+    def get_budget(self, name):
+        """
+        Get the remaining time budget of a module
+
+        :param str name: module name
+        :return float: seconds
+        """
+        budget = settings.module_time_budgets.get(name, settings.module_thread_timeout)
+        return max(0.0, min(budget, self.deadline - time.time()))
+
+    def run_func(self, func, token):
+        set_token(token)
+        func(self.domain)
+
+    def run_async_funcs(self, token):
+        """
+        Run all asynchronous modules concurrently on one event loop
+        """
+        set_token(token)
+        logger.log('DEBUG', f'Running {len(self.async_funcs)} asynchronous modules')
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.gather_async_funcs())
+        finally:
+            loop.close()
+
     def run(self):
         """
         Class entrance
@@ -47,24 +97,40 @@ class Collect(object):
         self.import_func()
 
         # 下面将domain传递给各个模块，然后多线程运行
-        threads = []
+        # 所有模块同时开始 各自在预算用完或者到达总截止时间时被取消
+        start = time.time()
+        self.deadline = start + settings.collect_deadline
+        tasks = []
         # Create subdomain collection threads
         for func_obj, func_name in self.collect_funcs:
-            thread = threading.Thread(target=func_obj, name=func_name,
-                                      args=(self.domain,), daemon=True)
-            threads.append(thread)
+            token = CancelToken()
+            thread = threading.Thread(target=self.run_func, name=func_name,
+                                      args=(func_obj, token), daemon=True)
+            tasks.append((start + self.get_budget(func_name), thread, token))
+        if self.async_funcs:
+            token = CancelToken()
+            thread = threading.Thread(target=self.run_async_funcs, name='AsyncCollect',
+                                      args=(token,), daemon=True)
+            tasks.append((self.deadline, thread, token))
         # Start all threads
-        for thread in threads:
+        for _, thread, _ in tasks:
             thread.start()
         # Wait for all threads to finish
-        for thread in threads:
-            # 挨个线程判断超时 最坏情况主线程阻塞时间=线程数*module_thread_timeout
-            # 超时线程将脱离主线程 由于创建线程时已添加守护属于 所有超时线程会随着主线程结束
-            thread.join(settings.module_thread_timeout)
-
-        for thread in threads:
+        for deadline, thread, token in sorted(tasks, key=lambda task: task[0]):
+            thread.join(max(0.0, deadline - time.time()))
             if thread.is_alive():
-                logger.log('ALERT', f'{thread.name} module thread timed out')
+                # 超时线程继续在后台运行直到退出 但是被取消后不再发出请求也不再写入结果
+                token.cancel()
+                logger.log('ALERT', f'{thread.name} module thread timed out and was cancelled')
+        elapse = round(time.time() - start, 1)
+        logger.log('INFOR', f'Finished collecting subdomains of {self.domain} '
+                            f'in {elapse} seconds')
+        stats = get_connection_stats()
+        logger.log('DEBUG', f'Collection modules opened {stats["new"]} connections '
+                            f'and reused connections {stats["reused"]} times')
+        cache = get_response_cache()
+        if cache is not None:
+            cache.report()
 
 
 if __name__ == '__main__':
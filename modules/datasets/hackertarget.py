@@ -1,35 +1,24 @@
-from common.query import Query
+from common.aioquery import AioQuery
 
 
-class HackerTarget(Query):
+class HackerTarget(AioQuery):
     def __init__(self, domain):
-        Query.__init__(self)
+        AioQuery.__init__(self)
         self.domain = domain
         self.module = 'Dataset'
         self.source = "HackerTargetQuery"
         self.addr = 'https://api.hackertarget.com/hostsearch/'
 
-    def query(self):
+    async def query(self):
         """
         向接口查询子域并做子域匹配
         """
         self.header = self.get_header()
         self.proxy = self.get_proxy(self.source)
         params = {'q': self.domain}
-        resp = self.get(self.addr, params)
+        resp = await self.get(self.addr, params)
         self.subdomains = self.collect_subdomains(resp)
 
-    def run(self):
-        """
-        类执行入口
-        """
-        self.begin()
-        self.query()
-        self.finish()
-        self.save_json()
-        self.gen_result()
-        self.save_db()
-
 
 def run(domain):
     """
@@ -41,5 +30,15 @@ def run(domain):
     query.run()
 
 
+async def arun(domain):
+    """
+    类统一异步调用入口
+
+    :param str domain: 域名
+    """
+    query = HackerTarget(domain)
+    await query.arun()
+
+
 if __name__ == '__main__':
     run('example.com')
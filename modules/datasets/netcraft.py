@@ -1,6 +1,5 @@
 import hashlib
 import re
-import time
 from urllib import parse
 
 from common.query import Query
@@ -24,7 +23,7 @@ class NetCraft(Query):
         self.proxy = self.get_proxy(self.source)
         last = ''
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.proxy = self.get_proxy(self.source)
             params = {'host': '*.' + self.domain,
                       'from': self.page_num}
@@ -1,5 +1,4 @@
 import json
-import time
 
 from common.query import Query
 
@@ -26,7 +25,7 @@ class Robtex(Query):
         for item in text_list:
             record = json.loads(item)
             if record.get('rrtype') in ['A', 'AAAA']:
-                time.sleep(self.delay)  # Robtex有查询频率限制
+                self.sleep()  # Robtex有查询频率限制
                 ip = record.get('rrdata')
                 url = f'{base_addr}/reverse/{ip}'
                 resp = self.get(url)
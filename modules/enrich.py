@@ -1,8 +1,12 @@
+import threading
+
 from modules import iscdn
 from common import utils
-from common.database import Database
+from common.database import Database, writer
 from common.ipasn import IPAsnInfo
 from common.ipreg import IpRegData
+from config import settings
+from config.log import logger
 
 
 def get_ips(info):
@@ -13,57 +17,96 @@ def get_ips(info):
     return ips
 
 
-def enrich_info(data):
+# IP富化结果的LRU缓存 多个主域收集时跨域名复用 最近使用的排在最后
+ip_cache = dict()
+ip_cache_lock = threading.Lock()
+
+
+def enrich_ips(ips):
+    """
+    Enrich each distinct IP once and cache the result by IP
+
+    The cache keeps at most enrich_ip_cache_size IPs and drops the least
+    recently used ones beyond that.
+
+    :param ips: iterable of IPs
+    :return dict: IP -> enriched information
+    """
+    ips = set(ips)
+    infos = dict()
+    with ip_cache_lock:
+        for ip in ips:
+            info = ip_cache.pop(ip, None)
+            if info is not None:
+                ip_cache[ip] = info
+                infos[ip] = info
+    pending = [ip for ip in ips if ip not in infos]
+    if not pending:
+        return infos
+    logger.log('DEBUG', f'Enriching {len(pending)} new IPs '
+                        f'({len(infos)} cached)')
     ip_asn = IPAsnInfo()
     ip_reg = IpRegData()
-    for index, info in enumerate(data):
-        ips = get_ips(info)
+    asn_infos = ip_asn.find_many(pending)
+    ip_infos = ip_reg.query_many(pending)
+    ip_asn.close()
+    for ip, asn_info, ip_info in zip(pending, asn_infos, ip_infos):
+        infos[ip] = {'public': str(utils.ip_is_public(ip)),
+                     'cidr': asn_info.get('cidr'),
+                     'asn': asn_info.get('asn'),
+                     'org': asn_info.get('org'),
+                     'addr': ip_info.get('addr'),
+                     'isp': ip_info.get('isp')}
+    with ip_cache_lock:
+        for ip in pending:
+            ip_cache[ip] = infos[ip]
+        while len(ip_cache) > settings.enrich_ip_cache_size:
+            ip_cache.pop(next(iter(ip_cache)))
+    return infos
+
+
+def enrich_info(data):
+    rows_ips = [get_ips(info) for info in data]
+    all_ips = set()
+    for ips in rows_ips:
+        if ips:
+            all_ips.update(ips)
+    ip_infos = enrich_ips(all_ips)
+    fields = ['public', 'cidr', 'asn', 'org', 'addr', 'isp']
+    for index, ips in enumerate(rows_ips):
         if not ips:
             continue
-        public = list()
-        cidr = list()
-        asn = list()
-        org = list()
-        addr = list()
-        isp = list()
-        for ip in ips:
-            public.append(str(utils.ip_is_public(ip)))
-            asn_info = ip_asn.find(ip)
-            cidr.append(asn_info.get('cidr'))
-            asn.append(asn_info.get('asn'))
-            org.append(asn_info.get('org'))
-            ip_info = ip_reg.query(ip)
-            addr.append(ip_info.get('addr'))
-            isp.append(ip_info.get('isp'))
-        data[index]['public'] = ','.join(public)
-        data[index]['cidr'] = ','.join(cidr)
-        data[index]['asn'] = ','.join(asn)
-        data[index]['org'] = ','.join(org)
-        data[index]['addr'] = ','.join(addr)
-        data[index]['isp'] = ','.join(isp)
+        infos = [ip_infos[ip] for ip in ips]
+        for field in fields:
+            data[index][field] = ','.join(info[field] for info in infos)
     return data
 
 
 class Enrich(object):
-    def __init__(self, domain):
+    def __init__(self, domain, store=None):
         self.domain = domain
+        self.store = store
 
     def get_data(self):
-        db = Database()
         fields = ['url', 'cname', 'ip', 'public', 'cdn', 'header',
                   'cidr', 'asn', 'org', 'addr', 'isp']
+        if self.store is not None:
+            return self.store.get_data_by_fields(fields)
+        db = Database()
         results = db.get_data_by_fields(self.domain, fields)
-        return results.as_dict()
+        data = results.as_dict()
+        db.close()
+        return data
 
     def save_db(self, data):
-        db = Database()
         for info in data:
-            url = info.pop('url')
             info.pop('cname')
             info.pop('ip')
             info.pop('header')
-            db.update_data_by_url(self.domain, info, url)
-        db.close()
+        if self.store is not None:
+            self.store.bulk_update('url', data)
+        else:
+            writer.update(self.domain, 'url', data)
 
     def run(self):
         data = self.get_data()
@@ -19,10 +19,10 @@ class Finder(Module):
         self.source = 'Finder'
         self.start = time.time()  # 模块开始执行时间
 
-    def run(self, domain, data, port):
+    def run(self, domain, data, port, store=None):
         logger.log('INFOR', f'Start Finder module')
         existing_subdomains = set(map(lambda x: x.get('subdomain'), data))  # 已有的子域
-        found_subdomains = find_subdomains(domain, data) #
+        found_subdomains = find_subdomains(domain, store)
         new_subdomains = found_subdomains - existing_subdomains
         if not len(new_subdomains):
             self.finish()  # 未发现新的子域就直接返回
@@ -30,7 +30,7 @@ class Finder(Module):
         self.finish()
         self.gen_result()
         resolved_data = resolve.run_resolve(domain, self.results)
-        request.run_request(domain, resolved_data, port)
+        request.run_request(domain, resolved_data, port, store)
 
 
 file_path = settings.data_storage_dir.joinpath('common_js_library.json')
@@ -180,20 +180,25 @@ def convert_to_dict(url_list):
     return url_dict
 
 
-def find_subdomains(domain, data):
+def find_subdomains(domain, store=None):
     subdomains = set()
     js_urls = set()
-    db = Database()
-    for infos in data:
-        jump_history = infos.get('history')
-        req_url = infos.get('url')
-        subdomains.update(find_in_history(domain, req_url, jump_history))
-        rsp_html = db.get_resp_by_url(domain, req_url)
+    if store is not None:
+        db = None
+        resp_data = store.iter_resp_data()
+    else:
+        db = Database()
+        resp_data = db.iter_resp_data(domain)
+    for req_url, jump_history, rsp_html in resp_data:
+        if jump_history:
+            subdomains.update(find_in_history(domain, req_url, jump_history))
         if not rsp_html:
             logger.log('DEBUG', f'an abnormal response occurred in the request {req_url}')
             continue
         subdomains.update(find_in_resp(domain, req_url, rsp_html))
         js_urls.update(find_js_urls(domain, req_url, rsp_html))
+    if db is not None:
+        db.close()
 
     req_data = convert_to_dict(js_urls)
     resp_data = request.bulk_request(domain, req_data, ret=True)
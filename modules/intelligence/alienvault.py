@@ -1,14 +1,16 @@
-from common.query import Query
+import asyncio
 
+from common.aioquery import AioQuery
 
-class AlienVault(Query):
+
+class AlienVault(AioQuery):
     def __init__(self, domain):
-        Query.__init__(self)
+        AioQuery.__init__(self)
         self.domain = domain
         self.module = 'Intelligence'
         self.source = 'AlienVaultQuery'
 
-    def query(self):
+    async def query(self):
         """
         向接口查询子域并做子域匹配
         """
@@ -17,23 +19,10 @@ class AlienVault(Query):
 
         base = 'https://otx.alienvault.com/api/v1/indicators/domain'
         dns = f'{base}/{self.domain}/passive_dns'
-        resp = self.get(dns)
-        self.subdomains = self.collect_subdomains(resp)
-
         url = f'{base}/{self.domain}/url_list'
-        resp = self.get(url)
-        self.subdomains = self.collect_subdomains(resp)
-
-    def run(self):
-        """
-        类执行入口
-        """
-        self.begin()
-        self.query()
-        self.finish()
-        self.save_json()
-        self.gen_result()
-        self.save_db()
+        resps = await asyncio.gather(self.get(dns), self.get(url))
+        for resp in resps:
+            self.subdomains = self.collect_subdomains(resp)
 
 
 def run(domain):
@@ -46,5 +35,15 @@ def run(domain):
     query.run()
 
 
+async def arun(domain):
+    """
+    类统一异步调用入口
+
+    :param str domain: 域名
+    """
+    query = AlienVault(domain)
+    await query.arun()
+
+
 if __name__ == '__main__':
     run('example.com')
@@ -1,8 +1,11 @@
 import json
 import ipaddress
+from bisect import bisect_right
+from functools import lru_cache
 
 from config import settings
 from common import utils
+from common.matcher import Matcher
 from common.database import Database
 from config.log import logger
 
@@ -17,15 +20,50 @@ cdn_cname_keyword = utils.load_json(data_dir.joinpath('cdn_cname_keywords.json')
 
 cdn_header_key = utils.load_json(data_dir.joinpath('cdn_header_keys.json'))
 
+cdn_cname_matcher = Matcher(cdn_cname_keyword.keys())
+cdn_header_key_set = frozenset(cdn_header_key)
+
+
+class CidrTable(object):
+    """
+    Sorted and merged integer intervals of CIDRs for binary search
+    """
+
+    def __init__(self, cidrs):
+        self.starts = {4: list(), 6: list()}
+        self.ends = {4: list(), 6: list()}
+        intervals = {4: list(), 6: list()}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr, strict=False)
+            start = int(network.network_address)
+            end = int(network.broadcast_address)
+            intervals[network.version].append((start, end))
+        for version, items in intervals.items():
+            starts = self.starts[version]
+            ends = self.ends[version]
+            for start, end in sorted(items):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                    continue
+                starts.append(start)
+                ends.append(end)
+
+    def __contains__(self, ip):
+        starts = self.starts[ip.version]
+        index = bisect_right(starts, int(ip)) - 1
+        return index >= 0 and int(ip) <= self.ends[ip.version][index]
+
+
+cdn_cidr_table = CidrTable(cdn_ip_cidr)
+
 
 def check_cname_keyword(cname):
     if not cname:
         return False
     names = cname.lower().split(',')
     for name in names:
-        for keyword in cdn_cname_keyword.keys():
-            if keyword in name:
-                return True
+        if cdn_cname_matcher.search(name):
+            return True
 
 
 def check_header_key(header):
@@ -33,27 +71,49 @@ def check_header_key(header):
         header = json.loads(header)
     if isinstance(header, dict):
         header = set(map(lambda x: x.lower(), header.keys()))
-        for key in cdn_header_key:
-            if key in header:
-                return True
+        if not cdn_header_key_set.isdisjoint(header):
+            return True
     else:
         return False
 
 
-def check_cdn_cidr(ips):
+@lru_cache(maxsize=65536)
+def is_cdn_ip(ip):
+    """
+    Check whether the IP belongs to the CDN CIDR list
+
+    :param str ip: IP address
+    :return: True or False, None if the IP is invalid
+    """
+    try:
+        ip = ipaddress.ip_address(ip)
+    except ValueError as e:
+        logger.log('DEBUG', e.args)
+        return None
+    return ip in cdn_cidr_table
+
+
+def check_cdn_ips(ips):
+    """
+    Check a batch of IPs against the CDN CIDR list
+
+    :param ips: iterable of IP addresses
+    :return dict: IP -> result of is_cdn_ip
+    """
+    return {ip: is_cdn_ip(ip) for ip in set(ips)}
+
+
+def check_cdn_cidr(ips, results=None):
     if isinstance(ips, str):
         ips = set(ips.split(','))
     else:
         return False
     for ip in ips:
-        try:
-            ip = ipaddress.ip_address(ip)
-        except Exception as e:
-            logger.log('DEBUG', e.args)
+        result = is_cdn_ip(ip) if results is None else results[ip]
+        if result is None:
             return False
-        for cidr in cdn_ip_cidr:
-            if ip in ipaddress.ip_network(cidr):
-                return True
+        if result:
+            return True
 
 
 def check_cdn_asn(asn):
@@ -65,6 +125,9 @@ def check_cdn_asn(asn):
 
 def do_check(data):
     logger.log('DEBUG', f'Checking cdn')
+    # 所有子域的IP先去重后一次性查询CDN网段
+    ip_results = check_cdn_ips(ip for item in data if isinstance(item.get('ip'), str)
+                               for ip in item.get('ip').split(','))
     for index, item in enumerate(data):
         cname = item.get('cname')
         if check_cname_keyword(cname):
@@ -75,7 +138,7 @@ def do_check(data):
             data[index]['cdn'] = 1
             continue
         ip = item.get('ip')
-        if check_cdn_cidr(ip):
+        if check_cdn_cidr(ip, ip_results):
             data[index]['cdn'] = 1
             continue
         asn = item.get('asn')
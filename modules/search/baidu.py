@@ -1,4 +1,3 @@
-import time
 from bs4 import BeautifulSoup
 from common.search import Search
 
@@ -37,7 +36,7 @@ class Baidu(Search):
         """
         self.page_num = 0  # 二次搜索重新置0
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             query = 'site:.' + domain + filtered_subdomain
@@ -1,4 +1,3 @@
-import time
 from common.search import Search
 
 
@@ -27,7 +26,7 @@ class Bing(Search):
             return
         self.cookie = resp.cookies  # 获取cookie bing在搜索时需要带上cookie
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.proxy = self.get_proxy(self.source)
             query = 'site:.' + domain + filtered_subdomain
             params = {'q': query, 'first': self.page_num,
@@ -1,4 +1,3 @@
-import time
 from config import settings
 from common.search import Search
 
@@ -24,7 +23,7 @@ class BingAPI(Search):
         """
         self.page_num = 0  # 二次搜索重新置0
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.header = {'Ocp-Apim-Subscription-Key': self.key}
             self.proxy = self.get_proxy(self.source)
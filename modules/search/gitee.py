@@ -1,4 +1,3 @@
-import time
 from bs4 import BeautifulSoup
 from common.search import Search
 from config.log import logger
@@ -18,7 +17,7 @@ class Gitee(Search):
         """
         page_num = 1
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             params = {'pageno': page_num, 'q': self.domain, 'type': 'code'}
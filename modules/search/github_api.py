@@ -1,5 +1,3 @@
-import time
-
 from config import settings
 from common.search import Search
 from config.log import logger
@@ -28,7 +26,7 @@ class GithubAPI(Search):
 
         page = 1
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             params = {'q': self.domain, 'per_page': 100,
                       'page': page, 'sort': 'indexed',
                       'access_token': self.token}
@@ -1,5 +1,3 @@
-import random
-import time
 from common.search import Search
 
 
@@ -11,6 +9,7 @@ class Google(Search):
         self.source = 'GoogleSearch'
         self.init = 'https://www.google.com/'
         self.addr = 'https://www.google.com/search'
+        self.delay = 3  # 谷歌搜索平均每3秒请求一次
 
     def search(self, domain, filtered_subdomain=''):
         """
@@ -30,8 +29,7 @@ class Google(Search):
             return
         self.cookie = resp.cookies
         while True:
-            self.delay = random.randint(1, 5)
-            time.sleep(self.delay)
+            self.sleep()
             self.proxy = self.get_proxy(self.source)
             word = 'site:.' + domain + filtered_subdomain
             payload = {'q': word, 'start': page_num, 'num': per_page_num,
@@ -1,4 +1,3 @@
-import time
 from config import settings
 from common.search import Search
 
@@ -25,7 +24,7 @@ class GoogleAPI(Search):
         self.page_num = 1
         while True:
             word = 'site:.' + domain + filtered_subdomain
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             params = {'key': self.key, 'cx': self.id,
@@ -1,5 +1,4 @@
 import base64
-import time
 
 from config import settings
 from common.search import Search
@@ -23,7 +22,7 @@ class Hunter(Search):
         subdomain_encode = f'domain_suffix="{self.domain}"'.encode('utf-8')
         query_data = base64.b64encode(subdomain_encode)
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             query = {'api-key': self.key,
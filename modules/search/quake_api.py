@@ -1,5 +1,3 @@
-import time
-
 from config import settings
 from common.search import Search
 
@@ -21,7 +19,7 @@ class Quake(Search):
         self.per_page_num = 100
         self.page_num = 0
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.header.update({'Content-Type': 'application/json'})
             self.header.update({'X-QuakeToken': self.key})
@@ -1,5 +1,3 @@
-import time
-
 from common.search import Search
 
 
@@ -22,7 +20,7 @@ class So(Search):
         """
         page_num = 1
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             word = 'site:.' + domain + filtered_subdomain
@@ -1,4 +1,3 @@
-import time
 from common.search import Search
 
 
@@ -19,7 +18,7 @@ class WzSearch(Search):
         """
         self.page_num = 1
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.proxy = self.get_proxy(self.source)
             query = 'site:.' + domain + filtered_subdomain
@@ -1,4 +1,3 @@
-import time
 from common.search import Search
 
 
@@ -28,7 +27,7 @@ class Yahoo(Search):
             return
         self.cookie = resp.cookies  # 获取cookie Yahoo在搜索时需要带上cookie
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.proxy = self.get_proxy(self.source)
             query = 'site:.' + domain + filtered_subdomain
             params = {'p': query, 'b': self.page_num, 'pz': self.per_page_num}
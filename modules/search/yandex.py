@@ -1,4 +1,3 @@
-import time
 from common.search import Search
 
 
@@ -28,7 +27,7 @@ class Yandex(Search):
             return
         self.cookie = resp.cookies  # 获取cookie
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.proxy = self.get_proxy(self.source)
             query = 'site:.' + domain + filtered_subdomain
             params = {'text': query, 'p': self.page_num,
@@ -1,4 +1,3 @@
-import time
 from config import settings
 from common.search import Search
 
@@ -20,7 +19,7 @@ class ZoomEyeAPI(Search):
         self.per_page_num = 30
         self.page_num = 1
         while True:
-            time.sleep(self.delay)
+            self.sleep()
             self.header = self.get_header()
             self.header.update({'API-KEY': self.key})
             self.proxy = self.get_proxy(self.source)
@@ -0,0 +1,230 @@
+"""
+Streaming pipeline overlapping resolution and probing with collection
+
+Collection modules hand their results to the pipeline as soon as they save
+them, the names are resolved in micro batches, every resolved name is
+probed at once and its response is searched for new subdomains which flow
+back into the pipeline.
+"""
+
+import time
+import threading
+from queue import Queue, Empty
+
+from requests import Response
+
+from common import utils
+from common import resolve
+from common import request
+from modules import finder
+from modules.finder import Finder
+from config import settings
+from config.log import logger
+
+
+class StreamPipeline(object):
+    """
+    Resolve, request and finder stages connected by queues
+
+    :param str domain: main domain
+    :param any port: range of ports to be requested
+    :param store: in-memory result store receiving the request results
+    """
+
+    def __init__(self, domain, port, store):
+        self.domain = domain
+        self.ports = request.get_port_seq(port)
+        self.store = store
+        self.batch_size = settings.stream_resolve_batch_size
+        self.interval = settings.stream_resolve_interval
+        self.names_queue = Queue()  # 待解析的子域数据
+        self.urls_queue = Queue(maxsize=settings.stream_queue_size)  # 待请求的数据
+        self.seen = set()  # 已进入流水线的子域
+        self.js_urls = set()  # 已请求过的JS链接
+        self.resolved = list()  # 解析得到的结果
+        self.pending = 0  # 尚未处理完的任务数
+        self.cond = threading.Condition()
+        self.lock = threading.Lock()
+        self.session = request.get_session()
+        self.threads = list()
+        self.stopped = False
+        self.start_time = time.time()
+        self.first_alive = None
+
+    def start(self):
+        self.start_time = time.time()
+        thread = threading.Thread(target=self.resolve_worker,
+                                  name='StreamResolveThread', daemon=True)
+        self.threads.append(thread)
+        for i in range(request.req_thread_count()):
+            thread = threading.Thread(target=self.request_worker,
+                                      name=f'StreamRequestThread-{i}', daemon=True)
+            self.threads.append(thread)
+        for thread in self.threads:
+            thread.start()
+
+    def add_pending(self, count):
+        with self.cond:
+            self.pending += count
+            if self.pending <= 0:
+                self.cond.notify_all()
+
+    def submit(self, rows):
+        """
+        Put the result rows of a module into the pipeline
+
+        :param list rows: result rows
+        """
+        new_rows = list()
+        with self.lock:
+            for row in rows:
+                subdomain = row.get('subdomain')
+                if not subdomain or subdomain in self.seen:
+                    continue
+                self.seen.add(subdomain)
+                new_rows.append(row.copy())
+        if not new_rows:
+            return
+        with self.cond:
+            # 超时模块在流水线结束后才保存的结果 检查和计数在同一把锁内完成
+            if self.stopped:
+                logger.log('DEBUG', f'Stream pipeline of {self.domain} is stopped, '
+                                    f'skip {len(new_rows)} late results')
+                return
+            self.pending += len(new_rows)
+        for row in new_rows:
+            self.names_queue.put(row)
+
+    def get_batch(self):
+        """
+        Get a batch of names waiting at most interval seconds after the first one
+
+        :return list: batch of rows or None when the pipeline stopped
+        """
+        batch = list()
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = self.interval
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+            try:
+                row = self.names_queue.get(timeout=timeout)
+            except Empty:
+                if batch:
+                    break
+                if self.stopped:
+                    return None
+                continue
+            batch.append(row)
+            if deadline is None:
+                deadline = time.time() + self.interval
+        return batch
+
+    def resolve_worker(self):
+        while True:
+            batch = self.get_batch()
+            if batch is None:
+                break
+            probed = set()  # 解析过程中已经开始请求的子域
+
+            def probe(row):
+                probed.add(row.get('subdomain'))
+                self.probe([row])
+
+            try:
+                # 每得到一个解析结果就立即请求 不等待整批解析完成
+                data = resolve.run_resolve(self.domain, batch, probe)
+            except Exception as e:
+                logger.log('ERROR', e.args)
+                data = list()
+            with self.lock:
+                self.resolved.extend(data)
+            self.probe([row for row in data if row.get('subdomain') not in probed])
+            self.add_pending(-len(batch))
+
+    def probe(self, rows):
+        """
+        Put the request data of the resolved rows into the pipeline
+
+        :param list rows: resolved rows
+        """
+        req_data, _ = request.gen_req_data(rows, self.ports)
+        self.add_pending(len(req_data))
+        for info in req_data:
+            self.urls_queue.put(info)
+
+    def request_worker(self):
+        while True:
+            info = self.urls_queue.get()
+            if info is None:
+                break
+            try:
+                resp = request.get_resp(info.get('url'), self.session)
+                info = request.gen_new_info(info, resp)
+                self.store.insert([info])
+                if info.get('alive') == 1 and self.first_alive is None:
+                    self.first_alive = round(time.time() - self.start_time, 1)
+                if settings.enable_finder_module:
+                    self.find(info)
+            except Exception as e:
+                logger.log('ERROR', e.args)
+            finally:
+                self.add_pending(-1)
+
+    def find(self, info):
+        """
+        Search new subdomains in the response and feed them back
+        """
+        url = info.get('url')
+        subdomains = set()
+        history = info.get('history')
+        if history:
+            subdomains.update(finder.find_in_history(self.domain, url, history))
+        html = info.get('response')
+        if html:
+            subdomains.update(finder.find_in_resp(self.domain, url, html))
+            js_urls = finder.find_js_urls(self.domain, url, html)
+            with self.lock:
+                js_urls = js_urls - self.js_urls
+                self.js_urls.update(js_urls)
+            for js_url in js_urls:
+                resp = request.get_resp(js_url, self.session)
+                if not isinstance(resp, Response):
+                    continue
+                text = utils.decode_resp_text(resp)
+                subdomains.update(finder.find_in_resp(self.domain, resp.url, text))
+        with self.lock:
+            subdomains = subdomains - self.seen
+        if not subdomains:
+            return
+        module = Finder()
+        module.domain = self.domain
+        module.subdomains = subdomains
+        module.finish()
+        module.gen_result()
+        self.submit(module.results)
+
+    def join(self):
+        """
+        Wait until every name in the pipeline is resolved and requested
+
+        :return list: resolved results
+        """
+        with self.cond:
+            while self.pending > 0:
+                self.cond.wait()
+            self.stopped = True
+        for _ in self.threads[1:]:
+            self.urls_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        logger.log('INFOR', f'Stream pipeline of {self.domain} resolved '
+                            f'{len(self.resolved)} subdomains and requested '
+                            f'{len(self.store)} urls')
+        if self.first_alive is not None:
+            logger.log('INFOR', f'The first alive subdomain was found '
+                                f'{self.first_alive} seconds after start')
+        return self.resolved
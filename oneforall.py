@@ -9,12 +9,16 @@ OneForAll is a powerful subdomain integration tool
 """
 
 import fire
+import multiprocessing
 from datetime import datetime
 
 
 import export
 from brute import Brute
 from common import utils, resolve, request
+from common.store import ResultStore
+from common import module
+from modules.stream import StreamPipeline
 from modules.collect import Collect
 from modules.srv import BruteSRV
 from modules.finder import Finder
@@ -35,6 +39,8 @@ end = '\033[0m'
 version = 'v0.4.5'
 message = white + '{' + red + version + ' #dev' + white + '}'
 
+export_lock = None  # 多进程并行处理目标时串行化导出结果的锁
+
 oneforall_banner = f"""
 OneForAll is a powerful subdomain integration tool{yellow}
              ___             _ _ 
@@ -65,6 +71,7 @@ class OneForAll(object):
         python3 oneforall.py --target example.com --req False run
         python3 oneforall.py --target example.com --takeover False run
         python3 oneforall.py --target example.com --show True run
+        python3 oneforall.py --targets ./domains.txt --workers 4 run
 
     Note:
         --port   small/medium/large  See details in ./config/setting.py(default small)
@@ -81,9 +88,11 @@ class OneForAll(object):
     :param str  fmt:        Result format (default csv)
     :param str  path:       Result path (default None, automatically generated)
     :param bool takeover:   Scan subdomain takeover (default False)
+    :param int  workers:    Number of targets processed in parallel (default 1)
     """
     def __init__(self, target=None, targets=None, brute=None, dns=None, req=None,
-                 port=None, alive=None, fmt=None, path=None, takeover=None):
+                 port=None, alive=None, fmt=None, path=None, takeover=None,
+                 workers=None):
         self.target = target
         self.targets = targets
         self.brute = brute
@@ -94,6 +103,7 @@ class OneForAll(object):
         self.fmt = fmt
         self.path = path
         self.takeover = takeover
+        self.workers = workers
         self.domain = str()  # The domain currently being collected
         self.domains = set()  # All domains that are to be collected
         self.data = list()  # The subdomain results of the current domain
@@ -121,6 +131,8 @@ class OneForAll(object):
             self.fmt = settings.result_save_format
         if self.path is None:
             self.path = settings.result_save_path
+        if self.workers is None:
+            self.workers = settings.target_worker_count
 
     def check_param(self):
         """
@@ -137,7 +149,48 @@ class OneForAll(object):
         :return: exported data
         :rtype: list
         """
-        return export.export_data(self.domain, alive=self.alive, fmt=self.fmt, path=self.path)
+        if export_lock is None:
+            return export.export_data(self.domain, alive=self.alive, fmt=self.fmt, path=self.path)
+        with export_lock:
+            return export.export_data(self.domain, alive=self.alive, fmt=self.fmt, path=self.path)
+
+    def get_params(self):
+        """
+        Get the parameters used to create the OneForAll object of a worker
+
+        :return dict: parameters
+        """
+        return {'brute': self.brute, 'dns': self.dns, 'req': self.req,
+                'port': self.port, 'alive': self.alive, 'fmt': self.fmt,
+                'path': self.path, 'takeover': self.takeover, 'workers': 1}
+
+    def run_parallel(self, workers):
+        """
+        Run the main process of the targets in a process pool
+
+        The configured DNS and HTTP concurrency are global caps which are
+        evenly shared by the worker processes, and every target still uses its
+        own table and temporary files.
+
+        :param int workers: number of worker processes
+        """
+        logger.log('INFOR', f'Running {len(self.domains)} targets with {workers} workers')
+        context = multiprocessing.get_context('spawn')
+        lock = context.Lock()
+        params = self.get_params()
+        pool = context.Pool(workers, initializer=init_worker, initargs=(workers, lock))
+        tasks = [(domain, pool.apply_async(run_target, (params, domain)))
+                 for domain in self.domains]
+        pool.close()
+        for domain, task in tasks:
+            try:
+                count = task.get()
+            except Exception as e:
+                logger.log('ERROR', f'Error occurred when processing {domain}')
+                logger.log('ERROR', e.args)
+                continue
+            logger.log('INFOR', f'Finished processing {domain} and exported {count} results')
+        pool.join()
 
     def main(self):
         """
@@ -155,6 +208,8 @@ class OneForAll(object):
         # if self.access_internet:
         # 下面检查是否存在泛解析，如果存在泛解析就不需要爆破了
         self.enable_wildcard = wildcard.detect_wildcard(self.domain)
+        # 开启流式流水线时收集模块保存结果后立即解析、请求并从响应中发现新子域
+        stream = self.get_stream()
 
         # 下面运行信息收集模块，也就是配置文件中写的模块
         collect = Collect(self.domain)
@@ -176,6 +231,9 @@ class OneForAll(object):
             brute.quite = True
             brute.run()
 
+        if stream is not None:
+            return self.stream_stages(stream)
+
         utils.deal_data(self.domain)  # 删除sqllite数据库中的子域的空数据和重复数据
         # Export results without resolve
         if not self.dns: # 使用DNS解析子域，默认为true，所以不会走这里
@@ -189,8 +247,14 @@ class OneForAll(object):
         # print(self.data) # [{'id': 1, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://notes.saucer-man.com', 'subdomain': 'notes.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}, {'id': 2, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://ai.saucer-man.com', 'subdomain': 'ai.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}, {'id': 3, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://www.saucer-man.com', 'subdomain': 'www.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}, {'id': 4, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://saucer-man.com', 'subdomain': 'saucer-man.com', 'port': 80, 'level': 0, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}, {'id': 5, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://ai2.saucer-man.com', 'subdomain': 'ai2.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}, {'id': 6, 'alive': None, 'request': None, 'resolve': None, 'url': 'http://ai3.saucer-man.com', 'subdomain': 'ai3.saucer-man.com', 'port': 80, 'level': 1, 'cname': None, 'ip': None, 'public': None, 'cdn': None, 'status': None, 'reason': None, 'title': None, 'banner': None, 'header': None, 'history': None, 'response': None, 'ip_times': None, 'cname_times': None, 'ttl': None, 'cidr': None, 'asn': None, 'org': None, 'addr': None, 'isp': None, 'resolver': None, 'module': 'Certificate', 'source': 'CensysAPIQuery', 'elapse': 0.9, 'find': 6}]
 
 
+        # 开启内存流水线时各阶段共享内存中的结果 最后才一次性写入数据库
+        store = None
+        if settings.enable_memory_pipeline:
+            store = ResultStore(self.domain)
+
         # Resolve subdomains
-        utils.clear_data(self.domain)  # 删除表，这里不知道是为啥
+        if store is None:
+            utils.clear_data(self.domain)  # 删除表，这里不知道是为啥
 
         # 下面解析子域名的dns记录，A记录和ip地址等等
         self.data = resolve.run_resolve(self.domain, self.data)
@@ -201,7 +265,8 @@ class OneForAll(object):
 
 
         # Save resolve results
-        resolve.save_db(self.domain, self.data)  # 保存在数据库中
+        if store is None or not self.req:
+            resolve.save_db(self.domain, self.data)  # 保存在数据库中
 
         # Export results without HTTP request
         # req 就是表示是否对子域名进行http请求，默认为true,一般不会走下面的判断
@@ -215,30 +280,77 @@ class OneForAll(object):
             self.data = wildcard.deal_wildcard(self.data)
 
         # HTTP request
-        utils.clear_data(self.domain)  # 又删除数据库
+        if store is None:
+            utils.clear_data(self.domain)  # 又删除数据库
 
         # 对子域名进行http请求，将结果保存在sql中
-        request.run_request(self.domain, self.data, self.port)
+        request.run_request(self.domain, self.data, self.port, store)
 
         # Finder module
         # 开启finder模块,开启会从响应体和JS中再次发现子域(默认True)
         # 从数据库中取出resp，做正则匹配
         if settings.enable_finder_module:
             finder = Finder()
-            finder.run(self.domain, self.data, self.port)
+            finder.run(self.domain, self.data, self.port, store)
+
+        return self.final_stages(store)
+
+    def get_stream(self):
+        """
+        Start the streaming pipeline when it is enabled and applicable
+
+        :return: StreamPipeline object or None
+        """
+        if not settings.enable_stream_pipeline:
+            return None
+        if not self.dns or not self.req:
+            return None
+        if self.enable_wildcard:
+            # 泛解析处理需要全部子域的统计信息，无法流式处理
+            logger.log('ALERT', 'The stream pipeline is disabled because of wildcard')
+            return None
+        stream = StreamPipeline(self.domain, self.port, ResultStore(self.domain))
+        stream.start()
+        module.subscribe(self.domain, stream.submit)
+        return stream
+
+    def stream_stages(self, stream):
+        """
+        Wait for the streaming pipeline and run the remaining stages
+
+        :param stream: StreamPipeline object
+        :return: subdomain results
+        :rtype: list
+        """
+        module.unsubscribe(self.domain, stream.submit)
+        self.data = stream.join()
+        count = stream.store.count_alive()
+        logger.log('INFOR', f'Found that {self.domain} has {count} alive subdomains')
+        return self.final_stages(stream.store)
+
+    def final_stages(self, store):
+        """
+        Run the altdns, enrich, export and takeover stages
 
+        :param store: in-memory result store (None means the database)
+        :return: subdomain results
+        :rtype: list
+        """
         # altdns module
         # 开启altdns模块,开启会利用置换技术重组子域再次发现新子域(默认True)
         if settings.enable_altdns_module:
             altdns = Altdns(self.domain)
-            altdns.run(self.data, self.port)
+            altdns.run(self.data, self.port, store)
 
         # Information enrichment module
         # # 开启enrich模块，开启会富化出信息，如ip的cdn，cidr，asn，org，addr和isp等信息
         if settings.enable_enrich_module:
-            enrich = Enrich(self.domain)
+            enrich = Enrich(self.domain, store)
             enrich.run()
 
+        if store is not None:
+            store.save()
+
         # 从数据库中取出数据，并且保存在csv文件中
         self.data = self.export_data()
 
@@ -280,6 +392,14 @@ class OneForAll(object):
         if not count:
             logger.log('FATAL', 'Failed to obtain domain')
             exit(1)
+        workers = min(int(self.workers), count)
+        if workers > 1:
+            self.domains = sorted({utils.get_main_domain(domain) for domain in self.domains})
+            self.run_parallel(workers)
+            logger.log('INFOR', 'Finished OneForAll')
+            return
+        # 串行处理目标时本进程独占请求线程数、DNS并发查询数和数据源限速
+        settings.target_worker_count = 1
         for domain in self.domains:
             self.domain = utils.get_main_domain(domain)  # 得到域名的顶级域名，www.baidu.com  --> baidu.com
             self.main()  # 执行子域名查找的逻辑，结果保存在sql中
@@ -312,5 +432,31 @@ class OneForAll(object):
         exit(0)
 
 
+def init_worker(workers, lock):
+    """
+    Initialize a worker process of the parallel mode
+
+    :param int workers: number of worker processes
+    :param lock: lock serializing the result exports
+    """
+    global export_lock
+    settings.target_worker_count = workers
+    export_lock = lock
+
+
+def run_target(params, domain):
+    """
+    Run the main process of one target in a worker process
+
+    :param dict params: OneForAll parameters
+    :param str domain: main domain
+    :return int: number of exported results
+    """
+    oneforall = OneForAll(target=domain, **params)
+    oneforall.config_param()
+    oneforall.domain = domain
+    return len(oneforall.main())
+
+
 if __name__ == '__main__':
     fire.Fire(OneForAll)
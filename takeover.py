@@ -19,6 +19,8 @@ from tqdm import tqdm
 from config.log import logger
 from config import settings
 from common import utils
+from common.dnscache import get_dns_cache, get_cached_cname
+from common.matcher import Matcher
 from common.module import Module
 
 
@@ -29,7 +31,27 @@ def get_fingerprint():
     return fingerprints
 
 
+def get_fingerprint_index(fingerprints):
+    """
+    Index fingerprints by their CNAME domains
+
+    :param list fingerprints: fingerprints
+    :return dict: CNAME domain -> list of (fingerprint, response matcher)
+    """
+    index = dict()
+    for fingerprint in fingerprints:
+        matcher = Matcher(fingerprint.get('response'))
+        for cname in fingerprint.get('cname'):
+            index.setdefault(cname, list()).append((fingerprint, matcher))
+    return index
+
+
 def get_cname(subdomain):
+    cache = get_dns_cache()
+    if cache is not None:
+        _, line = cache.get(subdomain)
+        if line is not None:  # 缓存中的A记录应答已包含CNAME链
+            return get_cached_cname(line, subdomain)
     resolver = utils.dns_resolver()
     try:
         answers = resolver.query(subdomain, 'CNAME')
@@ -70,6 +92,7 @@ class Takeover(Module):
         self.path = path
         self.fmt = fmt
         self.fingerprints = None
+        self.fingerprint_index = dict()
         self.queue = Queue()  # subdomain queue
         self.cnames = list()
         self.results = Dataset()
@@ -82,29 +105,26 @@ class Takeover(Module):
             data = self.results.export(self.fmt)
         utils.save_to_file(self.path, data)
 
-    def compare(self, subdomain, cname, responses):
+    def compare(self, subdomain, cname, matcher):
         domain_resp = self.get('http://' + subdomain, check=False, ignore=True)
         cname_resp = self.get('http://' + cname, check=False, ignore=True)
         if domain_resp is None or cname_resp is None:
             return
 
-        for resp in responses:
-            if resp in domain_resp.text and resp in cname_resp.text:
-                logger.log('ALERT', f'{subdomain} takeover threat found')
-                self.results.append([subdomain, cname])
-                break
+        domain_matches = matcher.find_all(domain_resp.text)
+        if not domain_matches:
+            return
+        if not domain_matches.isdisjoint(matcher.find_all(cname_resp.text)):
+            logger.log('ALERT', f'{subdomain} takeover threat found')
+            self.results.append([subdomain, cname])
 
     def worker(self, subdomain):
         cname = get_cname(subdomain)
         if cname is None:
             return
         main_domain = utils.get_main_domain(cname)
-        for fingerprint in self.fingerprints:
-            cnames = fingerprint.get('cname')
-            if main_domain not in cnames:
-                continue
-            responses = fingerprint.get('response')
-            self.compare(subdomain, cname, responses)
+        for _, matcher in self.fingerprint_index.get(main_domain, list()):
+            self.compare(subdomain, cname, matcher)
 
     def check(self):
         while not self.queue.empty():  # 保证域名队列遍历结束后能退出线程
@@ -138,6 +158,7 @@ class Takeover(Module):
         if self.subdomains:
             logger.log('INFOR', f'Checking subdomain takeover')
             self.fingerprints = get_fingerprint()
+            self.fingerprint_index = get_fingerprint_index(self.fingerprints)
             self.results.headers = ['subdomain', 'cname']
             # 创建待检查的子域队列
             for domain in self.subdomains:
@@ -0,0 +1,65 @@
+import io
+import os
+
+import requests
+
+from common import utils
+from common.cache import ResponseCache
+
+BODY = ('[' + ','.join(f'{{"name_value": "a{i}.example.com"}}' for i in range(5000))
+        + ']').encode('utf-8')
+
+
+def make_response(body=BODY):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = 'https://crt.sh/?q=example.com'
+    resp.encoding = 'utf-8'
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def test_make_key():
+    key = ResponseCache.make_key('Source', 'GET', 'https://a.com/', {'params': {'q': 1}})
+    assert key == ResponseCache.make_key('Source', 'GET', 'https://a.com/?q=1', dict(),
+                                         {'User-Agent': 'x'})
+    assert key != ResponseCache.make_key('Source', 'GET', 'https://a.com/?q=1', dict(),
+                                         {'Authorization': 'token'})
+    assert key != ResponseCache.make_key('Source', 'GET', 'https://a.com/?q=1', dict(),
+                                         cookies={'session': '1'})
+
+
+def test_put(tmp_path):
+    cache = ResponseCache(tmp_path.joinpath('cache.sqlite3'), 1024 * 1024)
+    resp = make_response()
+    cache.put('Source', 'key', resp)
+    cached = cache.get('Source', 'key')
+    assert cached.content == BODY and cached.status_code == 200
+    assert cache.get('Source', 'other') is None
+
+
+def test_record_streamed_response(tmp_path):
+    cache = ResponseCache(tmp_path.joinpath('cache.sqlite3'), 1024 * 1024)
+    resp = make_response()
+    cache.record('Source', 'key', resp)
+    assert cache.get('Source', 'key') is None  # 响应体读完之前不缓存
+    text = ''.join(utils.iter_resp_text(resp, chunk_size=1000))
+    assert text == BODY.decode('utf-8')
+    cached = cache.get('Source', 'key')
+    assert cached.url == resp.url
+    assert ''.join(utils.iter_resp_text(cached, chunk_size=1000)) == text
+    cached.close()
+
+
+def test_record_partial_or_large(tmp_path):
+    cache = ResponseCache(tmp_path.joinpath('cache.sqlite3'), 1024 * 1024)
+    resp = make_response()
+    cache.record('Source', 'partial', resp)
+    next(resp.iter_content(1000))
+    resp.close()
+    assert cache.get('Source', 'partial') is None
+    cache = ResponseCache(tmp_path.joinpath('small.sqlite3'), 1000)
+    resp = make_response(os.urandom(25600))  # 无法压缩的响应体
+    cache.record('Source', 'large', resp)
+    assert len(resp.content) == 25600
+    assert cache.get('Source', 'large') is None
@@ -0,0 +1,11 @@
+from modules.certificates.crtsh import Crtsh
+
+
+def test_expand_wildcard():
+    crtsh = Crtsh('example.com')
+    words = ('api', 'Dev', '-bad', 'x' * 64)
+    assert crtsh.expand_wildcard('*.example.com', words) == \
+        ['api.example.com', 'dev.example.com']
+    assert crtsh.expand_wildcard('*.a.example.com', ('api',)) == ['api.a.example.com']
+    assert crtsh.expand_wildcard('*.example.com.cn', words) == list()
+    assert crtsh.expand_wildcard('*.b_c.example.com', words) == list()
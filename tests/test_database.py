@@ -0,0 +1,21 @@
+from common.database import Database, Writer
+from common.result import Result
+
+
+def make_row(subdomain):
+    return Result(subdomain=subdomain, url=f'http://{subdomain}')
+
+
+def test_commit_isolates_failing_task(tmp_path):
+    db = Database(tmp_path.joinpath('result.sqlite3'))
+    table = 'example_com'
+    db.create_table(table)
+    tasks = [('insert', table, [make_row('b.example.com')], ('module',)),
+             ('update', table, [{'url': 'http://b.example.com', 'bad': 1}], ('url',)),
+             ('insert', table, [make_row('c.example.com')], ('module',)),
+             ('update', table, [{'url': 'http://c.example.com', 'title': 'c'}], ('url',))]
+    Writer().commit(db, tasks)
+    rows = db.query(f'select subdomain, title from "{table}" order by subdomain').all()
+    assert [(row.subdomain, row.title) for row in rows] == \
+        [('b.example.com', None), ('c.example.com', 'c')]
+    db.close()
@@ -0,0 +1,143 @@
+import pytest
+
+from common import dnscache
+from common.dnscache import DNSCache, get_expire, get_cached_cname
+from config import settings
+from tests.test_massdns import make_line
+
+WWW = make_line('www.example.com', answers=[
+    ('www.example.com', 'CNAME', 'cdn.example.net.', 600),
+    ('cdn.example.net', 'A', '1.1.1.1', 60)])
+DANGLING = make_line('old.example.com', 'NXDOMAIN', answers=[
+    ('old.example.com', 'CNAME', 'gone.example.net.', 600)])
+NX = make_line('nx.example.com', 'NXDOMAIN')
+EMPTY = make_line('empty.example.com', answers=[])
+FAILED = make_line('bad.example.com', 'SERVFAIL')
+
+
+class Clock(object):
+    now = 1000.0
+
+    @classmethod
+    def time(cls):
+        return cls.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(settings, 'dns_cache_max_ttl', 3600)
+    monkeypatch.setattr(settings, 'dns_cache_negative_ttl', 300)
+    monkeypatch.setattr(dnscache, 'time', Clock)
+    Clock.now = 1000.0
+    return Clock
+
+
+def test_get_expire(clock):
+    assert get_expire(WWW, 0) == ('www.example.com', 60, True)
+    assert get_expire(DANGLING, 0) == ('old.example.com', 300, True)
+    assert get_expire(NX, 0) == ('nx.example.com', 300, False)
+    assert get_expire(EMPTY, 0) == ('empty.example.com', 300, False)
+    assert get_expire(FAILED, 0) is None
+    long_ttl = make_line('a.example.com', answers=[('a.example.com', 'A', '1.1.1.1', 86400)])
+    assert get_expire(long_ttl, 0)[1] == 3600
+
+
+def test_get_cached_cname():
+    assert get_cached_cname(WWW, 'WWW.example.com.') == 'cdn.example.net.'
+    assert get_cached_cname(DANGLING, 'old.example.com') == 'gone.example.net.'
+    assert get_cached_cname(WWW, 'cdn.example.net') is None
+
+
+def test_ttl_and_negative_answers(clock):
+    cache = DNSCache(100)
+    for line in (WWW, DANGLING, NX, EMPTY, FAILED):
+        cache.put(line)
+    cache.put('not json')
+    assert cache.get('WWW.example.com') == (True, WWW)
+    assert cache.get('old.example.com') == (True, DANGLING)
+    assert cache.get('nx.example.com') == (True, None)
+    assert cache.get('bad.example.com') == (False, None)
+    names = ['www.example.com', 'nx.example.com', 'bad.example.com', ' ', 'new.example.com']
+    assert cache.lookup(names) == ([WWW], ['bad.example.com', 'new.example.com'])
+    clock.now += 60
+    assert cache.get('www.example.com') == (False, None)
+    assert cache.get('nx.example.com') == (True, None)
+    clock.now += 240
+    assert cache.lookup(['nx.example.com', 'old.example.com']) == \
+        ([], ['nx.example.com', 'old.example.com'])
+
+
+def test_max_size(clock):
+    cache = DNSCache(2)
+    cache.put(WWW)
+    cache.put(NX)
+    cache.put(WWW)  # 重新写入的条目成为最新
+    cache.put(EMPTY)
+    assert cache.get('nx.example.com') == (False, None)
+    assert cache.get('www.example.com') == (True, WWW)
+    assert cache.get('empty.example.com') == (True, None)
+
+
+def test_persist(clock, tmp_path):
+    path = tmp_path.joinpath('dns_cache.sqlite3')
+    cache = DNSCache(100, path)
+    cache.put(WWW)
+    cache.put(NX)
+    cache.flush()
+    cache = DNSCache(100, path)
+    assert cache.lookup(['www.example.com', 'nx.example.com', 'a.example.com']) == \
+        ([WWW], ['a.example.com'])
+    clock.now += 100
+    cache = DNSCache(100, path)
+    assert cache.get('www.example.com') == (False, None)
+    assert cache.get('nx.example.com') == (True, None)
+
+
+def test_load_keeps_max_size(clock, tmp_path):
+    path = tmp_path.joinpath('dns_cache.sqlite3')
+    cache = DNSCache(100, path)
+    for line in (WWW, NX, EMPTY):
+        cache.put(line)
+    cache.flush()
+    cache = DNSCache(2, path)
+    lines, stale = cache.lookup(['www.example.com', 'nx.example.com', 'empty.example.com'])
+    assert (lines, stale) == ([WWW], list())
+    assert len(cache.entries) == 2
+
+
+def test_iter_stale_streams_names(clock):
+    cache = DNSCache(100)
+    cache.put(WWW)
+    taken = list()
+
+    def names():
+        for i in range(2000):
+            taken.append(i)
+            yield 'www.example.com' if i % 2 else f'n{i}.example.com'
+
+    lines = list()
+    stale = cache.iter_stale(names(), lines)
+    assert next(stale) == 'n0.example.com'
+    assert len(taken) == 500 and len(lines) == 250
+    assert len(list(stale)) == 999 and len(lines) == 1000
+
+
+def test_backend_answers_from_cache(clock, monkeypatch):
+    from common import dnsbackend
+
+    class Backend(dnsbackend.Backend):
+        def query_lines(self, names, ns_path, log_path, query_type, concurrent_num,
+                        quiet_mode, negative):
+            for name in names:
+                yield make_line(name, answers=[(name, 'A', '1.1.1.1', 60)])
+
+    cache = DNSCache(100)
+    cache.put(WWW)
+    monkeypatch.setattr(dnsbackend, 'get_dns_cache', lambda: cache)
+    monkeypatch.setattr(settings, 'enable_resolver_check', False)
+    names = iter(['www.example.com', 'a.example.com'])
+    lines = list(Backend().iter_lines(names, 'resolvers.txt', 'massdns.log'))
+    assert sorted(lines) == sorted([WWW, make_line('a.example.com', answers=[
+        ('a.example.com', 'A', '1.1.1.1', 60)])])
+    assert list(Backend().iter_lines(['a.example.com'], 'resolvers.txt', 'massdns.log')) == \
+        [make_line('a.example.com', answers=[('a.example.com', 'A', '1.1.1.1', 60)])]
@@ -0,0 +1,53 @@
+import socket
+import struct
+import asyncio
+
+from common.dnsengine import DNSEngine, make_query, parse_response
+
+
+class StubProtocol(asyncio.DatagramProtocol):
+    """
+    Nameserver answering every A query with 10.0.0.1
+    """
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        end = data.index(b'\x00', 12) + 5
+        qid = struct.unpack_from('!H', data)[0]
+        answer = struct.pack('!HHHIH', 0xC00C, 1, 1, 60, 4) + socket.inet_aton('10.0.0.1')
+        self.transport.sendto(struct.pack('!HHHHHH', qid, 0x8180, 1, 1, 0, 0)
+                              + data[12:end] + answer, addr)
+
+
+async def resolve(names):
+    loop = asyncio.get_event_loop()
+    transport, _ = await loop.create_datagram_endpoint(StubProtocol,
+                                                       local_addr=('127.0.0.1', 0))
+    engine = DNSEngine([transport.get_extra_info('sockname')], timeout=1, retries=1)
+    await engine.open()
+    try:
+        return [await engine.query(name) for name in names]
+    finally:
+        engine.close()
+        transport.close()
+
+
+def test_make_query():
+    rcode, qname, answers = parse_response(make_query(1, 'bücher.example.com'.encode('idna'), 1))
+    assert (rcode, qname, answers) == (0, 'xn--bcher-kva.example.com.', list())
+
+
+def test_query_idn_name():
+    loop = asyncio.new_event_loop()
+    try:
+        items = loop.run_until_complete(resolve(['www.example.com', 'bücher.example.com',
+                                                 'WWW.Example.com', 'a..example.com']))
+    finally:
+        loop.close()
+    for item in items[:3]:
+        assert item['status'] == 'NOERROR'
+        assert item['data']['answers'][0]['data'] == '10.0.0.1'
+    assert items[1]['name'] == 'bücher.example.com.'
+    assert items[3] is None
@@ -0,0 +1,37 @@
+import random
+
+from common.ipasn import AsnRanges
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = list()
+    start = rng.randint(0, 1000)
+    for i in range(count):
+        end = start + rng.randint(0, 300)
+        rows.append((start, end, f'cidr{i}', i, f'org{i}'))
+        start = end + rng.randint(1, 300)  # 留出空隙
+    return rows
+
+
+def linear_search(rows, ip):
+    for index, (ip_from, ip_to, _, _, _) in enumerate(rows):
+        if ip_from <= ip <= ip_to:
+            return index
+    return -1
+
+
+def test_search_matches_linear_scan():
+    rows = make_rows(200)
+    ranges = AsnRanges(rows)
+    assert len(ranges) == len(rows)
+    ips = {0, rows[-1][1] + 1, 2 ** 32 - 1}
+    for ip_from, ip_to, _, _, _ in rows:
+        ips.update((ip_from - 1, ip_from, ip_to, ip_to + 1))
+    ips.update(random.Random(1).randint(0, rows[-1][1] + 10) for _ in range(2000))
+    for ip in ips:
+        assert ranges.search(ip) == linear_search(rows, ip), ip
+
+
+def test_search_empty():
+    assert AsnRanges([]).search(1) == -1
@@ -0,0 +1,50 @@
+import struct
+
+import pytest
+
+from common.ipreg import IpRegInfo, IpRegData
+from config import settings
+
+REGIONS = [
+    ('1.0.0.0', '1.0.0.255', 7, '中国|0|福建省|福州市|电信'),
+    ('1.0.1.0', '1.0.3.255', 8, '中国|0|广东省|0|0'),
+    ('8.8.8.0', '8.8.8.255', 9, '美国|0|0|0|谷歌'),
+]
+
+
+def make_db(path):
+    """
+    Write an ip2region db file with the header, data and index blocks
+    """
+    data = bytearray(8)  # 索引起止指针
+    index = bytearray()
+    for sip, eip, city_id, region in REGIONS:
+        record = struct.pack('<I', city_id) + region.encode('utf-8')
+        data_ptr = (len(record) << 24) | len(data)
+        data += record
+        index += struct.pack('<III', IpRegInfo.ip2long(sip),
+                             IpRegInfo.ip2long(eip), data_ptr)
+    start = len(data)
+    struct.pack_into('<II', data, 0, start, start + len(index) - 12)
+    path.write_bytes(bytes(data + index))
+    return path
+
+
+def test_memory_search(tmp_path):
+    searcher = IpRegInfo(make_db(tmp_path.joinpath('ip2region.db')))
+    for sip, eip, city_id, region in REGIONS:
+        for ip in (sip, eip):
+            assert searcher.memory_search(ip) == {'city_id': city_id, 'region': region}
+    assert searcher.memory_search(str(IpRegInfo.ip2long('1.0.2.1')))['city_id'] == 8
+    assert searcher.memory_search(IpRegInfo.ip2long('8.8.8.8'))['city_id'] == 9
+    with pytest.raises(Exception):
+        searcher.memory_search('1.0.4.0')
+
+
+def test_query(tmp_path, monkeypatch):
+    make_db(tmp_path.joinpath('ip2region.db'))
+    monkeypatch.setattr(settings, 'data_storage_dir', tmp_path)
+    ipreg = IpRegData()
+    assert ipreg.query('1.0.0.1') == {'addr': '中国福建省福州市', 'isp': '电信'}
+    assert ipreg.query_many(['1.0.1.1', '8.8.8.8']) == [
+        {'addr': '中国广东省', 'isp': '未知'}, {'addr': '美国', 'isp': '谷歌'}]
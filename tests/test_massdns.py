@@ -0,0 +1,59 @@
+import json
+import tempfile
+
+import brute
+from common import massdns
+
+
+def make_line(name, status='NOERROR', answers=None, resolver='8.8.8.8:53'):
+    items = {'name': name + '.', 'type': 'A', 'class': 'IN', 'status': status,
+             'resolver': resolver}
+    if answers is not None:
+        items['data'] = {'answers': [
+            {'ttl': ttl, 'type': rtype, 'class': 'IN', 'name': owner + '.', 'data': data}
+            for owner, rtype, data, ttl in answers]}
+    return json.dumps(items, separators=(',', ':'))  # 与massdns输出一致的紧凑格式
+
+
+LINES = [
+    make_line('www.example.com', answers=[
+        ('WWW.example.com', 'CNAME', 'cdn.example.net.', 300),
+        ('cdn.example.net', 'A', '1.1.1.1', 60),
+        ('cdn.example.net', 'A', '1.1.1.2', 60)]),
+    make_line('api.example.com', answers=[('api.example.com', 'A', '1.1.1.1', 120)]),
+    make_line('mail.example.com', answers=[]),
+    make_line('nx.example.com', 'NXDOMAIN'),
+    make_line('bad.example.com', 'SERVFAIL', resolver='1.2.3.4:53'),
+    '',
+    '{"name": ',
+]
+
+
+def test_parse_line():
+    assert massdns.parse_line(LINES[0]) == (
+        'www.example.com', 'NOERROR', '8.8.8.8:53',
+        [('cdn.example.net', '1.1.1.1', 60), ('cdn.example.net', '1.1.1.2', 60)])
+    assert massdns.parse_line(LINES[0].encode('utf-8'))[3][0] == \
+        ('cdn.example.net', '1.1.1.1', 60)
+    assert massdns.parse_line(LINES[2]) == ('mail.example.com', 'NOERROR', '8.8.8.8:53', [])
+    assert massdns.parse_line(LINES[3]) == ('nx.example.com', 'NXDOMAIN', '8.8.8.8:53', None)
+
+
+def test_parse():
+    times = dict()
+    results = list(massdns.parse(LINES, times))
+    assert [qname for qname, _, _ in results] == \
+        ['www.example.com', 'api.example.com', 'mail.example.com']
+    assert results[2] == ('mail.example.com', '8.8.8.8:53', [])
+    assert times == {'1.1.1.1': 2, '1.1.1.2': 1,
+                     'cdn.example.net': 1, 'api.example.com': 1}
+    assert len(list(massdns.parse(LINES))) == 3
+
+
+def test_spill_records():
+    answers = [(qname, resolver, records)
+               for qname, resolver, records in massdns.parse(LINES) if records]
+    with tempfile.TemporaryFile('w+') as fd:
+        for answer in answers:
+            brute.spill_records(fd, *answer)
+        assert list(brute.read_records(fd)) == answers
@@ -0,0 +1,65 @@
+import re
+import random
+
+from common.matcher import SubdomainMatcher, get_subdomain_matcher
+
+WORDS = ['<div class="item">', 'lorem', 'https://cdn.example.org/a.js',
+         '"https://WWW.example.com/"', 'api-v2.dev.example.com', "='a.example.com",
+         ',http://b.Example.com', 'example.com.cn', 'x.example.comx', '-example.com',
+         'data-value=1.2.3', '中文.example.com', '']
+
+
+def reference_find(domain, html, distinct=True, fuzzy=True):
+    """
+    Subdomains found by the per-call regexp the matcher replaced
+    """
+    label = r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.){0,}'
+    if fuzzy:
+        result = [s.lower() for s in re.findall(label + re.escape(domain), html, re.I)]
+    else:
+        regexp = r'(?:\>|\"|\'|\=|\,)(?:http\:\/\/|https\:\/\/)?' + label + re.escape(domain)
+        result = [re.sub(r'(?:http://|https://)', '', s[1:].lower())
+                  for s in re.findall(regexp, html, re.I)]
+    if distinct:
+        return set(result)
+    return result
+
+
+def make_body(seed, count=2000):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(WORDS) + rng.choice(' \n/"') for _ in range(count))
+
+
+def test_find_matches_reference():
+    matcher = SubdomainMatcher('example.com')
+    for seed in range(5):
+        body = make_body(seed)
+        for fuzzy in (True, False):
+            for distinct in (True, False):
+                expected = reference_find('example.com', body, distinct, fuzzy)
+                assert matcher.find(body, distinct, fuzzy) == expected
+                assert matcher.find(body.encode('utf-8'), distinct, fuzzy) == expected
+
+
+def test_find():
+    matcher = get_subdomain_matcher('example.com')
+    assert matcher is get_subdomain_matcher('example.com')
+    body = '<a href="https://WWW.example.com/">api.example.com api.example.com'
+    assert matcher.find(body) == {'www.example.com', 'api.example.com'}
+    assert matcher.find(body, distinct=False) == \
+        ['www.example.com', 'api.example.com', 'api.example.com']
+    assert matcher.find(body, fuzzy=False) == {'www.example.com', 'api.example.com'}
+    assert matcher.find('see api.example.com', fuzzy=False) == set()
+    assert matcher.find(b'"http://a.example.com', distinct=False, fuzzy=False) == \
+        ['a.example.com']
+    assert matcher.find('nothing here') == set()
+
+
+def test_iter_chunks():
+    matcher = SubdomainMatcher('example.com')
+    data = make_body(0).encode('utf-8')
+    for fuzzy in (True, False):
+        expected = matcher.find(data, distinct=False, fuzzy=fuzzy)
+        for size in (7, 64, 1000):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            assert list(matcher.iter_chunks(chunks, fuzzy)) == expected
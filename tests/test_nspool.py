@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from common.nspool import ResolverPool, get_resolver
+from config import settings
+from tests.test_massdns import make_line
+
+NAMESERVERS = [('1.1.1.1', 53), ('2.2.2.2', 53), ('3.3.3.3', 53),
+               ('4.4.4.4', 53), ('5.5.5.5', 53), ('6.6.6.6', 53)]
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'resolver_min_success_rate', 0.5)
+    monkeypatch.setattr(settings, 'resolver_max_hijack_rate', 0.2)
+    return ResolverPool(tmp_path.joinpath('resolver_stats.json'))
+
+
+def set_stat(pool, address, rtt=None, **counts):
+    stat = pool.get_stat(address)
+    stat.update(counts)
+    stat['rtt'] = rtt
+
+
+def test_rank(pool):
+    set_stat(pool, '1.1.1.1:53', 30.0, answered=9, error=1)
+    set_stat(pool, '2.2.2.2:53', 10.0, answered=9, timeout=1)
+    set_stat(pool, '3.3.3.3:53', 5.0, answered=7, hijack=3)  # 劫持率过高
+    set_stat(pool, '4.4.4.4:53', 1.0, answered=4, timeout=6)  # 成功率过低
+    set_stat(pool, '5.5.5.5:53', 50.0, answered=10)
+    # 没有统计的名称服务器按成功率1计算 排在有响应时间的之后
+    assert pool.rank(NAMESERVERS) == [('5.5.5.5', 53), ('6.6.6.6', 53),
+                                      ('2.2.2.2', 53), ('1.1.1.1', 53)]
+
+
+def test_record(pool):
+    pool.hijack_ips = {'10.0.0.1': 3}
+    pool.record(make_line('a.example.com', answers=[('a.example.com', 'A', '1.1.1.1', 60)]))
+    pool.record(make_line('b.example.com', answers=[('b.example.com', 'A', '10.0.0.1', 60)]))
+    pool.record(make_line('c.example.com', 'SERVFAIL', resolver='2.2.2.2:53'))
+    pool.record(make_line('d.example.com', 'NXDOMAIN', resolver='2.2.2.2:53'))
+    assert get_resolver(make_line('e.example.com', 'REFUSED')) == ('8.8.8.8:53', 'REFUSED')
+    assert get_resolver('{}') == (None, None)
+    stats = pool.stats
+    assert stats['8.8.8.8:53'] == {'answered': 1, 'timeout': 0, 'error': 0,
+                                   'hijack': 1, 'rtt': None}
+    assert stats['2.2.2.2:53']['error'] == 1 and stats['2.2.2.2:53']['answered'] == 1
+
+
+def test_load_halves_counts(pool):
+    pool.hijack_ips = {'10.0.0.1': 5, '10.0.0.2': 1}
+    set_stat(pool, '1.1.1.1:53', 12.5, answered=9, hijack=1)
+    pool.save()
+    assert json.loads(pool.path.read_text())['hijack_ips'] == pool.hijack_ips
+    loaded = ResolverPool(pool.path)
+    assert loaded.hijack_ips == {'10.0.0.1': 2}
+    assert loaded.stats['1.1.1.1:53'] == {'answered': 4, 'timeout': 0, 'error': 0,
+                                          'hijack': 0, 'rtt': 12.5}
+
+
+def test_load_invalid(pool):
+    pool.path.write_text('not json')
+    assert ResolverPool(pool.path).stats == dict()
@@ -0,0 +1,53 @@
+import itertools
+
+from common.tldextract import _PublicSuffixListTLDExtractor
+from common import domain
+
+TLDS = ['com', 'uk', 'co.uk', 'ck', '*.ck', '!www.ck', 'jp', '*.kawasaki.jp',
+        '!city.kawasaki.jp']
+LABELS = ['www', 'a', 'co', 'uk', 'ck', 'city', 'kawasaki', 'jp', 'com']
+
+
+def reference_suffix_index(tlds, lower_spl):
+    """
+    Suffix index of the linear scan the trie replaced
+    """
+    tlds = frozenset(tlds)
+    length = len(lower_spl)
+    for i in range(length):
+        maybe_tld = '.'.join(lower_spl[i:])
+        exception_tld = '!' + maybe_tld
+        if exception_tld in tlds:
+            return i + 1
+        if maybe_tld in tlds:
+            return i
+        wildcard_tld = '*.' + '.'.join(lower_spl[i + 1:])
+        if wildcard_tld in tlds:
+            return i
+    return length
+
+
+def test_suffix_index_matches_reference():
+    extractor = _PublicSuffixListTLDExtractor(TLDS)
+    for length in range(1, 5):
+        for labels in itertools.product(LABELS, repeat=length):
+            labels = list(labels)
+            assert extractor.suffix_index(labels) == \
+                reference_suffix_index(TLDS, labels), labels
+
+
+def test_wildcard_and_exception():
+    extractor = _PublicSuffixListTLDExtractor(TLDS)
+    assert extractor.suffix_index(['a', 'b', 'ck']) == 1
+    assert extractor.suffix_index(['a', 'www', 'ck']) == 2
+    assert extractor.suffix_index(['a', 'city', 'kawasaki', 'jp']) == 2
+    assert extractor.suffix_index(['a', 'b', 'kawasaki', 'jp']) == 1
+
+
+def test_public_suffix_list():
+    extractor = domain.get_extractor()
+    assert extractor is domain.get_extractor()
+    result = extractor('http://forums.bbc.co.uk/')
+    assert (result.subdomain, result.domain, result.suffix) == ('forums', 'bbc', 'co.uk')
+    assert extractor('www.example.com').registered_domain == 'example.com'
+    assert extractor('127.0.0.1').domain == '127.0.0.1'